@@ -3,6 +3,7 @@ All actions that can be sent from sendAction.
 
 Each action needs to have the following declaration:
 
+@action
 def action_name(data, **kwargs):
     # action
 
@@ -10,26 +11,60 @@ def action_name(data, **kwargs):
 
 `kwargs` will contain the `request` object and the `user` making
 the request.
+
+Actions that only read data should be declared with
+`@action(concurrent=True)`, so they can be run at the same time as each
+other when sent in a batch; see calchart/dispatch.py.
 """
 
+import bisect
+import math
+
+from django.conf import settings
 from django.core.exceptions import PermissionDenied
+from django.http.response import Http404
 from django.shortcuts import get_object_or_404
 from django.utils import timezone
 
-from .models import Show
+from utils import codec
+from utils.codec import RawJSON
+from utils.jsonpatch import make_patch
+
+from .dispatch import ActionError, action
+from .jobs import background_action
+from .models import Job, RevisionConflict, Show, ShowRevision, get_season
+from .showmodel import (
+    ShowModel,
+    Timeline,
+    find_collisions,
+    group_collisions,
+    positions_to_json,
+)
+from .thumbnails import get_thumbnail_urls
 
 """ Home page """
 
 
+@action(concurrent=True)
 def get_tab(data, **kwargs):
-    """Get the shows in the given tab."""
+    """
+    Get the shows in the given tab.
+
+    If `limit` is given (at least 1), returns at most that many shows, along
+    with a `next` cursor to pass as `after` to get the next page (None on the
+    last page).
+
+    Each show has the URL of the thumbnail of each formation, or None if
+    the thumbnails are not rendered yet, in which case they are rendered in
+    the background for the next request.
+    """
     user = kwargs['user']
     tab = data['tab']
 
     if tab == 'band':
         kwargs = {
             'is_band': True,
-            'date_added__year': timezone.now().year,
+            'season': get_season(),
         }
         if not user.has_committee('STUNT'):
             kwargs['published'] = True
@@ -40,15 +75,47 @@ def get_tab(data, **kwargs):
     else:
         raise ValueError(f'Invalid tab: {tab}')
 
+    # keyset pagination, so later pages are as fast as the first
+    shows = shows.order_by('id').values(
+        'id', 'slug', 'name', 'published', 'thumbnails', 'thumbnails_rendered',
+    )
+    if data.get('after') is not None:
+        shows = shows.filter(id__gt=int(data['after']))
+
+    limit = data.get('limit')
+    next_cursor = None
+    if limit is None:
+        shows = list(shows)
+    else:
+        limit = int(limit)
+        if limit < 1:
+            raise ActionError(f'Invalid limit: {limit}')
+        shows = list(shows[:limit + 1])
+        if len(shows) > limit:
+            shows = shows[:limit]
+            next_cursor = shows[-1]['id']
+
+    storage = Show._meta.get_field('data_file').storage
+    for show in shows:
+        if show['thumbnails_rendered'] and show['thumbnails'] is not None:
+            show['thumbnails'] = get_thumbnail_urls(
+                codec.loads(show['thumbnails']), storage,
+            )
+        else:
+            show['thumbnails'] = None
+            Show.request_thumbnails(show['id'])
+
     return {
         'shows': [
             {
-                'slug': show.slug,
-                'name': show.name,
-                'published': show.published,
+                'slug': show['slug'],
+                'name': show['name'],
+                'published': show['published'],
+                'thumbnails': show['thumbnails'],
             }
             for show in shows
         ],
+        'next': next_cursor,
     }
 
 
@@ -68,12 +135,120 @@ def _retrieve_show(slug, user):
         return show
 
 
+@action(concurrent=True)
 def get_show(data, **kwargs):
-    """Get the show with the given slug."""
+    """
+    Get the show with the given slug.
+
+    Returns the serialized show in `show`, sent as saved without decoding
+    and encoding it again, and the `revision` of the show, to be sent back
+    to save_show.
+    """
+    show = _retrieve_show(data['slug'], kwargs['user'])
+    content = show.get_data_json()
+    return RawJSON(b'{"show":%s,"revision":%d}' % (content, show.revision))
+
+
+@action(concurrent=True)
+def get_positions(data, **kwargs):
+    """
+    Get the position of every dot in the show at the given beats.
+
+    `data` contains the slug of the show and either a `beat` or a list of at
+    most POSITIONS_MAX_BEATS `beats`. Returns the IDs of the dots, the
+    number of beats in the show, and for each beat, the [x, y, orientation]
+    of each dot (or None if the dot is not in a formation yet).
+
+    Whole beats are read from the show's DenseTimeline; otherwise, the
+    positions are computed from the show's movements.
+    """
+    show = _retrieve_show(data['slug'], kwargs['user'])
+    beats = data['beats'] if 'beats' in data else [data.get('beat')]
+    if not isinstance(beats, list):
+        raise ActionError('Expected a list of beats')
+    if len(beats) > settings.POSITIONS_MAX_BEATS:
+        raise ActionError(
+            f'At most {settings.POSITIONS_MAX_BEATS} beats can be requested',
+        )
+    for beat in beats:
+        if (
+            not isinstance(beat, (int, float)) or
+            isinstance(beat, bool) or
+            not math.isfinite(beat) or
+            beat < 0
+        ):
+            raise ActionError(f'Invalid beat: {beat}')
+
+    if all(float(beat).is_integer() for beat in beats):
+        timeline = show.get_timeline()
+    else:
+        timeline = Timeline.from_show(ShowModel.from_json(show.get_data()))
+    positions = timeline.get_positions(beats)
+
+    return {
+        'dots': timeline.dot_ids,
+        'numBeats': timeline.num_beats,
+        'positions': positions_to_json(positions),
+    }
+
+
+@action
+@background_action
+def check_collisions(data, **kwargs):
+    """
+    Find the dots that get too close to each other during the show.
+
+    `data` contains the slug of the show and optionally the minimum
+    `distance` (in steps) between dots, which defaults to 1. Returns a list
+    of `collisions`, each with the IDs of the two `dots`, the `start` and
+    `end` beats (inclusive) that they are too close, the ID of the
+    `formation` at the start beat, and the smallest `distance` between them.
+
+    Can be run as a Job with `background`; see jobs.background_action.
+    """
     show = _retrieve_show(data['slug'], kwargs['user'])
-    return show.get_data()
+    try:
+        distance = float(data.get('distance', 1))
+    except (TypeError, ValueError):
+        raise ActionError('The distance must be a number')
+
+    job = kwargs.get('job')
+
+    timeline = show.get_timeline()
+    try:
+        collisions = group_collisions(*find_collisions(
+            timeline.positions,
+            distance,
+            workers=settings.COLLISION_CHECK_WORKERS,
+            progress=None if job is None else job.set_progress,
+        ))
+    except ValueError as e:
+        raise ActionError(str(e))
 
+    # from the data, since the keys of the saved DependencyGraph may be
+    # reordered by the database (e.g. jsonb on PostgreSQL)
+    formations = show.get_data('/formations')[0] or []
+    formation_ids = [formation['id'] for formation in formations]
 
+    dot_ids = timeline.dot_ids
+    formation_beats = timeline.formation_beats
+    result = []
+    for dot, other_dot, start, end, min_distance in collisions:
+        formation = bisect.bisect_right(formation_beats, start) - 1
+        result.append({
+            'dots': [dot_ids[dot], dot_ids[other_dot]],
+            'start': start,
+            'end': end,
+            'formation': formation_ids[min(formation, len(formation_ids) - 1)],
+            'distance': min_distance,
+        })
+
+    return {
+        'collisions': result,
+    }
+
+
+@action
 def create_show(data, **kwargs):
     """Create a show with the given data."""
     user = kwargs['user']
@@ -95,21 +270,171 @@ def create_show(data, **kwargs):
 
     return {
         'slug': show.slug,
+        'revision': show.revision,
     }
 
 
+@action
 def publish_show(data, **kwargs):
     """Publish or unpublish a show."""
     # TODO: check if stunt
-    published = data['publish']
     show = _retrieve_show(data['slug'], kwargs['user'])
+    show.published = data['publish']
+    show.save(update_fields=['published', 'date_modified'])
+
+
+@action
+def publish_shows(data, **kwargs):
+    """Publish or unpublish all the shows with the given slugs."""
+    user = kwargs['user']
+    shows = Show.objects.filter(slug__in=data['slugs'])
+    if not user.has_committee('STUNT') and shows.filter(is_band=True).exists():
+        raise PermissionDenied
 
-    show_data = show.get_data()
-    show_data['published'] = published
-    show.save_data(show_data)
+    updated = shows.update(
+        published=data['publish'],
+        date_modified=timezone.now(),
+    )
+    return {
+        'updated': updated,
+    }
 
 
+@action
 def save_show(data, **kwargs):
-    """Get the show with the given slug."""
+    """
+    Save the show with the given slug.
+
+    `data` is either the entire serialized show, or contains a `patch` key
+    with a JSON Patch to apply to the saved show. The serialized show may
+    also be sent as the `show` file, or as the body of a request with a
+    JSON content type, so that large shows are not decoded as form data.
+
+    If the `revision` from get_show is sent (next to the show file or the
+    patch, or in the serialized show), the show is only saved if it was not
+    saved since then; otherwise, responds with a 409 with the saved
+    `revision`.
+
+    Returns the IDs of the formations and flows that changed, in `dirty`,
+    and the new `revision` of the show.
+    """
     show = _retrieve_show(data['slug'], kwargs['user'])
-    show.save_data(data)
+    upload = _get_show_upload(kwargs.get('request'))
+    revision = data.get('revision')
+    if revision is not None:
+        revision = int(revision)
+
+    try:
+        if 'patch' in data:
+            dirty = show.patch_data(data['patch'], revision)
+        elif upload is not None:
+            dirty = show.save_data(upload, revision)
+        else:
+            # when the entire show is sent as form data, `data` is the show
+            data = {
+                key: value
+                for key, value in data.items()
+                if key != 'revision'
+            }
+            dirty = show.save_data(data, revision)
+    except RevisionConflict as e:
+        raise ActionError(str(e), status=409, revision=e.revision)
+
+    return {
+        'dirty': dirty,
+        'revision': show.revision,
+    }
+
+
+def _get_show_upload(request):
+    """
+    Get the serialized show uploaded in the given request, as a binary file.
+
+    Returns None if the show was sent as form data.
+    """
+    if request is None:
+        return None
+    elif request.content_type == 'application/json':
+        return request
+    else:
+        return request.FILES.get('show')
+
+
+""" Revision actions """
+
+
+@action(concurrent=True)
+def get_revisions(data, **kwargs):
+    """
+    Get the revisions of the show with the given slug, newest first.
+
+    Each revision has its `revision` number and the `date` it was saved.
+    """
+    show = _retrieve_show(data['slug'], kwargs['user'])
+    revisions = show.revisions.order_by('-revision')
+    return {
+        'revisions': [revision.to_json() for revision in revisions],
+    }
+
+
+@action(concurrent=True)
+def diff_revisions(data, **kwargs):
+    """
+    Get the changes between two revisions of the show with the given slug.
+
+    Returns the JSON Patch that changes revision `from` into revision `to`
+    (defaults to the current revision of the show), in `patch`.
+    """
+    show = _retrieve_show(data['slug'], kwargs['user'])
+    source = _get_revision_data(show, data['from'])
+    target = _get_revision_data(show, data.get('to', show.revision))
+    return {
+        'patch': make_patch(source, target),
+    }
+
+
+@action
+def restore_revision(data, **kwargs):
+    """
+    Restore the given `revision` of the show with the given slug.
+
+    The restored show is saved as a new revision, which is returned in
+    `revision`, with the IDs of the formations and flows that changed in
+    `dirty`.
+    """
+    show = _retrieve_show(data['slug'], kwargs['user'])
+    try:
+        dirty = show.restore_revision(data['revision'])
+    except ShowRevision.DoesNotExist as e:
+        raise Http404(str(e))
+    except RevisionConflict as e:
+        raise ActionError(str(e), status=409, revision=e.revision)
+
+    return {
+        'dirty': dirty,
+        'revision': show.revision,
+    }
+
+
+def _get_revision_data(show, revision):
+    """Get the data of the given revision of the show, or raise a 404."""
+    try:
+        return show.get_revision_data(revision)
+    except ShowRevision.DoesNotExist as e:
+        raise Http404(str(e))
+
+
+""" Job actions """
+
+
+@action(concurrent=True)
+def get_job(data, **kwargs):
+    """
+    Get the status of the Job with the given `id`.
+
+    Jobs are returned by actions run with `background`; see
+    jobs.background_action. Once the Job is done, its `result` is the
+    response of the action.
+    """
+    job = get_object_or_404(Job, pk=data['id'], owner=kwargs['user'])
+    return job.to_json()
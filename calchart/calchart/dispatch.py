@@ -0,0 +1,279 @@
+"""
+Running the actions sent from sendAction.
+
+Every action in calchart/actions.py is declared with the `action` decorator.
+Each time an action is run, the following metrics are recorded (see
+utils/metrics.py):
+
+- actions.<name>.seconds: a histogram of the time taken by the action
+- actions.<name>.calls: the number of times the action was run
+- actions.<name>.errors: the number of times the action failed
+- actions.<name>.request_bytes: the size of the data sent to the action
+- actions.<name>.response_bytes: the size of the action's responses
+- actions.<name>.storage.bytes_read: the bytes read from storage
+- actions.<name>.storage.bytes_written: the bytes written to storage
+- actions.<name>.members_only.calls: the calls to the Members Only API
+
+The metrics of each run are also logged as a single line of JSON to the
+`calchart.actions` logger. When the New Relic agent is running, the web
+transaction is named after the action and tagged with the same metrics.
+"""
+
+import functools
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import connection
+from django.http.response import Http404, HttpResponse
+
+from utils import codec, metrics
+from utils.codec import RawJSON
+from utils.http import JsonResponse
+
+try:
+    import newrelic.agent
+except ImportError:  # only installed in production
+    newrelic = None
+
+logger = logging.getLogger('calchart.actions')
+
+# every action, by name
+ACTIONS = {}
+# the names of the actions that can be run concurrently in a batch
+CONCURRENT_ACTIONS = set()
+
+# the counters recorded for each action, from the counters of utils.metrics
+COLLECTED_COUNTERS = [
+    'storage.bytes_read',
+    'storage.bytes_written',
+    'members_only.calls',
+]
+
+
+class ActionError(Exception):
+    """
+    An error raised by an action, responded with the given status code.
+
+    Any other keyword arguments are sent in the response, with the message.
+    """
+
+    def __init__(self, message, *, status=400, **response):
+        """Initialize the error."""
+        super().__init__(message)
+        self.status = status
+        self.response = response
+
+
+def action(func=None, *, concurrent=False):
+    """
+    Declare the given function as an action that can be sent.
+
+    Actions declared with `concurrent=True` only read data, so they can be
+    run at the same time as each other in a batch; see run_batch.
+    """
+    if func is None:
+        return functools.partial(action, concurrent=concurrent)
+
+    ACTIONS[func.__name__] = func
+    if concurrent:
+        CONCURRENT_ACTIONS.add(func.__name__)
+    return func
+
+
+def run_action(name, data, *, user, request):
+    """
+    Run the action with the given name, with the given JSON-encoded data.
+
+    Returns a JsonResponse with the response of the action, or with the
+    `message` of the error it raised.
+    """
+    try:
+        parsed = codec.loads(data)
+    except ValueError as e:
+        parsed = e
+
+    status, content, values = call_action(
+        name, parsed, request_bytes=len(data.encode()), user=user,
+        request=request,
+    )
+
+    if newrelic is not None and values is not None:
+        newrelic.agent.set_transaction_name(name, 'Action')
+        for key, value in values.items():
+            newrelic.agent.add_custom_parameter(key, value)
+
+    return HttpResponse(
+        content, status=status, content_type='application/json',
+    )
+
+
+def run_batch(batch, *, user, request):
+    """
+    Run a batch of actions sent in a single request.
+
+    `batch` is a JSON-encoded list of objects with the name of an `action`
+    and its `data`. Every action is run with the same user, so committees
+    checked by one action are cached for the rest (see User.has_committee).
+
+    Actions are run in order, except that consecutive concurrent actions are
+    run at the same time, on up to ACTION_BATCH_WORKERS threads. Actions are
+    only run concurrently outside of a transaction, since other threads
+    can't see anything saved in the request's transaction.
+
+    Returns a JsonResponse with a list of `results` in the same order as the
+    batch, each with the `status` and the `response` of the action.
+    """
+    try:
+        batch = codec.loads(batch)
+        items = [(item['action'], item.get('data', {})) for item in batch]
+    except (ValueError, TypeError, KeyError) as e:
+        return JsonResponse({
+            'message': f'Invalid batch: {e}',
+        }, status=400)
+
+    def call(item):
+        name, data = item
+        status, content, _ = call_action(
+            name, data, request_bytes=len(codec.dumpb(data)), user=user,
+            request=request,
+        )
+        return b'{"status":%d,"response":%s}' % (status, content)
+
+    # each group is either a single action, or consecutive concurrent actions
+    groups = []
+    for item in items:
+        if (
+            len(groups) > 0 and
+            item[0] in CONCURRENT_ACTIONS and
+            groups[-1][0][0] in CONCURRENT_ACTIONS
+        ):
+            groups[-1].append(item)
+        else:
+            groups.append([item])
+
+    workers = settings.ACTION_BATCH_WORKERS
+    if connection.in_atomic_block or len(groups) == len(items):
+        workers = 1
+
+    results = []
+    if workers > 1:
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            for group in groups:
+                if len(group) > 1:
+                    results.extend(executor.map(_run_in_thread(call), group))
+                else:
+                    results.append(call(group[0]))
+    else:
+        results = [call(item) for item in items]
+
+    if newrelic is not None:
+        newrelic.agent.set_transaction_name('batch', 'Action')
+
+    return HttpResponse(
+        b'{"results":[%s]}' % b','.join(results),
+        content_type='application/json',
+    )
+
+
+def call_action(name, data, *, request_bytes, user, request):
+    """
+    Call the action with the given name with the given decoded data.
+
+    If decoding the data raised an error, `data` is the error instead. The
+    metrics of the action are recorded, unless the action does not exist.
+
+    Returns a tuple of the status code, the JSON-encoded response (bytes)
+    and the recorded metrics (None if the action does not exist).
+    """
+    func = ACTIONS.get(name)
+    if func is None:
+        content = _encode({
+            'message': f'Action does not exist: {name}',
+        })
+        return 500, content, None
+
+    start = time.perf_counter()
+    with metrics.collect() as counters:
+        try:
+            if isinstance(data, Exception):
+                raise data
+            response = func(data=data, user=user, request=request)
+            content = _encode({} if response is None else response)
+        except ActionError as e:
+            status = e.status
+            content = _encode({
+                'message': str(e),
+                **e.response,
+            })
+        except Exception as e:
+            status = 404 if isinstance(e, Http404) else 500
+            content = _encode({
+                'message': str(e),
+            })
+        else:
+            status = 200
+
+    values = record_action(
+        name,
+        seconds=time.perf_counter() - start,
+        status=status,
+        request_bytes=request_bytes,
+        response_bytes=len(content),
+        counters=counters,
+    )
+
+    return status, content, values
+
+
+def record_action(
+    name, *, seconds, status, request_bytes, response_bytes, counters,
+):
+    """
+    Record the metrics of a run of the given action, and log them.
+
+    Returns the values that were logged.
+    """
+    prefix = f'actions.{name}'
+    metrics.observe(f'{prefix}.seconds', seconds)
+    metrics.increment(f'{prefix}.calls')
+    metrics.increment(f'{prefix}.errors', int(status >= 400))
+    metrics.increment(f'{prefix}.request_bytes', request_bytes)
+    metrics.increment(f'{prefix}.response_bytes', response_bytes)
+    for counter in COLLECTED_COUNTERS:
+        metrics.increment(f'{prefix}.{counter}', counters[counter])
+
+    values = {
+        'status': status,
+        'seconds': round(seconds, 6),
+        'request_bytes': request_bytes,
+        'response_bytes': response_bytes,
+        **{counter: counters[counter] for counter in COLLECTED_COUNTERS},
+    }
+    logger.info(codec.dumps({
+        'event': 'action',
+        'action': name,
+        **values,
+    }))
+
+    return values
+
+
+def _run_in_thread(func):
+    """Wrap the given function, to be run in a thread of a batch."""
+    def wrapper(*args):
+        try:
+            return func(*args)
+        finally:
+            # each thread has its own database connection
+            connection.close()
+
+    return wrapper
+
+
+def _encode(response):
+    """Encode the given response of an action, unless already encoded."""
+    if isinstance(response, RawJSON):
+        return response
+    return codec.dumpb(response)
@@ -0,0 +1,178 @@
+"""
+Running actions in a worker process instead of in the request.
+
+An action decorated with background_action returns a Job handle when it is
+sent with `background: true`. The Job is saved in the database (the queue),
+run by the `run_jobs` management command, and polled with the get_job
+action. While running, the action gets the Job in `kwargs['job']`, to report
+its progress with Job.set_progress.
+"""
+
+import functools
+import logging
+import threading
+from datetime import timedelta
+
+from django.conf import settings
+from django.db import connection, models
+from django.db.models import Q
+from django.utils import timezone
+
+from utils import codec
+
+from .models import Job
+
+logger = logging.getLogger(__name__)
+
+# the actions that can be run as Jobs, by name
+BACKGROUND_ACTIONS = {}
+
+
+def background_action(action):
+    """
+    Decorate an action that can be run as a Job.
+
+    If `background` is true in the action's data, the action is queued and
+    returns the ID of the Job in `job` instead of running.
+    """
+    BACKGROUND_ACTIONS[action.__name__] = action
+
+    @functools.wraps(action)
+    def wrapper(data, **kwargs):
+        if not data.get('background'):
+            return action(data, **kwargs)
+
+        data = {
+            key: value for key, value in data.items() if key != 'background'
+        }
+        job = Job.objects.create(
+            action=action.__name__,
+            data=codec.dumps(data),
+            owner=kwargs['user'],
+        )
+        return {
+            'job': job.pk,
+        }
+
+    return wrapper
+
+
+def claim_job():
+    """
+    Claim the oldest queued Job, marking it as running.
+
+    Several workers can claim Jobs at the same time: a Job is only claimed
+    if it is still queued when it is marked as running. Running Jobs without
+    a heartbeat for JOB_TIMEOUT seconds are queued again first (see
+    requeue_stale_jobs). Returns None if no Jobs are queued.
+    """
+    requeue_stale_jobs()
+    while True:
+        job_id = (
+            Job.objects
+            .filter(status=Job.QUEUED)
+            .order_by('id')
+            .values_list('id', flat=True)
+            .first()
+        )
+        if job_id is None:
+            return None
+
+        now = timezone.now()
+        claimed = (
+            Job.objects
+            .filter(pk=job_id, status=Job.QUEUED)
+            .update(
+                status=Job.RUNNING,
+                date_started=now,
+                date_heartbeat=now,
+                attempts=models.F('attempts') + 1,
+            )
+        )
+        if claimed:
+            return Job.objects.select_related('owner').get(pk=job_id)
+
+
+def requeue_stale_jobs():
+    """
+    Queue the running Jobs whose worker stopped saving heartbeats again.
+
+    A Job that was already claimed JOB_MAX_ATTEMPTS times fails instead.
+    Returns the number of Jobs queued again.
+    """
+    timeout = timezone.now() - timedelta(seconds=settings.JOB_TIMEOUT)
+    stale = Job.objects.filter(
+        # Jobs claimed before heartbeats were saved only have date_started
+        Q(date_heartbeat__lt=timeout) |
+        Q(date_heartbeat=None, date_started__lt=timeout),
+        status=Job.RUNNING,
+    )
+    failed = stale.filter(attempts__gte=settings.JOB_MAX_ATTEMPTS).update(
+        status=Job.FAILED,
+        error='The Job timed out',
+        date_finished=timezone.now(),
+    )
+    if failed:
+        logger.error(f'{failed} Jobs timed out')
+
+    requeued = stale.update(status=Job.QUEUED)
+    if requeued:
+        logger.warning(f'{requeued} Jobs timed out; queued again')
+    return requeued
+
+
+def run_job(job):
+    """
+    Run the given claimed Job, saving its result or error.
+
+    A heartbeat is saved every JOB_HEARTBEAT_INTERVAL seconds while the Job
+    runs. The result is not saved if the Job was queued again in the
+    meantime (see requeue_stale_jobs).
+    """
+    stop = threading.Event()
+    heartbeat = threading.Thread(target=_save_heartbeats, args=(job, stop))
+    heartbeat.start()
+    try:
+        action = BACKGROUND_ACTIONS[job.action]
+        result = action(codec.loads(job.data), user=job.owner, job=job)
+    except Exception as e:
+        logger.exception(f'Job {job.pk} failed: {job.action}')
+        job.status = Job.FAILED
+        job.error = str(e) or type(e).__name__
+    else:
+        job.status = Job.DONE
+        job.progress = 1
+        job.result = codec.dumps(result)
+    finally:
+        stop.set()
+        heartbeat.join()
+
+    job.date_finished = timezone.now()
+    Job.objects.filter(
+        pk=job.pk, status=Job.RUNNING, attempts=job.attempts,
+    ).update(
+        status=job.status,
+        progress=job.progress,
+        result=job.result,
+        error=job.error,
+        date_finished=job.date_finished,
+    )
+
+
+def _save_heartbeats(job, stop):
+    """Save the heartbeat of the given Job until `stop` is set."""
+    try:
+        while not stop.wait(settings.JOB_HEARTBEAT_INTERVAL):
+            Job.objects.filter(
+                pk=job.pk, status=Job.RUNNING, attempts=job.attempts,
+            ).update(date_heartbeat=timezone.now())
+    finally:
+        connection.close()
+
+
+def run_next_job():
+    """Claim and run the oldest queued Job; returns None if there are none."""
+    job = claim_job()
+    if job is not None:
+        run_job(job)
+    return job
@@ -0,0 +1,101 @@
+"""A command to rewrite the data file of every Show with a compression."""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from calchart.models import Show, ShowRevision, is_data_file_in_use
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+
+from utils.storage import (
+    get_blob_compression,
+    get_compression,
+    read_blob,
+    write_blob,
+)
+
+# the values of the --compression argument
+COMPRESSIONS = {
+    'none': None,
+    'gzip': 'gzip',
+    'zstd': 'zstd',
+}
+
+
+class Command(BaseCommand):
+    """
+    Rewrite the data files that are not saved with the given compression.
+
+    Data files are shared by every Show and ShowRevision with the same data,
+    so each file is converted once, on SHOW_MIGRATION_WORKERS threads. Files
+    that already have the compression are skipped without being downloaded,
+    so an interrupted conversion resumes where it left off. Like the files
+    written by Show.save_data, the final byte of each file is compressed on
+    its own (see Show.open_data_gzip). The content hash of a file does not
+    depend on its compression, so the DenseTimelines of the Shows are still
+    used.
+    """
+
+    help = 'Compress the data file of every Show.'  # noqa: A003
+
+    def add_arguments(self, parser):
+        """Add the command's arguments."""
+        parser.add_argument(
+            '--compression',
+            choices=sorted(COMPRESSIONS),
+            help='The compression to use; defaults to SHOW_DATA_COMPRESSION.',
+        )
+
+    def handle(self, *args, compression=None, **options):
+        """Run the command."""
+        if compression is None:
+            compression = settings.SHOW_DATA_COMPRESSION
+        else:
+            compression = COMPRESSIONS[compression]
+        compression = get_compression(compression)
+
+        storage = Show._meta.get_field('data_file').storage
+        names = sorted({
+            name
+            for model in [Show, ShowRevision]
+            for name in (
+                model.objects
+                .exclude(data_file='')
+                .values_list('data_file', flat=True)
+                .distinct()
+            )
+            if get_blob_compression(name) != compression
+        })
+
+        def convert(name):
+            content = read_blob(name, storage)
+            directory, filename = name.rsplit('/', 1)
+            ext = '.' + filename.split('.')[1]
+            _, new_name = write_blob(
+                directory, content, ext,
+                storage=storage,
+                compression=compression,
+                tail=1,
+            )
+            return name, new_name, storage.size(name), storage.size(new_name)
+
+        start = time.perf_counter()
+        old_size = new_size = 0
+        with ThreadPoolExecutor(settings.SHOW_MIGRATION_WORKERS) as executor:
+            for name, new_name, size, compressed_size in executor.map(
+                convert, names,
+            ):
+                for model in [Show, ShowRevision]:
+                    model.objects.filter(data_file=name).update(
+                        data_file=new_name,
+                    )
+                if not is_data_file_in_use(name):
+                    storage.delete(name)
+                old_size += size
+                new_size += compressed_size
+
+        self.stdout.write(
+            f'Converted {len(names)} data files from {old_size} bytes to '
+            f'{new_size} bytes in {time.perf_counter() - start:.2f}s',
+        )
@@ -0,0 +1,61 @@
+"""A command to update the data of every Show to the latest version."""
+
+from django.core.management.base import BaseCommand
+from django.db import connection
+from django.db.migrations.executor import MigrationExecutor
+
+from utils.db import get_plan_updates, migrate_shows
+
+
+class Command(BaseCommand):
+    """
+    Apply the pending UpdateShowVersion operations in a single pass.
+
+    Each Show is loaded and saved once, no matter how many versions it is
+    behind. The migrations themselves still need to be applied with the
+    `migrate` command, which then skips the Shows that are up to date.
+    """
+
+    help = 'Update the data of every Show to the latest version.'  # noqa: A003
+
+    def add_arguments(self, parser):
+        """Add the command's arguments."""
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Report the Shows that would be updated without saving them.',
+        )
+
+    def handle(self, *args, dry_run=False, **options):
+        """Run the command."""
+        executor = MigrationExecutor(connection)
+        targets = executor.loader.graph.leaf_nodes()
+        updates = get_plan_updates(executor.migration_plan(targets))
+        if len(updates) == 0:
+            self.stdout.write('No Show versions to apply.')
+            return
+
+        # use the models as of the migrations already applied
+        loader = executor.loader
+        applied = [
+            key for key in loader.applied_migrations
+            if key in loader.graph.nodes
+        ]
+        state = loader.project_state(applied)
+        Show = state.apps.get_model('calchart', 'Show')
+        stats = migrate_shows(Show, updates, dry_run=dry_run)
+
+        for show in stats.get('shows', []):
+            self.stdout.write(
+                'Show {id}: version {from_version} -> {version}, '
+                '{size} bytes in {seconds:.3f}s'.format(**show),
+            )
+
+        self.stdout.write(
+            '{verb} {updated} Shows ({skipped} skipped, {changed} changed) '
+            'in {seconds:.2f}s'
+            .format(
+                verb='Would update' if dry_run else 'Updated',
+                **stats,
+            ),
+        )
@@ -0,0 +1,47 @@
+"""A command to run the Jobs queued by background actions."""
+
+import time
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.db import close_old_connections
+
+# registers the background actions
+from calchart import actions  # noqa: F401
+from calchart.jobs import run_next_job
+
+
+class Command(BaseCommand):
+    """
+    Run queued Jobs, one at a time, until stopped.
+
+    Any number of workers can run at the same time; see jobs.claim_job.
+    """
+
+    help = 'Run the Jobs queued by background actions.'  # noqa: A003
+
+    def add_arguments(self, parser):
+        """Add the command's arguments."""
+        parser.add_argument(
+            '--once',
+            action='store_true',
+            help='Stop when no Jobs are queued, instead of waiting for more.',
+        )
+        parser.add_argument(
+            '--poll',
+            type=float,
+            default=settings.JOB_POLL_INTERVAL,
+            help='The number of seconds to wait between checking for Jobs.',
+        )
+
+    def handle(self, *args, once=False, poll=None, **options):
+        """Run the command."""
+        while True:
+            close_old_connections()
+            job = run_next_job()
+            if job is not None:
+                self.stdout.write(str(job))
+            elif once:
+                return
+            else:
+                time.sleep(poll)
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 02:59
+from __future__ import unicode_literals
+
+import json
+
+from django.conf import settings
+from django.db import migrations
+import utils.db
+from utils.jsonpatch import apply_patch
+from utils.storage import read_blob
+
+
+def backfill_data(apps, schema_editor):
+    """Copy the data files into the data column, if storing in the database."""
+    if settings.SHOW_DATA_STORAGE != 'database':
+        return
+
+    Show = apps.get_model('calchart', 'Show')
+    for show in Show.objects.exclude(data_file='').iterator():
+        data = json.loads(read_blob(show.data_file.name))
+        for show_patch in show.patches.order_by('id'):
+            data = apply_patch(data, json.loads(show_patch.patch))
+
+        show.data = json.dumps(data)
+        show.save(update_fields=['data'])
+        show.patches.all().delete()
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calchart', '0002_show_patches'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='show',
+            name='data',
+            field=utils.db.JSONTextField(null=True),
+        ),
+        migrations.RunPython(backfill_data, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,43 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 04:12
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+def backfill_season(apps, schema_editor):
+    """Set the season of every Show from the year it was added."""
+    Show = apps.get_model('calchart', 'Show')
+    for date in Show.objects.datetimes('date_added', 'year'):
+        Show.objects.filter(date_added__year=date.year).update(
+            season=date.year,
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calchart', '0005_show_version'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='show',
+            name='season',
+            field=models.PositiveSmallIntegerField(editable=False, null=True),
+        ),
+        migrations.RunPython(backfill_season, migrations.RunPython.noop),
+        migrations.AlterField(
+            model_name='show',
+            name='season',
+            field=models.PositiveSmallIntegerField(editable=False),
+        ),
+        migrations.AddIndex(
+            model_name='show',
+            index=models.Index(fields=['is_band', 'season', 'published', 'id'], name='calchart_show_band_idx'),
+        ),
+        migrations.AddIndex(
+            model_name='show',
+            index=models.Index(fields=['owner', 'is_band', 'id'], name='calchart_show_owner_idx'),
+        ),
+    ]
@@ -0,0 +1,21 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 03:20
+from __future__ import unicode_literals
+
+from django.db import migrations
+import utils.db
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calchart', '0006_show_season'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='show',
+            name='dependency_graph',
+            field=utils.db.JSONTextField(null=True),
+        ),
+    ]
@@ -0,0 +1,26 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 03:34
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import utils.db
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calchart', '0007_show_dependency_graph'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='show',
+            name='thumbnails',
+            field=utils.db.JSONTextField(null=True),
+        ),
+        migrations.AddField(
+            model_name='show',
+            name='thumbnails_rendered',
+            field=models.BooleanField(default=False),
+        ),
+    ]
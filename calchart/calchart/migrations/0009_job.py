@@ -0,0 +1,38 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 03:37
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+import utils.db
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calchart', '0008_show_thumbnails'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='Job',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('action', models.CharField(max_length=255)),
+                ('data', utils.db.JSONTextField()),
+                ('status', models.CharField(choices=[('queued', 'Queued'), ('running', 'Running'), ('done', 'Done'), ('failed', 'Failed')], default='queued', max_length=10)),
+                ('progress', models.FloatField(default=0)),
+                ('result', utils.db.JSONTextField(null=True)),
+                ('error', models.TextField(blank=True)),
+                ('date_added', models.DateTimeField(auto_now_add=True)),
+                ('date_started', models.DateTimeField(null=True)),
+                ('date_finished', models.DateTimeField(null=True)),
+                ('owner', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to=settings.AUTH_USER_MODEL)),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name='job',
+            index=models.Index(fields=['status', 'id'], name='calchart_job_status_idx'),
+        ),
+    ]
@@ -0,0 +1,20 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 03:57
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calchart', '0009_job'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='show',
+            name='revision',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
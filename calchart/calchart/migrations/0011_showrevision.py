@@ -0,0 +1,31 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 04:02
+from __future__ import unicode_literals
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('calchart', '0010_show_revision'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShowRevision',
+            fields=[
+                ('id', models.AutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('revision', models.PositiveIntegerField()),
+                ('data_file', models.FileField(blank=True, upload_to='shows')),
+                ('patch', models.TextField(blank=True)),
+                ('date_added', models.DateTimeField(auto_now_add=True)),
+                ('show', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='revisions', to='calchart.Show')),
+            ],
+        ),
+        migrations.AlterUniqueTogether(
+            name='showrevision',
+            unique_together=set([('show', 'revision')]),
+        ),
+    ]
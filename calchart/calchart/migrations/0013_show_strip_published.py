@@ -0,0 +1,80 @@
+# -*- coding: utf-8 -*-
+# Generated by Django 1.11.29 on 2026-10-17 05:12
+from __future__ import unicode_literals
+
+from django.conf import settings
+from django.db import migrations
+
+from utils import codec
+from utils.db import data_file_in_use
+from utils.storage import get_compression, get_hash, read_blob, write_blob
+
+
+def strip_published(apps, schema_editor):
+    """
+    Remove `published` from the saved data of every Show.
+
+    Whether a Show is published is only saved in the model; the data is
+    exported with `published` appended, so it must not contain it already
+    (e.g. data files saved before, or data backfilled by 0003). A Show
+    saved while it is being updated is left as is, since the save already
+    removed `published`.
+    """
+    Show = apps.get_model('calchart', 'Show')
+    storage = Show._meta.get_field('data_file').storage
+    compression = get_compression(settings.SHOW_DATA_COMPRESSION)
+
+    shows = (
+        Show.objects
+        .exclude(data_file='', data=None)
+        .only('id', 'data', 'data_file', 'data_hash', 'revision')
+        .order_by('id')
+    )
+    for show in shows.iterator():
+        unchanged = Show.objects.filter(
+            pk=show.pk, revision=show.revision, data_hash=show.data_hash,
+        )
+
+        if show.data is not None:
+            data = codec.loads(show.data)
+            if 'published' in data:
+                del data['published']
+                content = codec.dumpb(data)
+                unchanged.update(
+                    data=content.decode(), data_hash=get_hash(content),
+                )
+            continue
+
+        old_name = show.data_file.name
+        data = codec.loads(read_blob(old_name, storage))
+        if 'published' not in data:
+            continue
+
+        del data['published']
+        data_hash, name = write_blob(
+            'shows', codec.dumpb(data), '.show',
+            storage=storage,
+            compression=compression,
+            tail=1,
+        )
+        # delete the old data file, or the new one if the Show was saved
+        unused = (
+            old_name if unchanged.update(data_file=name, data_hash=data_hash)
+            else name
+        )
+        if name != old_name and not data_file_in_use(Show, unused):
+            storage.delete(unused)
+
+
+class Migration(migrations.Migration):
+
+    # save each Show as it's updated, so an interrupted migration resumes
+    atomic = False
+
+    dependencies = [
+        ('calchart', '0012_job_heartbeat'),
+    ]
+
+    operations = [
+        migrations.RunPython(strip_published, migrations.RunPython.noop),
+    ]
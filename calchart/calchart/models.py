@@ -1,15 +1,60 @@
 """Models for the base app."""
 
-import json
+import hashlib
+import io
+import threading
 from datetime import timedelta
 
+from django.conf import settings
 from django.contrib.auth import models as auth_models
+from django.core.cache import cache
 from django.core.files.base import ContentFile
-from django.db import models
+from django.db import connection, models, transaction
+from django.db.models.signals import pre_delete
+from django.dispatch import receiver
 from django.utils import timezone
 from django.utils.text import slugify
 
-from utils.api import call_endpoint
+from utils import codec, metrics
+from utils.api import fetch_committees
+from utils.background import run_in_background, submit_in_background
+from utils.db import JSONTextField
+from utils.jsonpatch import (
+    JsonPatchError,
+    apply_patch,
+    make_patch,
+    parse_pointer,
+    resolve_pointer,
+)
+from utils.storage import (
+    ChainedFile,
+    compress,
+    get_blob_compression,
+    get_compression,
+    get_hash,
+    is_compressed,
+    open_gzip_head,
+    read_blob,
+    write_blob,
+)
+
+from .showmodel import DenseTimeline, DependencyGraph
+from .thumbnails import (
+    get_field_type,
+    get_thumbnail_keys,
+    get_thumbnail_name,
+    get_thumbnail_urls,
+    render_thumbnail,
+)
+
+# the IDs of the Shows waiting for Show.render_thumbnails
+_thumbnail_requests = set()
+_thumbnail_requests_lock = threading.Lock()
+
+# the IDs of the Shows waiting for Show.update_timeline, mapped to the
+# content key of the last DenseTimeline built for each Show
+_timeline_requests = {}
+_timeline_requests_lock = threading.Lock()
 
 
 class User(auth_models.AbstractUser):
@@ -45,20 +90,122 @@ class User(auth_models.AbstractUser):
         """
         Check if this user is part of the given committee.
 
-        See the Members Only API endpoint.
+        Answered from the committees fetched by get_committees, so checking
+        several committees in a request costs at most one call to Members
+        Only.
         """
         if self.is_superuser:
             return True
 
-        response = call_endpoint('check-committee', self, committee=committee)
-        return response['has_committee']
+        _, cached = self._get_committee_cache()
+        if cached['complete'] or committee in cached['committees']:
+            metrics.increment('committee_cache.hits')
+            return cached['committees'].get(committee, False)
+
+        return committee in self.get_committees(committee)
+
+    def get_committees(self, *extra):
+        """
+        Get the set of committees this user is part of.
+
+        See utils.api.fetch_committees; `extra` are committees to check in
+        addition to MEMBERS_ONLY_COMMITTEES if the batch endpoint is not
+        available. Results are cached on this User instance for the rest of
+        the request, and in Django's cache for MEMBERS_ONLY_CACHE_TTL seconds,
+        keyed by the user's API token.
+        """
+        if self.is_superuser:
+            return set(settings.MEMBERS_ONLY_COMMITTEES) | set(extra)
+
+        key, cached = self._get_committee_cache()
+        committees = set(settings.MEMBERS_ONLY_COMMITTEES) | set(extra)
+        if cached['complete'] or committees <= cached['committees'].keys():
+            metrics.increment('committee_cache.hits')
+        else:
+            metrics.increment('committee_cache.misses')
+            fetched, complete = fetch_committees(self, sorted(committees))
+            cached['committees'].update(fetched)
+            cached['complete'] = complete
+
+            if settings.MEMBERS_ONLY_CACHE_TTL > 0:
+                cache.set(key, cached, settings.MEMBERS_ONLY_CACHE_TTL)
+
+        return {
+            committee
+            for committee, has_committee in cached['committees'].items()
+            if has_committee
+        }
+
+    def clear_committee_cache(self):
+        """Clear any cached committee memberships for the current API token."""
+        cache.delete(self._get_committee_cache_key())
+        self._committee_cache = None
+
+    def _get_committee_cache_key(self):
+        """Get the key in Django's cache for this user's committees."""
+        token = hashlib.sha1(self.api_token.encode()).hexdigest()
+        return f'committees:{self.pk}:{token}'
+
+    def _get_committee_cache(self):
+        """
+        Get the cache key and the committees cached for this user.
+
+        The committees are loaded from Django's cache once per User instance
+        (i.e. once per request) and reloaded if the API token changes.
+        """
+        key = self._get_committee_cache_key()
+        cached = getattr(self, '_committee_cache', None)
+        if cached is None or cached[0] != key:
+            committees = cache.get(key, {
+                'committees': {},
+                'complete': False,
+            })
+            cached = (key, committees)
+            self._committee_cache = cached
+
+        return cached
+
+
+def get_season(date=None):
+    """Get the season (year, in the local time zone) of the given date."""
+    return timezone.localtime(date or timezone.now()).year
+
+
+class RevisionConflict(Exception):
+    """
+    An error raised when saving a Show that was saved since it was loaded.
+
+    `revision` is the revision of the saved Show.
+    """
+
+    def __init__(self, revision):
+        """Initialize the error with the revision of the saved Show."""
+        super().__init__(
+            'The show was saved somewhere else. Reload the show to get the '
+            'latest version.',
+        )
+        self.revision = revision
+
+
+class ShowManager(models.Manager):
+    """
+    The manager for Shows.
+
+    The `data` column is not loaded unless accessed, so that querying Shows
+    for their metadata does not load the entire Show.
+    """
+
+    def get_queryset(self):
+        """Get the QuerySet for all Shows."""
+        return super().get_queryset().defer('data')
 
 
 class Show(models.Model):
     """
     The model containing all of the data and metadata for a Calchart Show.
 
-    The data is saved as a JSON file along with media files.
+    The data is saved as a JSON file along with media files, or in the
+    `data` column if SHOW_DATA_STORAGE is 'database'.
     """
 
     name = models.CharField(max_length=255, unique=True)
@@ -66,41 +213,833 @@ class Show(models.Model):
     owner = models.ForeignKey(User)
     published = models.BooleanField(default=False)
     date_added = models.DateTimeField(auto_now_add=True)
+    date_modified = models.DateTimeField(auto_now=True)
     is_band = models.BooleanField(default=False)
 
-    # the json file that contains the serialized Javascript Show
+    # the year the Show was added, for listing Shows by season without
+    # computing the year of date_added for every row
+    season = models.PositiveSmallIntegerField(editable=False)
+
+    # the json file that contains the serialized Javascript Show, named by
+    # the hash of its contents and compressed with SHOW_DATA_COMPRESSION
+    # (see utils.storage)
     data_file = models.FileField(upload_to='shows')
+    data_hash = models.CharField(max_length=64, blank=True)
+
+    # the version of the saved data; see utils.db.UpdateShowVersion
+    version = models.PositiveIntegerField(null=True)
+
+    # the number of times the data was changed; saving checks that the data
+    # was not changed since it was loaded (see save_data)
+    revision = models.PositiveIntegerField(default=0)
+
+    # the serialized Javascript Show, if SHOW_DATA_STORAGE is 'database'
+    data = JSONTextField(null=True)
+
+    # the keys of the Formations and Flows in the data, to find the ones
+    # that change when the data is saved; see showmodel.DependencyGraph
+    dependency_graph = JSONTextField(null=True)
+
+    # the keys of the thumbnail of each Formation in the data (see
+    # thumbnails.py), and whether they have all been rendered
+    thumbnails = JSONTextField(null=True)
+    thumbnails_rendered = models.BooleanField(default=False)
+
+    objects = ShowManager()
+
+    class Meta:
+        """The metadata for Shows."""
+
+        indexes = [
+            # for the band tab in actions.get_tab
+            models.Index(
+                fields=['is_band', 'season', 'published', 'id'],
+                name='calchart_show_band_idx',
+            ),
+            # for the owned tab in actions.get_tab
+            models.Index(
+                fields=['owner', 'is_band', 'id'],
+                name='calchart_show_owner_idx',
+            ),
+        ]
 
     def __str__(self):
         """Get the string representation of a Show."""
         return self.name
 
-    def get_data(self):
-        """Get the Show as a JSON object."""
-        return json.loads(self.data_file.read())
+    def get_data(self, *pointers):
+        """
+        Get the Show as a JSON object, with any patches applied.
+
+        If any JSON Pointers are given (e.g. '/dots' or '/formations/0'),
+        returns a list of the values at each pointer instead, or None for
+        any pointer that does not exist. If the Show is stored in the
+        database, only those values are loaded.
+
+        Whether the Show is published is always taken from the model, not
+        the saved data.
+        """
+        paths = pointers or ['']
+
+        values = None
+        if self._uses_data_column():
+            values = self._select_data(paths)
+
+        if values is None:
+            data = self._get_data(self.patches.order_by('id'))
+            values = [_resolve_pointer(data, path) for path in paths]
+
+        values = [
+            self._merge_published(path, value)
+            for path, value in zip(paths, values)
+        ]
+        return values if pointers else values[0]
+
+    def get_data_json(self):
+        """Get the Show as JSON bytes, without parsing it if possible."""
+        data = None
+        if self._uses_data_column():
+            data = Show.objects.values_list('data', flat=True).get(pk=self.pk)
+
+        if data is None:
+            if self.patches.exists():
+                return codec.dumpb(self.get_data())
+            data = self._with_data_file(read_blob)
+        else:
+            data = data.encode()
+
+        return data[:-1] + self._get_published_suffix(data == b'{}')
+
+    def open_data_json(self):
+        """
+        Open the Show as a binary file with the contents of get_data_json.
+
+        The data file is read from storage as the returned file is read,
+        if possible (i.e. if it is not compressed). The size of the file is
+        in its `size` attribute.
+        """
+        if not self._uses_data_column() and not self.patches.exists():
+            storage = self.data_file.storage
+            f = self._with_data_file(storage.open)
+            if not is_compressed(f.read(4)):
+                f.seek(0)
+                # the data file is saved without surrounding whitespace
+                size = storage.size(self.data_file.name)
+                suffix = self._get_published_suffix(size == 2)
+                return ChainedFile([
+                    (f, size - 1),
+                    (io.BytesIO(suffix), len(suffix)),
+                ])
+            f.close()
+
+        content = self.get_data_json()
+        return ChainedFile([(io.BytesIO(content), len(content))])
+
+    def open_data_gzip(self):
+        """
+        Open the Show as a binary file with get_data_json compressed by gzip.
+
+        The compressed data file is streamed from storage as is, with the
+        gzip member of its final `}` (see save_data) replaced with a member
+        with `published`. Returns None if the data file is not compressed
+        that way, or if the Show has patches.
+        """
+        if (
+            self._uses_data_column() or
+            get_blob_compression(self.data_file.name) != 'gzip' or
+            self.patches.exists()
+        ):
+            return None
+
+        storage = self.data_file.storage
+        f = self._with_data_file(
+            lambda name: open_gzip_head(name, b'}', storage),
+        )
+        if f is None:
+            return None
+
+        # the data file has the Show's metadata, so it is never `{}`
+        suffix = compress(self._get_published_suffix(), 'gzip')
+        return ChainedFile([(f, f.size), (io.BytesIO(suffix), len(suffix))])
+
+    def get_data_etag(self):
+        """Get a string that changes whenever get_data_json changes."""
+        return f'{self._get_content_key()}-{int(self.published)}'
+
+    def get_timeline(self):
+        """
+        Get the DenseTimeline of the Show data.
+
+        The DenseTimeline is saved next to the data file, named by the hash
+        of the data, and is built if it has not been saved yet (e.g. if the
+        Show is still waiting for request_timeline).
+        """
+        storage = self.data_file.storage
+        name = self._get_timeline_name(self._get_content_key())
+        timeline = DenseTimeline.load(name, storage)
+        if timeline is None:
+            with _timeline_requests_lock:
+                previous_key = _timeline_requests.get(self.pk)
+            timeline = self.update_timeline(previous_key)
+        return timeline
+
+    @classmethod
+    def request_timeline(cls, show_id, previous_key):
+        """
+        Update the DenseTimeline of the given Show in the background.
+
+        `show_id` is the ID of the Show, and `previous_key` is the content key
+        of its data before it was saved. The request is sent when the current
+        transaction commits. A Show saved again while it is waiting is only
+        updated once, from the earliest key.
+        """
+        def update():
+            with _timeline_requests_lock:
+                previous_key = _timeline_requests.pop(show_id)
+            show = cls.objects.filter(pk=show_id).first()
+            if show is not None:
+                show.update_timeline(previous_key)
+
+        def request():
+            with _timeline_requests_lock:
+                if show_id in _timeline_requests:
+                    return
+                _timeline_requests[show_id] = previous_key
+            submit_in_background(update)
+
+        transaction.on_commit(request)
+
+    def update_timeline(self, previous_key=None):
+        """
+        Build and save the DenseTimeline of the Show data.
+
+        Nothing is built if it is already saved. If the content key (see
+        _get_content_key) of the previous data is given, the unchanged
+        Formations are copied from its DenseTimeline, which is then deleted
+        if no other Show uses it.
+        """
+        storage = self.data_file.storage
+        key = self._get_content_key()
+        name = self._get_timeline_name(key)
+        if previous_key == key:
+            previous_key = None
+
+        timeline = DenseTimeline.load(name, storage)
+        if timeline is None:
+            previous = None
+            if previous_key is not None:
+                previous = DenseTimeline.load(
+                    self._get_timeline_name(previous_key), storage,
+                )
+            timeline = DenseTimeline.build(self.get_data(), previous)
+            timeline.save(name, storage)
+
+        if previous_key is not None:
+            self._delete_timeline(previous_key)
+
+        return timeline
+
+    def get_dependency_graph(self):
+        """Get the DependencyGraph of the Show data, or None if not saved."""
+        if self.dependency_graph is None:
+            return None
+        return DependencyGraph.from_json(codec.loads(self.dependency_graph))
+
+    def get_thumbnail_urls(self):
+        """
+        Get the URL of the thumbnail of each Formation.
+
+        Returns None if the thumbnails have not been rendered; see
+        request_thumbnails.
+        """
+        if not self.thumbnails_rendered or self.thumbnails is None:
+            return None
+        return get_thumbnail_urls(
+            codec.loads(self.thumbnails), self.data_file.storage,
+        )
+
+    @classmethod
+    def request_thumbnails(cls, show_id):
+        """
+        Render the thumbnails of the Show with the given ID in the background.
+
+        The request is sent when the current transaction commits. At most
+        THUMBNAIL_MAX_REQUESTS Shows wait to be rendered at a time; other
+        requests are dropped, to be requested again later.
+        """
+        def render():
+            try:
+                show = cls.objects.filter(pk=show_id).first()
+                if show is not None:
+                    show.render_thumbnails()
+            finally:
+                with _thumbnail_requests_lock:
+                    _thumbnail_requests.discard(show_id)
+
+        def request():
+            with _thumbnail_requests_lock:
+                if (
+                    show_id in _thumbnail_requests or
+                    len(_thumbnail_requests) >= settings.THUMBNAIL_MAX_REQUESTS
+                ):
+                    return
+                _thumbnail_requests.add(show_id)
+            submit_in_background(render)
+
+        transaction.on_commit(request)
+
+    def render_thumbnails(self):
+        """
+        Render and save the thumbnails of the Show data that aren't saved.
+
+        Thumbnails are shared by every Show, so only new Formations are
+        rendered.
+        """
+        data = self.get_data()
+        storage = self.data_file.storage
+        keys = get_thumbnail_keys(data)
+        for key, formation in zip(keys, data.get('formations', [])):
+            name = get_thumbnail_name(key)
+            if not storage.exists(name):
+                thumbnail = render_thumbnail(
+                    formation, get_field_type(data, formation),
+                )
+                storage.save(name, ContentFile(thumbnail.encode()))
+
+        # unless the data changed while rendering; Shows saved before
+        # thumbnails were added don't have any keys
+        thumbnails = codec.dumps(keys)
+        Show.objects.filter(
+            models.Q(thumbnails=thumbnails) | models.Q(thumbnails=None),
+            pk=self.pk,
+        ).update(thumbnails=thumbnails, thumbnails_rendered=True)
+        self.thumbnails = thumbnails
+        self.thumbnails_rendered = True
+
+    def save_data(self, data, revision=None):
+        """
+        Save the given Show data as the Show data.
+
+        `data` may be a JSON object, a JSON string or bytes, or a binary file
+        with the JSON (e.g. an uploaded file). JSON is saved as is, without
+        encoding it again, unless it contains `published`, which is only
+        saved in the model.
+
+        The data is only saved if the Show is still at the given revision
+        (defaults to the revision it was loaded at); otherwise, it was saved
+        by someone else in the meantime, and RevisionConflict is raised.
+
+        Replaces any patches saved with patch_data. The data file is not
+        written if its contents are unchanged. Returns the Formations and
+        Flows that changed (see DependencyGraph.get_dirty).
+        """
+        if revision is None:
+            revision = self.revision
+
+        if hasattr(data, 'read'):
+            data = data.read()
+
+        if isinstance(data, (str, bytes)):
+            # the data must end with `}`; see _get_published_suffix
+            content = data.strip()
+            if isinstance(content, str):
+                content = content.encode()
+            data = codec.loads(content)
+            if not isinstance(data, dict):
+                raise ValueError('The Show data must be a JSON object.')
+            if 'published' in data:
+                del data['published']
+                content = codec.dumpb(data)
+        else:
+            data = {
+                key: value
+                for key, value in data.items()
+                if key != 'published'
+            }
+            content = codec.dumpb(data)
+
+        previous_key = self._get_content_key()
+        previous_graph = self.get_dependency_graph()
+        fields = self._set_metadata(data)
+        self._write_data(
+            content, revision, revision + 1, update_fields=fields, data=data,
+        )
+        Show.request_timeline(self.pk, previous_key)
+
+        return self.get_dependency_graph().get_dirty(previous_graph)
+
+    def patch_data(self, patch, revision=None):
+        """
+        Apply the given JSON Patch (see utils.jsonpatch) to the Show data.
+
+        The patch is saved in the database instead of rewriting the data
+        file. After SHOW_PATCH_LIMIT patches, they are compacted into a new
+        data file in the background. The revision is checked and the
+        Formations and Flows that changed are returned, like save_data.
+        """
+        if len(patch) == 0:
+            return {'formations': [], 'flows': []}
+        if revision is None:
+            revision = self.revision
+
+        data = apply_patch(self.get_data(), patch)
+        data.pop('published', None)
+        if self._uses_data_column():
+            # writing to the database is cheap, so save the entire Show
+            return self.save_data(data, revision)
+
+        previous_key = self._get_content_key()
+        previous_graph = self.get_dependency_graph()
+        fields = self._set_metadata(data)
+        with transaction.atomic():
+            self._save_revision(revision, revision + 1, fields + ['revision'])
+            self.patches.create(patch=codec.dumps(patch))
+            self.record_revision(self.revision, data)
+
+        if self.patches.count() >= settings.SHOW_PATCH_LIMIT:
+            run_in_background(self.compact_data)
+        else:
+            Show.request_timeline(self.pk, previous_key)
+
+        return self.get_dependency_graph().get_dirty(previous_graph)
+
+    def compact_data(self):
+        """
+        Save the Show data with all of its patches applied to one file.
+
+        The data does not change, so neither does the revision. Nothing is
+        saved if the Show is saved while compacting, and only the data is
+        saved otherwise, so other changes (e.g. publish_show) are kept.
+        """
+        self.refresh_from_db()
+        patches = list(self.patches.order_by('id'))
+        if len(patches) > 0:
+            previous_key = self._get_content_key()
+            name = self.data_file.name
+            data = self._get_data(patches)
+            if self.data_file.name != name:
+                # saved while compacting
+                return
+            data.pop('published', None)
+            try:
+                self._write_data(
+                    codec.dumpb(data),
+                    self.revision,
+                    self.revision,
+                    patches[-1].id,
+                )
+            except RevisionConflict:
+                return
+            Show.request_timeline(self.pk, previous_key)
+
+    def record_revision(self, revision, data, content=None):
+        """
+        Save the given data as the given revision in the revision history.
+
+        The revision is saved as a keyframe with the entire data (see
+        ShowRevision) if it is SHOW_REVISION_KEYFRAME_INTERVAL revisions
+        after the last keyframe, or if the previous revision was not saved;
+        otherwise, only the changes from the previous revision are saved.
+        `content` is the data as JSON bytes, if already encoded; a keyframe
+        of the data that was saved as is shares its data file.
 
-    def save_data(self, data):
-        """Save the given JSON object as the Show data."""
-        if isinstance(data, str):
-            data_str = data
-            data = json.loads(data)
+        Called in the transaction that saves the revision, so every revision
+        of the Show is recorded. Old revisions are then evicted in the
+        background; see evict_revisions.
+        """
+        interval = settings.SHOW_REVISION_KEYFRAME_INTERVAL
+        numbers = (
+            self.revisions
+            .order_by('-revision')
+            .values_list('revision', flat=True)
+        )
+        last = numbers.first()
+        last_keyframe = numbers.exclude(data_file='').first()
+
+        if (
+            last != revision - 1 or
+            last_keyframe is None or
+            revision - last_keyframe >= interval
+        ):
+            if content is None:
+                content = codec.dumpb(data)
+            _, name = write_blob(
+                'shows', content, '.show',
+                storage=self.data_file.storage,
+                compression=get_compression(settings.SHOW_DATA_COMPRESSION),
+                tail=1,
+            )
+            self.revisions.create(revision=revision, data_file=name)
         else:
-            data_str = json.dumps(data)
+            patch = make_patch(self.get_revision_data(last), data)
+            self.revisions.create(revision=revision, patch=codec.dumps(patch))
+
+        run_in_background(_evict_revisions, self.pk)
+
+    def update_migrated(self, data, content, previous_key):
+        """
+        Update the model after its data was updated by migrate_shows.
+
+        Does what save_data does with the saved data: updates the metadata
+        (except `date_modified`, since the Show was not edited), records the
+        data as the current revision, and requests the DenseTimeline.
+        `content` is the data as JSON bytes, and `previous_key` the content
+        key of the data before it was updated. Called in the transaction
+        that saves the data (see utils.db.migrate_shows).
+        """
+        fields = self._set_metadata(data)
+        fields.remove('date_modified')
+        self.save(update_fields=fields)
+        self.record_revision(self.revision, data, content)
+        Show.request_timeline(self.pk, previous_key)
+
+    def get_revision_data(self, revision):
+        """
+        Get the Show data of the given revision in the revision history.
+
+        The data is built from the keyframe at or before the revision and
+        the changes since then, so it takes at most
+        SHOW_REVISION_KEYFRAME_INTERVAL steps. Raises
+        ShowRevision.DoesNotExist if the revision is not saved.
+        """
+        revisions = self.revisions.filter(revision__lte=revision)
+        keyframe = (
+            revisions
+            .exclude(data_file='')
+            .order_by('-revision')
+            .first()
+        )
+        saved = revisions.filter(revision=revision).exists()
+        if keyframe is None or not saved:
+            raise ShowRevision.DoesNotExist(f'Revision not saved: {revision}')
+
+        data = codec.loads(
+            read_blob(keyframe.data_file.name, self.data_file.storage),
+        )
+        operations = [
+            operation
+            for patch in (
+                revisions
+                .filter(revision__gt=keyframe.revision)
+                .order_by('revision')
+                .values_list('patch', flat=True)
+            )
+            for operation in codec.loads(patch)
+        ]
+        if len(operations) > 0:
+            data = apply_patch(data, operations)
+
+        return data
+
+    def restore_revision(self, revision):
+        """
+        Save the data of the given revision as the current Show data.
+
+        The restored data is saved as a new revision, so the revisions
+        after the restored one are kept. The slug is not restored. Returns
+        the Formations and Flows that changed, like save_data.
+        """
+        data = self.get_revision_data(revision)
+        data['slug'] = self.slug
+        return self.save_data(data)
 
-        # update model according to data file
+    def evict_revisions(self):
+        """
+        Delete the revisions older than the retention policy.
+
+        Revisions are kept while they are among the last SHOW_REVISION_LIMIT
+        revisions and were saved in the last SHOW_REVISION_MAX_AGE_DAYS
+        days; the last revision is always kept. Only the revisions before
+        the keyframe of the oldest revision kept are deleted, since the
+        revisions after a keyframe are saved as changes from it.
+        """
+        numbers = (
+            self.revisions
+            .order_by('-revision')
+            .values_list('revision', flat=True)
+        )
+        oldest = numbers[settings.SHOW_REVISION_LIMIT - 1:].first()
+        if oldest is None:
+            oldest = numbers.last()
+
+        min_date = timezone.now() - timedelta(
+            days=settings.SHOW_REVISION_MAX_AGE_DAYS,
+        )
+        recent = numbers.filter(date_added__gte=min_date).last()
+        oldest = max(oldest, numbers.first() if recent is None else recent)
+
+        keyframe = (
+            numbers
+            .filter(revision__lte=oldest)
+            .exclude(data_file='')
+            .first()
+        )
+        if keyframe is None:
+            return
+
+        evicted = self.revisions.filter(revision__lt=keyframe)
+        names = set(
+            evicted.exclude(data_file='').values_list('data_file', flat=True),
+        )
+        evicted.delete()
+        for name in names:
+            if not is_data_file_in_use(name):
+                self.data_file.storage.delete(name)
+
+    def _get_data(self, patches):
+        """
+        Get the Show as a JSON object, with the given patches applied.
+
+        The patches are loaded before the data file, since compact_data
+        deletes them once they are saved in a new data file. If the data
+        file is replaced in the meantime (see _with_data_file), the patches
+        of the new data file are loaded instead.
+        """
+        patches = list(patches)
+        name = self.data_file.name
+        data = codec.loads(self._with_data_file(read_blob))
+        if self.data_file.name != name:
+            patches = list(self.patches.order_by('id'))
+
+        operations = [
+            operation
+            for show_patch in patches
+            for operation in codec.loads(show_patch.patch)
+        ]
+        if len(operations) > 0:
+            data = apply_patch(data, operations)
+
+        return data
+
+    def _get_content_key(self):
+        """Get a string that changes whenever the Show data changes."""
+        last_patch = self.patches.aggregate(models.Max('id'))['id__max']
+        return f'{self.data_hash}-{last_patch or 0}'
+
+    def _get_timeline_name(self, key):
+        """Get the name of the DenseTimeline of the given content key."""
+        return f'shows/{key}.timeline.npy'
+
+    def _delete_timeline(self, key):
+        """Delete the DenseTimeline of the given content key, if not in use."""
+        # timelines without patches are shared by Shows with the same data
+        data_hash, last_patch = key.rsplit('-', 1)
+        in_use = (
+            Show.objects
+            .filter(data_hash=data_hash)
+            .exclude(pk=self.pk)
+            .exists()
+        )
+        if last_patch != '0' or not in_use:
+            DenseTimeline.delete(
+                self._get_timeline_name(key), self.data_file.storage,
+            )
+
+    def _set_metadata(self, data):
+        """
+        Update the model according to the given Show data.
+
+        `published` is not updated, since publish_show only updates the
+        model. Returns the names of the fields to save.
+        """
         self.slug = data['slug']
         self.name = data['name']
         self.is_band = data['isBand']
-        self.published = data['published']
+        self.version = data.get('version')
+        graph = DependencyGraph.from_show(data)
+        self.dependency_graph = codec.dumps(graph.to_json())
+
+        thumbnails = codec.dumps(get_thumbnail_keys(data))
+        if thumbnails != self.thumbnails:
+            self.thumbnails = thumbnails
+            self.thumbnails_rendered = False
+
+        return [
+            'slug',
+            'name',
+            'is_band',
+            'version',
+            'dependency_graph',
+            'thumbnails',
+            'thumbnails_rendered',
+            'date_modified',
+        ]
+
+    def _get_published_suffix(self, empty=False):
+        """
+        Get the bytes that replace the final `}` of the data.
+
+        This sets `published` without parsing the data, which never contains
+        `published` (see save_data). `empty` is whether the data is `{}`.
+        """
+        separator = '' if empty else ','
+        published = codec.dumps(self.published)
+        return f'{separator}"published":{published}}}'.encode()
+
+    def _merge_published(self, pointer, value):
+        """Set `published` in the value at the given JSON Pointer."""
+        if pointer == '/published':
+            return self.published
+        elif pointer == '' and isinstance(value, dict):
+            value['published'] = self.published
+
+        return value
+
+    def _uses_data_column(self):
+        """Check if the Show data is saved in the `data` column."""
+        return settings.SHOW_DATA_STORAGE == 'database'
+
+    def _select_data(self, pointers):
+        """
+        Select the values at the given JSON Pointers in the `data` column.
+
+        On PostgreSQL, the values are extracted by the database; otherwise,
+        the entire column is loaded. Returns None if the column is empty,
+        i.e. the Show has not been saved in the database yet.
+        """
+        if connection.vendor != 'postgresql':
+            data = Show.objects.values_list('data', flat=True).get(pk=self.pk)
+            if data is None:
+                return None
+
+            data = codec.loads(data)
+            return [_resolve_pointer(data, pointer) for pointer in pointers]
+
+        columns = ', '.join(['data #> %s'] * len(pointers))
+        params = [parse_pointer(pointer) for pointer in pointers]
+        with connection.cursor() as cursor:
+            cursor.execute(
+                f'SELECT data IS NOT NULL, {columns} '
+                f'FROM {self._meta.db_table} WHERE id = %s',
+                params + [self.pk],
+            )
+            has_data, *values = cursor.fetchone()
 
-        # overwrite any existing data file
-        self.data_file.delete()
-        self.data_file.save(f'{self.slug}.show', ContentFile(data_str))
+        return values if has_data else None
 
-        self.save()
+    def _write_data(
+        self, content, revision, next_revision, last_patch=None,
+        update_fields=(), data=None,
+    ):
+        """
+        Save the given bytes as the data file, or in the `data` column.
+
+        The Show is saved as `next_revision` if it is still at `revision`
+        (see _save_revision), saving only the data and the given fields. A
+        new data file, compressed with SHOW_DATA_COMPRESSION, is written
+        before the Show is changed to use it, and the previous data file is
+        only deleted afterwards, if no other Show uses it; see
+        _with_data_file. The name of the data file is only saved if it
+        changed, so a file renamed in the meantime (e.g. by compress_shows)
+        is not replaced with its old name.
+
+        Deletes the patches up to the given patch ID (defaults to all
+        patches). If the Show data is given, it is recorded as
+        `next_revision` in the same transaction (see record_revision),
+        before the previous data file is deleted.
+        """
+        patches = self.patches.all()
+        if last_patch is not None:
+            patches = patches.filter(id__lte=last_patch)
+        update_fields = list(update_fields) + ['data', 'data_hash', 'revision']
+
+        if self._uses_data_column():
+            self.data = content.decode()
+            self.data_hash = get_hash(content)
+            with transaction.atomic():
+                self._save_revision(revision, next_revision, update_fields)
+                patches.delete()
+                if data is not None:
+                    self.record_revision(next_revision, data, content)
+            return
+
+        # don't keep stale data if the storage mode was changed
+        self.data = None
+
+        storage = self.data_file.storage
+        old_name = self.data_file.name
+        if get_hash(content) != self.data_hash or not old_name:
+            self.data_hash, self.data_file.name = write_blob(
+                'shows', content, '.show',
+                storage=storage,
+                compression=get_compression(settings.SHOW_DATA_COMPRESSION),
+                # the final `}` is replaced on export; see open_data_gzip
+                tail=1,
+            )
+            update_fields.append('data_file')
+
+        try:
+            with transaction.atomic():
+                self._save_revision(revision, next_revision, update_fields)
+                patches.delete()
+                if data is not None:
+                    self.record_revision(next_revision, data, content)
+        except Exception:
+            self._delete_data_file(self.data_file.name, keep=old_name)
+            raise
+
+        self._delete_data_file(old_name, keep=self.data_file.name)
+
+    def _delete_data_file(self, name, keep):
+        """Delete the given data file, unless it is `keep` or in use."""
+        if name and name != keep and not is_data_file_in_use(name):
+            self.data_file.storage.delete(name)
+
+    def _save_revision(self, revision, next_revision, update_fields):
+        """
+        Save the Show as `next_revision`, if it is still at `revision`.
+
+        The revision is checked and set in a single UPDATE, so only one of
+        any concurrent saves of the same revision succeeds. Otherwise,
+        raises RevisionConflict with the saved revision. Only the given
+        fields are saved.
+        """
+        with transaction.atomic():
+            updated = (
+                Show.objects
+                .filter(pk=self.pk, revision=revision)
+                .update(revision=next_revision)
+            )
+            if updated == 0:
+                saved = (
+                    Show.objects
+                    .values_list('revision', flat=True)
+                    .get(pk=self.pk)
+                )
+                raise RevisionConflict(saved)
+
+            self.revision = next_revision
+            self.save(update_fields=update_fields)
+
+    def _with_data_file(self, func):
+        """
+        Call the given function with the name of the data file.
+
+        The data file of a Show that is saved again is deleted once the Show
+        uses the new data file. If this Show was loaded before then, it is
+        reloaded and the function is called again with the new data file,
+        so readers never see a missing file.
+        """
+        name = self.data_file.name
+        try:
+            return func(name)
+        except Exception:
+            if self.data_file.storage.exists(name):
+                raise
+
+        self.refresh_from_db(fields=['data_file', 'data_hash', 'revision'])
+        return func(self.data_file.name)
 
     def save(self, *args, **kwargs):
-        """If a slug is not set, generate a unique slug before saving."""
+        """
+        Save the Show.
+
+        If a slug is not set, generate a unique slug before saving. The
+        season is set from date_added, if not already set.
+        """
+        if self.season is None:
+            self.season = get_season(self.date_added)
+
         if not self.slug:
             slug = slugify(self.name)
             i = 0
@@ -110,3 +1049,148 @@ class Show(models.Model):
                 self.slug = f'{slug}-{i}'
 
         return super().save(*args, **kwargs)
+
+
+@receiver(pre_delete, sender=Show)
+def _delete_show_timeline(sender, instance, **kwargs):
+    """Delete the DenseTimeline of a Show once the Show is deleted."""
+    key = instance._get_content_key()
+    transaction.on_commit(lambda: instance._delete_timeline(key))
+
+
+def _evict_revisions(show_id):
+    """Evict the old revisions of the Show with the given ID, if it exists."""
+    show = Show.objects.filter(pk=show_id).first()
+    if show is not None:
+        show.evict_revisions()
+
+
+def is_data_file_in_use(name):
+    """Check if any Show or ShowRevision uses the given data file."""
+    return (
+        Show.objects.filter(data_file=name).exists() or
+        ShowRevision.objects.filter(data_file=name).exists()
+    )
+
+
+def _resolve_pointer(data, pointer):
+    """Get the value at the given JSON Pointer, or None if it is missing."""
+    try:
+        return resolve_pointer(data, pointer)
+    except JsonPatchError:
+        return None
+
+
+class ShowPatch(models.Model):
+    """A JSON Patch to apply to a Show's data file, in order of ID."""
+
+    show = models.ForeignKey(Show, related_name='patches')
+    patch = models.TextField()
+
+
+class ShowRevision(models.Model):
+    """
+    A revision of a Show's data in its revision history.
+
+    Every few revisions, the entire data is saved in a data file like
+    Show.data_file (a keyframe), which is shared by any Show or ShowRevision
+    with the same data. Other revisions only save a JSON Patch from the
+    previous revision. See Show.record_revision.
+    """
+
+    show = models.ForeignKey(Show, related_name='revisions')
+    # the Show.revision of the data
+    revision = models.PositiveIntegerField()
+    # the data file, if this is a keyframe
+    data_file = models.FileField(upload_to='shows', blank=True)
+    # the JSON Patch from the previous revision, if not a keyframe
+    patch = models.TextField(blank=True)
+    date_added = models.DateTimeField(auto_now_add=True)
+
+    class Meta:
+        """The metadata for ShowRevisions."""
+
+        unique_together = [('show', 'revision')]
+
+    def to_json(self):
+        """Get the JSON representation of the ShowRevision."""
+        return {
+            'revision': self.revision,
+            'date': self.date_added,
+            'keyframe': bool(self.data_file),
+        }
+
+
+class Job(models.Model):
+    """
+    An action run by the `run_jobs` worker, instead of in the request.
+
+    See calchart/jobs.py.
+    """
+
+    QUEUED = 'queued'
+    RUNNING = 'running'
+    DONE = 'done'
+    FAILED = 'failed'
+    STATUSES = [
+        (QUEUED, 'Queued'),
+        (RUNNING, 'Running'),
+        (DONE, 'Done'),
+        (FAILED, 'Failed'),
+    ]
+
+    action = models.CharField(max_length=255)
+    data = JSONTextField()
+    owner = models.ForeignKey(User)
+    status = models.CharField(max_length=10, choices=STATUSES, default=QUEUED)
+    # the fraction of the Job that is done, from 0 to 1
+    progress = models.FloatField(default=0)
+    # the JSON response of the action, or the error it raised
+    result = JSONTextField(null=True)
+    error = models.TextField(blank=True)
+    date_added = models.DateTimeField(auto_now_add=True)
+    date_started = models.DateTimeField(null=True)
+    date_finished = models.DateTimeField(null=True)
+    # saved periodically while running; see jobs.run_job
+    date_heartbeat = models.DateTimeField(null=True)
+    # the number of times the Job was claimed by a worker
+    attempts = models.PositiveIntegerField(default=0)
+
+    class Meta:
+        """The metadata for Jobs."""
+
+        indexes = [
+            # for finding the next Job to run in jobs.claim_job
+            models.Index(
+                fields=['status', 'id'],
+                name='calchart_job_status_idx',
+            ),
+        ]
+
+    def __str__(self):
+        """Get the string representation of a Job."""
+        return f'Job {self.pk} ({self.action}): {self.status}'
+
+    def set_progress(self, progress):
+        """
+        Report the fraction of the Job that is done.
+
+        The database is only updated if the progress changed by at least a
+        percent, so this can be called often.
+        """
+        if progress - self.progress >= 0.01 or progress == 1:
+            self.progress = progress
+            Job.objects.filter(pk=self.pk).update(progress=progress)
+
+    def to_json(self):
+        """Get the status of the Job, as returned by actions.get_job."""
+        return {
+            'id': self.pk,
+            'action': self.action,
+            'status': self.status,
+            'progress': self.progress,
+            'result': (
+                None if self.result is None else codec.loads(self.result)
+            ),
+            'error': self.error or None,
+        }
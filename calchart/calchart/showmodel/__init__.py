@@ -0,0 +1,12 @@
+"""
+A compact, array-backed representation of serialized Shows.
+
+The schema of a serialized Show is defined by the Javascript classes in
+src/calchart; see schema.py.
+"""
+
+from .animation import Timeline, positions_to_json  # noqa: F401
+from .collisions import find_collisions, group_collisions  # noqa: F401
+from .dense import DenseTimeline  # noqa: F401
+from .graph import DependencyGraph  # noqa: F401
+from .show import Flow, Formation, ShowModel  # noqa: F401
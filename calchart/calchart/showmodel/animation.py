@@ -0,0 +1,273 @@
+"""
+Computing the position of every dot at any beat of a Show.
+
+Formations are performed in order, each starting when the first Flow of the
+previous Formation ends. During a Flow, each dot does its movements in
+order, starting from its position in the Formation; after its movements,
+the dot stays where its last movement ended.
+
+Like the Javascript, a movement moves the dot in steps: the dot moves every
+`beatsPerStep` beats, covering `duration / beatsPerStep` steps in total.
+"""
+
+import numpy as np
+
+# the angle of each Orientation; see src/calchart/Orientation.js
+ORIENTATIONS = {
+    'east': 0,
+    'west': 180,
+}
+
+# tolerance for rounding errors when counting steps
+EPSILON = 1e-10
+
+# the fields of each segment of the Timeline
+SEGMENT_FIELDS = [
+    'dot',
+    'start',
+    'startX',
+    'startY',
+    'endX',
+    'endY',
+    'duration',
+    'beatsPerStep',
+    'orientation',
+]
+
+
+class Timeline(object):
+    """
+    The movements of every dot in a Show, stored in flat arrays.
+
+    Each segment is either a movement or a dot's position at the start of a
+    Formation (a segment that doesn't move). The segments are sorted by dot,
+    then by the beat they start on, so the segment of each dot at any beat
+    can be found with a single binary search for every dot and beat.
+    """
+
+    def __init__(self, dot_ids, segments, formation_beats):
+        """
+        Initialize the Timeline.
+
+        `segments` maps each field in SEGMENT_FIELDS to an array with the
+        value for each segment, and `formation_beats` contains the beat that
+        each Formation starts on, followed by the beat the Show ends on.
+        """
+        order = np.argsort(segments['dot'], kind='stable')
+        segments = {name: values[order] for name, values in segments.items()}
+
+        self.dot_ids = dot_ids
+        self.segments = segments
+        self.formation_beats = formation_beats
+
+        # the segments of dot `d` start at index `self._offsets[d]`
+        self._offsets = np.searchsorted(
+            segments['dot'], np.arange(len(dot_ids) + 1),
+        )
+
+        # the key of each segment, sorted; see _find_segments
+        self._span = self.num_beats + 1
+        self._keys = segments['dot'] * self._span + segments['start']
+
+        # precomputed for get_positions
+        beats_per_step = segments['beatsPerStep']
+        beats_per_step = np.where(beats_per_step > 0, beats_per_step, 1)
+        with np.errstate(divide='ignore'):
+            # infinite for segments without duration
+            fraction_per_step = beats_per_step / segments['duration']
+        self._table = np.stack([
+            segments['start'],
+            1 / beats_per_step,
+            fraction_per_step,
+            segments['startX'],
+            segments['startY'],
+            segments['endX'] - segments['startX'],
+            segments['endY'] - segments['startY'],
+            segments['orientation'],
+        ], axis=-1)
+
+    @classmethod
+    def from_show(cls, show):
+        """Build the Timeline of the given ShowModel."""
+        dot_ids = show.dot_ids
+        default_angle = _get_angle(show.orientation, 0)
+
+        parts = []
+        formation_beats = [0]
+        for formation in show.formations:
+            angle = _get_angle(formation.orientation, default_angle)
+            part, duration = get_formation_segments(
+                show, formation, formation_beats[-1], angle,
+            )
+            parts.append(part)
+            formation_beats.append(formation_beats[-1] + duration)
+
+        return cls(
+            dot_ids,
+            concat_segments(parts),
+            np.array(formation_beats, dtype=np.float64),
+        )
+
+    @property
+    def num_beats(self):
+        """Get the number of beats in the Show."""
+        return float(self.formation_beats[-1])
+
+    def get_positions(self, beats):
+        """
+        Get the position of every dot at each of the given beats.
+
+        Returns an array with shape (len(beats), len(dot_ids), 3), where
+        `positions[i, d]` is the x-coordinate, y-coordinate and orientation
+        of dot `d` at beat `beats[i]`. Values are NaN if the dot is not in
+        any Formation before that beat. Beats after the end of the Show use
+        the positions at the end of the Show.
+        """
+        beats = np.asarray(beats, dtype=np.float64)
+        if beats.ndim != 1:
+            raise ValueError('Expected a list of beats')
+        if np.any(beats < 0) or np.any(np.isnan(beats)):
+            raise ValueError('Beats must not be negative')
+
+        num_dots = len(self.dot_ids)
+        positions = np.full((len(beats), num_dots, 3), np.nan)
+        if len(self._keys) == 0 or num_dots == 0:
+            return positions
+
+        beats = np.minimum(beats, self.num_beats)
+        dots = np.arange(num_dots)
+        indices, found = self._find_segments(dots, beats)
+
+        (
+            start, steps_per_beat, fraction_per_step, x, y, dx, dy,
+            orientation,
+        ) = np.moveaxis(self._table[indices], -1, 0)
+
+        steps = np.floor(
+            (beats[:, np.newaxis] - start) * steps_per_beat + EPSILON,
+        )
+        # fmin ignores the NaN from 0 * inf for segments without duration,
+        # which are always at their end. Dots without a segment are set to
+        # NaN afterwards, so their invalid values are ignored.
+        with np.errstate(invalid='ignore'):
+            fraction = np.fmin(steps * fraction_per_step, 1)
+            positions[..., 0] = x + dx * fraction
+            positions[..., 1] = y + dy * fraction
+        positions[..., 2] = orientation
+        positions[~found] = np.nan
+
+        return positions
+
+    def _find_segments(self, dots, beats):
+        """
+        Find the segment of each of the given dots at each of the given beats.
+
+        Returns an array of segment indices with shape (len(beats),
+        len(dots)), and a boolean array marking which dots have a segment.
+        """
+        # since the segments are sorted by dot and no segment starts after
+        # the Show, dot * span + beat is sorted by dot, then beat
+        keys = dots * self._span + beats[:, np.newaxis]
+        indices = np.searchsorted(self._keys, keys, side='right') - 1
+        found = indices >= self._offsets[dots]
+        return np.maximum(indices, 0), found
+
+
+def positions_to_json(positions):
+    """
+    Convert the result of Timeline.get_positions into a JSON list.
+
+    Each position is an [x, y, orientation] list, or None for dots without a
+    position.
+    """
+    missing = np.isnan(positions[..., 0])
+    result = positions.tolist()
+    for i, d in zip(*np.nonzero(missing)):
+        result[i][d] = None
+    return result
+
+
+def get_formation_segments(show, formation, start, angle):
+    """
+    Get the segments of the given Formation, starting at the given beat.
+
+    Returns the segments, as a mapping of the fields in SEGMENT_FIELDS to
+    arrays, and the duration of the Formation's first Flow.
+    """
+    x = formation.x
+    y = formation.y
+    dots = show.get_dot_indices(formation)
+    has_dot = dots >= 0
+    num_dots = int(np.count_nonzero(has_dot))
+
+    # the position of each dot at the start of the Formation
+    segments = {
+        'dot': dots[has_dot],
+        'start': np.full(num_dots, float(start)),
+        'startX': x[has_dot],
+        'startY': y[has_dot],
+        'endX': x[has_dot],
+        'endY': y[has_dot],
+        'duration': np.zeros(num_dots),
+        'beatsPerStep': np.ones(num_dots),
+        'orientation': np.full(num_dots, float(angle)),
+    }
+
+    flows = formation.flows
+    if len(flows) == 0:
+        return segments, 0
+
+    flow = flows[0]
+    movements = flow.movements
+    offsets = flow.movement_offsets
+    counts = np.diff(offsets)
+
+    # the dot of each movement
+    indices = {dot_id: i for i, dot_id in enumerate(formation.dot_ids)}
+    flow_dots = np.array(
+        [dots[indices[dot_id]] for dot_id in flow.dot_ids],
+        dtype=np.int64,
+    )
+    movement_dots = np.repeat(flow_dots, counts)
+
+    # the beat each movement starts on: the total duration of the dot's
+    # previous movements
+    durations = movements['duration']
+    ends = np.cumsum(durations)
+    dot_starts = np.concatenate([[0], ends])[offsets[:-1]]
+    starts = ends - durations - np.repeat(dot_starts, counts)
+
+    has_dot = movement_dots >= 0
+    flow_segments = {
+        'dot': movement_dots[has_dot],
+        'start': starts[has_dot] + start,
+        'startX': movements['startX'][has_dot],
+        'startY': movements['startY'][has_dot],
+        'endX': movements['endX'][has_dot],
+        'endY': movements['endY'][has_dot],
+        'duration': durations[has_dot],
+        'beatsPerStep': movements['beatsPerStep'][has_dot],
+        'orientation': movements['orientation'][has_dot],
+    }
+
+    dot_durations = np.diff(np.concatenate([[0], ends])[offsets])
+    duration = float(dot_durations.max()) if len(dot_durations) else 0
+    return concat_segments([segments, flow_segments]), duration
+
+
+def concat_segments(parts):
+    """Concatenate the given segments, in order."""
+    return {
+        name: np.concatenate(
+            [part[name] for part in parts] or [np.zeros(0)],
+        ).astype(np.int64 if name == 'dot' else np.float64)
+        for name in SEGMENT_FIELDS
+    }
+
+
+def _get_angle(orientation, default):
+    """Get the angle of the given serialized Orientation, if set."""
+    if orientation is None:
+        return default
+    else:
+        return ORIENTATIONS[orientation['value']]
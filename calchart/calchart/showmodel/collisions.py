@@ -0,0 +1,192 @@
+"""
+Finding dots that are too close to each other.
+
+Each beat is scanned with a grid of cells as wide as the minimum distance,
+so a dot only needs to be compared with the dots in its own cell and the
+neighboring cells, instead of with every other dot.
+"""
+
+import math
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy as np
+
+# the cells to compare each cell with, as (x, y) offsets. Only half of the
+# neighbors are needed, since each pair of cells is only compared once.
+NEIGHBOR_CELLS = [(0, 0), (0, 1), (1, -1), (1, 0), (1, 1)]
+
+# the number of beats to scan in each task
+BEATS_PER_TASK = 250
+
+
+def find_collisions(positions, distance, *, workers=1, progress=None):
+    """
+    Find the pairs of dots closer than the given distance at each beat.
+
+    `positions` is an array of positions, as returned by
+    Timeline.get_positions; dots without a position are ignored. Groups of
+    beats are scanned in parallel on the given number of threads. If given,
+    `progress` is called with the fraction of beats scanned after each group.
+
+    Returns a tuple of arrays `(beats, dots, other_dots, distances)`, where
+    `beats[i]` is the index of the beat into `positions`, and `dots[i]` and
+    `other_dots[i]` are the indices of the two dots, with `dots[i] <
+    other_dots[i]`. The collisions are sorted by beat, then by dots.
+
+    Raises ValueError if the distance is not positive, or is too small to
+    divide the field into cells.
+    """
+    if not math.isfinite(distance) or distance <= 0:
+        raise ValueError('The distance must be positive')
+
+    tasks = [
+        (start, positions[start:start + BEATS_PER_TASK])
+        for start in range(0, len(positions), BEATS_PER_TASK)
+    ]
+
+    def scan(task):
+        start, chunk = task
+        beats, dots, other_dots, distances = _find_collisions(chunk, distance)
+        return beats + start, dots, other_dots, distances
+
+    if workers > 1 and len(tasks) > 1:
+        executor = ThreadPoolExecutor(max_workers=workers)
+        scanned = executor.map(scan, tasks)
+    else:
+        executor = None
+        scanned = map(scan, tasks)
+
+    results = []
+    try:
+        for result in scanned:
+            results.append(result)
+            if progress is not None:
+                progress(len(results) / len(tasks))
+    finally:
+        if executor is not None:
+            executor.shutdown()
+
+    if len(results) == 0:
+        return _empty_collisions()
+    return tuple(np.concatenate(arrays) for arrays in zip(*results))
+
+
+def group_collisions(beats, dots, other_dots, distances):
+    """
+    Merge the collisions of each pair of dots on consecutive beats.
+
+    Takes the result of find_collisions and returns a list of `(dot,
+    other_dot, start, end, distance)` tuples, where the dots collide from
+    beat `start` to beat `end` (inclusive), getting as close as `distance`.
+    The list is sorted by the beat the collisions start on.
+    """
+    if len(beats) == 0:
+        return []
+
+    order = np.lexsort((beats, other_dots, dots))
+    beats = beats[order]
+    dots = dots[order]
+    other_dots = other_dots[order]
+    distances = distances[order]
+
+    # a new group starts whenever the pair changes or a beat is skipped
+    is_start = np.ones(len(beats), dtype=bool)
+    is_start[1:] = (
+        (dots[1:] != dots[:-1]) |
+        (other_dots[1:] != other_dots[:-1]) |
+        (beats[1:] != beats[:-1] + 1)
+    )
+    starts = np.flatnonzero(is_start)
+    ends = np.append(starts[1:], len(beats)) - 1
+    min_distances = np.minimum.reduceat(distances, starts)
+
+    groups = list(zip(
+        dots[starts].tolist(),
+        other_dots[starts].tolist(),
+        beats[starts].tolist(),
+        beats[ends].tolist(),
+        min_distances.tolist(),
+    ))
+    groups.sort(key=lambda group: (group[2], group[0], group[1]))
+    return groups
+
+
+def _find_collisions(positions, distance):
+    """Find the collisions in the given beats; see find_collisions."""
+    positions = np.asarray(positions, dtype=np.float64)
+    beats, dots = np.nonzero(~np.isnan(positions[..., 0]))
+    if len(beats) == 0:
+        return _empty_collisions()
+    x = positions[beats, dots, 0]
+    y = positions[beats, dots, 1]
+
+    # the cell of each position, with an empty border around the grid so
+    # that neighboring cells never wrap around to another row or beat
+    with np.errstate(over='ignore', invalid='ignore'):
+        cell_x = np.floor(x / distance)
+        cell_y = np.floor(y / distance)
+        cell_x -= cell_x.min() - 1
+        cell_y -= cell_y.min() - 1
+
+        # the keys below must fit in int64, with room to spare for rounding
+        size = (len(positions) + 1) * (cell_x.max() + 2) * (cell_y.max() + 2)
+    if not size < 2 ** 62:
+        raise ValueError('The distance is too small')
+    height = int(cell_y.max()) + 2
+    width = int(cell_x.max()) + 2
+    cell_x = cell_x.astype(np.int64)
+    cell_y = cell_y.astype(np.int64)
+
+    # sort the positions by beat, then cell
+    keys = (beats * width + cell_x) * height + cell_y
+    order = np.argsort(keys, kind='stable')
+    keys = keys[order]
+    beats = beats[order]
+    dots = dots[order]
+    x = x[order]
+    y = y[order]
+
+    indices = np.arange(len(keys))
+    results = []
+    for offset_x, offset_y in NEIGHBOR_CELLS:
+        neighbors = keys + offset_x * height + offset_y
+        if offset_x == 0 and offset_y == 0:
+            # only the positions after this one in the same cell
+            lows = indices + 1
+        else:
+            lows = np.searchsorted(keys, neighbors, side='left')
+        highs = np.searchsorted(keys, neighbors, side='right')
+
+        # every pair of a position and a position in the neighboring cell
+        counts = np.maximum(highs - lows, 0)
+        total = int(counts.sum())
+        if total == 0:
+            continue
+        first = np.repeat(indices, counts)
+        group_starts = np.repeat(np.cumsum(counts) - counts, counts)
+        second = np.arange(total) - group_starts + np.repeat(lows, counts)
+
+        distances = np.hypot(x[first] - x[second], y[first] - y[second])
+        close = distances < distance
+        first = first[close]
+        second = second[close]
+        results.append((
+            beats[first],
+            np.minimum(dots[first], dots[second]),
+            np.maximum(dots[first], dots[second]),
+            distances[close],
+        ))
+
+    if len(results) == 0:
+        return _empty_collisions()
+    beats, dots, other_dots, distances = (
+        np.concatenate(arrays) for arrays in zip(*results)
+    )
+    order = np.lexsort((other_dots, dots, beats))
+    return beats[order], dots[order], other_dots[order], distances[order]
+
+
+def _empty_collisions():
+    """Get the result of find_collisions without any collisions."""
+    empty = np.zeros(0, dtype=np.int64)
+    return empty, empty, empty, np.zeros(0)
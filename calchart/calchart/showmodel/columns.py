@@ -0,0 +1,440 @@
+"""
+Column types for storing lists of JSON values compactly.
+
+Each spec (e.g. Number, Record) describes the values of one field in the
+serialized Show, and packs a list of those values into a column, e.g. a
+NumPy array instead of a list of Python floats. `column.get(i)` unpacks the
+i-th value back into the JSON value it was packed from.
+"""
+
+import copy
+
+import numpy as np
+
+from utils import codec
+
+# numbers with larger magnitudes are not guaranteed to be exact as floats
+MAX_SAFE_INTEGER = 2 ** 53
+
+
+def to_number(value):
+    """
+    Convert the given float into the JSON number it was packed from.
+
+    Integral values are returned as ints, since that is how JSON.stringify
+    writes them; NaN is returned as None, since it is used to pack nulls.
+    """
+    if np.isnan(value):
+        return None
+
+    value = float(value)
+    if value.is_integer() and abs(value) < MAX_SAFE_INTEGER:
+        return int(value)
+    else:
+        return value
+
+
+def _get_code_type(size):
+    """Get the smallest unsigned integer type to index `size` values."""
+    return np.min_scalar_type(max(size - 1, 0))
+
+
+class Number(object):
+    """A number, or null, stored in a float64 array."""
+
+    default = None
+
+    def pack(self, values):
+        """Pack the given numbers into a column."""
+        for value in values:
+            if value is None:
+                continue
+            elif isinstance(value, bool) or type(value) not in (int, float):
+                raise ValueError(f'Expected a number: {value!r}')
+            elif isinstance(value, int) and abs(value) >= MAX_SAFE_INTEGER:
+                raise ValueError(f'Number is too large: {value}')
+
+        return NumberColumn(np.array(
+            [np.nan if value is None else value for value in values],
+            dtype=np.float64,
+        ))
+
+
+class NumberColumn(object):
+    """A column of numbers."""
+
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        """Initialize the column from an array of floats."""
+        self.values = values
+
+    def __len__(self):
+        """Get the number of values in the column."""
+        return len(self.values)
+
+    def get(self, i):
+        """Get the i-th number."""
+        return to_number(self.values[i])
+
+
+class String(object):
+    """
+    A string stored in a fixed-width NumPy array.
+
+    Every string is stored with the length of the longest string, so this
+    should only be used for short strings with similar lengths, e.g. IDs.
+    """
+
+    default = ''
+
+    def pack(self, values):
+        """Pack the given strings into a column."""
+        for value in values:
+            if not isinstance(value, str):
+                raise ValueError(f'Expected a string: {value!r}')
+
+        # NumPy strips trailing null characters from fixed-width strings
+        if any(value.endswith('\0') for value in values):
+            return StringColumn(np.array(values, dtype=object))
+
+        try:
+            encoded = [value.encode('ascii') for value in values]
+        except UnicodeEncodeError:
+            return StringColumn(np.array(values, dtype=str))
+        else:
+            return StringColumn(np.array(encoded, dtype=bytes))
+
+
+class StringColumn(object):
+    """A column of strings."""
+
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        """Initialize the column from a NumPy array of strings."""
+        self.values = values
+
+    def __len__(self):
+        """Get the number of values in the column."""
+        return len(self.values)
+
+    def get(self, i):
+        """Get the i-th string."""
+        value = self.values[i]
+        if isinstance(value, bytes):
+            return value.decode('ascii')
+        else:
+            return str(value)
+
+    def get_slice(self, start, end):
+        """Get the strings from index `start` to `end` (exclusive)."""
+        values = self.values[start:end].tolist()
+        if self.values.dtype.kind == 'S':
+            return [value.decode('ascii') for value in values]
+        else:
+            return [str(value) for value in values]
+
+
+class Category(object):
+    """
+    A value with few distinct values, e.g. an enum, a boolean or a name.
+
+    Each distinct value is stored once, and each value is stored as the
+    index of its distinct value, in the smallest integer array possible.
+    """
+
+    default = None
+
+    def pack(self, values):
+        """Pack the given values into a column."""
+        categories = []
+        indices = {}
+        codes = []
+        for value in values:
+            key = codec.dumps(value, sort_keys=True)
+            code = indices.get(key)
+            if code is None:
+                code = len(categories)
+                indices[key] = code
+                categories.append(value)
+            codes.append(code)
+
+        return CategoryColumn(
+            np.array(codes, dtype=_get_code_type(len(categories))),
+            categories,
+        )
+
+
+class CategoryColumn(object):
+    """A column of values with few distinct values."""
+
+    __slots__ = ('codes', 'categories')
+
+    def __init__(self, codes, categories):
+        """Initialize the column from the codes and the distinct values."""
+        self.codes = codes
+        self.categories = categories
+
+    def __len__(self):
+        """Get the number of values in the column."""
+        return len(self.codes)
+
+    def get(self, i):
+        """Get the i-th value."""
+        value = self.categories[self.codes[i]]
+        if isinstance(value, (dict, list)):
+            return copy.deepcopy(value)
+        else:
+            return value
+
+
+class Value(object):
+    """Any JSON value, stored as is. Only use for small, rare values."""
+
+    default = None
+
+    def pack(self, values):
+        """Pack the given values into a column."""
+        return ValueColumn(list(values))
+
+
+class ValueColumn(object):
+    """A column of JSON values."""
+
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        """Initialize the column from a list of JSON values."""
+        self.values = values
+
+    def __len__(self):
+        """Get the number of values in the column."""
+        return len(self.values)
+
+    def get(self, i):
+        """Get the i-th value."""
+        return copy.deepcopy(self.values[i])
+
+
+class List(object):
+    """
+    A list of values, or null.
+
+    The values in every list are packed into one column, with the offset of
+    each list into that column.
+    """
+
+    def __init__(self, spec, nullable=False):
+        """Initialize the spec with the spec of each value in the lists."""
+        self.spec = spec
+        self.nullable = nullable
+        self.default = None if nullable else []
+
+    def pack(self, values):
+        """Pack the given lists into a column."""
+        flattened = []
+        offsets = [0]
+        for value in values:
+            if value is None and self.nullable:
+                pass
+            elif isinstance(value, list):
+                flattened.extend(value)
+            else:
+                raise ValueError(f'Expected a list: {value!r}')
+            offsets.append(len(flattened))
+
+        return ListColumn(
+            self.spec.pack(flattened),
+            np.array(offsets, dtype=np.int64),
+            _pack_nulls(values, self.nullable),
+        )
+
+
+class ListColumn(object):
+    """A column of lists."""
+
+    __slots__ = ('values', 'offsets', 'nulls')
+
+    def __init__(self, values, offsets, nulls):
+        """Initialize the column."""
+        self.values = values
+        self.offsets = offsets
+        self.nulls = nulls
+
+    def __len__(self):
+        """Get the number of lists in the column."""
+        return len(self.offsets) - 1
+
+    def get_range(self, i):
+        """Get the range of the i-th list in `self.values`."""
+        return range(self.offsets[i], self.offsets[i + 1])
+
+    def get(self, i):
+        """Get the i-th list."""
+        if self.nulls is not None and self.nulls[i]:
+            return None
+        return [self.values.get(j) for j in self.get_range(i)]
+
+
+class Mapping(List):
+    """
+    A mapping of strings to values, or null.
+
+    The keys and values of every mapping are each packed into one column,
+    with the offset of each mapping into those columns.
+    """
+
+    def __init__(self, spec, nullable=False):
+        """Initialize the spec with the spec of each value in the mappings."""
+        super().__init__(spec, nullable)
+        self.default = None if nullable else {}
+
+    def pack(self, values):
+        """Pack the given mappings into a column."""
+        keys = []
+        flattened = []
+        offsets = [0]
+        for value in values:
+            if value is None and self.nullable:
+                pass
+            elif isinstance(value, dict):
+                keys.extend(value.keys())
+                flattened.extend(value.values())
+            else:
+                raise ValueError(f'Expected an object: {value!r}')
+            offsets.append(len(flattened))
+
+        return MappingColumn(
+            String().pack(keys),
+            self.spec.pack(flattened),
+            np.array(offsets, dtype=np.int64),
+            _pack_nulls(values, self.nullable),
+        )
+
+
+class MappingColumn(ListColumn):
+    """A column of mappings."""
+
+    __slots__ = ('keys',)
+
+    def __init__(self, keys, values, offsets, nulls):
+        """Initialize the column."""
+        super().__init__(values, offsets, nulls)
+        self.keys = keys
+
+    def get(self, i):
+        """Get the i-th mapping."""
+        if self.nulls is not None and self.nulls[i]:
+            return None
+        return {
+            self.keys.get(j): self.values.get(j)
+            for j in self.get_range(i)
+        }
+
+
+class Record(object):
+    """
+    An object with the given fields, or null.
+
+    Each field is packed into its own column. Fields in `optional` may be
+    missing from the object. Any other keys in the object are kept as is,
+    so that fields that are not in the spec are not lost.
+    """
+
+    default = None
+
+    def __init__(self, fields, optional=(), nullable=False):
+        """Initialize the spec with the spec of each field."""
+        self.fields = fields
+        self.optional = set(fields) if optional is True else set(optional)
+        self.nullable = nullable
+
+    def pack(self, values):
+        """Pack the given objects into a column."""
+        for value in values:
+            if value is None and self.nullable:
+                continue
+            elif not isinstance(value, dict):
+                raise ValueError(f'Expected an object: {value!r}')
+
+        columns = {}
+        missing = {}
+        for name, spec in self.fields.items():
+            field_values = []
+            field_missing = []
+            for value in values:
+                if value is None:
+                    field_values.append(spec.default)
+                    field_missing.append(False)
+                elif name in value:
+                    field_values.append(value[name])
+                    field_missing.append(False)
+                elif name in self.optional:
+                    field_values.append(spec.default)
+                    field_missing.append(True)
+                else:
+                    raise ValueError(f'Missing field: {name}')
+
+            columns[name] = spec.pack(field_values)
+            if any(field_missing):
+                missing[name] = np.array(field_missing, dtype=bool)
+
+        extras = {}
+        for i, value in enumerate(values):
+            if value is not None and not value.keys() <= self.fields.keys():
+                extras[i] = {
+                    k: v for k, v in value.items() if k not in self.fields
+                }
+
+        return RecordColumn(
+            len(values),
+            columns,
+            missing,
+            extras,
+            _pack_nulls(values, self.nullable),
+        )
+
+
+class RecordColumn(object):
+    """A column of objects."""
+
+    __slots__ = ('length', 'columns', 'missing', 'extras', 'nulls')
+
+    def __init__(self, length, columns, missing, extras, nulls):
+        """Initialize the column."""
+        self.length = length
+        self.columns = columns
+        self.missing = missing
+        self.extras = extras
+        self.nulls = nulls
+
+    def __len__(self):
+        """Get the number of objects in the column."""
+        return self.length
+
+    def __getitem__(self, name):
+        """Get the column of the field with the given name."""
+        return self.columns[name]
+
+    def get(self, i):
+        """Get the i-th object."""
+        if self.nulls is not None and self.nulls[i]:
+            return None
+
+        value = {
+            name: column.get(i)
+            for name, column in self.columns.items()
+            if name not in self.missing or not self.missing[name][i]
+        }
+        if i in self.extras:
+            value.update(copy.deepcopy(self.extras[i]))
+        return value
+
+
+def _pack_nulls(values, nullable):
+    """Get a boolean array marking null values, or None if none are null."""
+    if nullable and any(value is None for value in values):
+        return np.array([value is None for value in values], dtype=bool)
+    else:
+        return None
@@ -0,0 +1,252 @@
+"""
+The position of every dot at every beat of a Show, precomputed.
+
+A DenseTimeline is a (beats x dots x 3) float32 array, saved as a .npy file
+so that it can be memory-mapped. When a Show changes, the rows of the
+Formations that did not change are copied from the previous DenseTimeline
+instead of being computed again.
+"""
+
+import io
+import math
+import os
+import shutil
+import tempfile
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+
+import numpy as np
+
+from utils import codec, metrics
+from utils.storage import read_blob
+
+from .animation import Timeline
+from .graph import DependencyGraph
+from .show import ShowModel
+
+
+class DenseTimeline(object):
+    """
+    The position of every dot at every beat of a Show.
+
+    `positions[beat, d]` is the x-coordinate, y-coordinate and orientation
+    of dot `d` at the given beat, from beat 0 to the end of the Show.
+    """
+
+    def __init__(self, positions, dot_ids, formation_beats, fingerprints):
+        """Initialize the DenseTimeline."""
+        self.positions = positions
+        self.dot_ids = dot_ids
+        self.formation_beats = formation_beats
+        self.fingerprints = fingerprints
+
+    @classmethod
+    def build(cls, data, previous=None):
+        """
+        Build the DenseTimeline of the given serialized Show.
+
+        If a previous DenseTimeline of the Show is given, the rows of any
+        Formation that did not change are copied from it.
+        """
+        show = ShowModel.from_json(data)
+        timeline = Timeline.from_show(show)
+        formation_beats = timeline.formation_beats.tolist()
+
+        # the key of a Formation changes whenever its positions change
+        graph = DependencyGraph.from_show(data)
+        fingerprints = list(graph.formation_keys.values())
+
+        num_rows = math.floor(timeline.num_beats) + 1
+        positions = np.empty((num_rows, len(show.dot_ids), 3), np.float32)
+
+        reusable = {}
+        if previous is not None and previous.dot_ids == show.dot_ids:
+            reusable = {
+                fingerprint: i
+                for i, fingerprint in enumerate(previous.fingerprints)
+            }
+
+        # the beats in [start, end) of each Formation
+        missing = []
+        for i, fingerprint in enumerate(fingerprints):
+            start, end = formation_beats[i:i + 2]
+            rows = range(math.ceil(start), math.ceil(end))
+
+            j = reusable.get(fingerprint)
+            if j is not None:
+                prev_start, prev_end = previous.formation_beats[j:j + 2]
+                if (
+                    prev_end - prev_start == end - start and
+                    float(prev_start - start).is_integer()
+                ):
+                    prev_row = math.ceil(prev_start)
+                    positions[rows.start:rows.stop] = previous.positions[
+                        prev_row:prev_row + len(rows)
+                    ]
+                    continue
+
+            missing.extend(rows)
+
+        # the beats at the end of the Show
+        missing.extend(range(math.ceil(formation_beats[-1]), num_rows))
+
+        if len(missing) > 0:
+            positions[missing] = timeline.get_positions(missing)
+
+        return cls(positions, show.dot_ids, formation_beats, fingerprints)
+
+    @property
+    def num_beats(self):
+        """Get the number of beats in the Show."""
+        return self.formation_beats[-1]
+
+    def get_positions(self, beats):
+        """
+        Get the position of every dot at each of the given beats.
+
+        Like Timeline.get_positions, but the beats must be integers.
+        """
+        beats = np.asarray(beats)
+        if beats.ndim != 1:
+            raise ValueError('Expected a list of beats')
+        if len(beats) == 0:
+            return self.positions[:0]
+        if not np.all(np.mod(beats, 1) == 0) or np.any(beats < 0):
+            raise ValueError('Beats must be non-negative integers')
+
+        beats = np.minimum(beats, len(self.positions) - 1).astype(np.int64)
+        return self.positions[beats]
+
+    @classmethod
+    def load(cls, name, storage):
+        """
+        Load the DenseTimeline saved with the given name.
+
+        The positions are memory-mapped from the storage if it is on the
+        local file system, and from a copy in TIMELINE_CACHE_DIR otherwise
+        (see get_cached_path). Returns None if the DenseTimeline was not
+        saved.
+        """
+        index_name = get_index_name(name)
+        if not storage.exists(index_name):
+            return None
+
+        index = codec.loads(read_blob(index_name, storage))
+        try:
+            path = storage.path(name)
+        except NotImplementedError:
+            path = get_cached_path(name, storage)
+        positions = np.load(path, mmap_mode='r')
+
+        return cls(
+            positions,
+            index['dots'],
+            index['formationBeats'],
+            index['fingerprints'],
+        )
+
+    def save(self, name, storage):
+        """Save the DenseTimeline with the given name, if not saved."""
+        index_name = get_index_name(name)
+        if storage.exists(index_name):
+            return
+
+        f = io.BytesIO()
+        np.save(f, np.ascontiguousarray(self.positions))
+        if not storage.exists(name):
+            storage.save(name, ContentFile(f.getvalue()))
+            metrics.increment('storage.bytes_written', f.tell())
+
+        try:
+            storage.path(name)
+        except NotImplementedError:
+            # so that load does not download it again
+            f.seek(0)
+            cache_file(name, f)
+
+        # saved last, since load checks if this exists
+        index = {
+            'dots': self.dot_ids,
+            'formationBeats': self.formation_beats,
+            'fingerprints': self.fingerprints,
+        }
+        content = codec.dumpb(index)
+        storage.save(index_name, ContentFile(content))
+        metrics.increment('storage.bytes_written', len(content))
+
+    @staticmethod
+    def delete(name, storage):
+        """Delete the DenseTimeline saved with the given name."""
+        storage.delete(get_index_name(name))
+        storage.delete(name)
+
+        _remove(
+            os.path.join(settings.TIMELINE_CACHE_DIR, get_cache_name(name)),
+        )
+
+
+def get_cached_path(name, storage):
+    """
+    Get the path of a local copy of the file with the given name.
+
+    The file is downloaded to TIMELINE_CACHE_DIR if it is not there yet. A
+    DenseTimeline is named by the hash of its Show data, so a copy never
+    goes out of date.
+    """
+    path = os.path.join(settings.TIMELINE_CACHE_DIR, get_cache_name(name))
+    if not os.path.exists(path):
+        with storage.open(name) as f:
+            size = cache_file(name, f)
+        metrics.increment('storage.bytes_read', size)
+    return path
+
+
+def cache_file(name, f):
+    """
+    Save the given binary file as the local copy of the given file name.
+
+    At most TIMELINE_CACHE_FILES copies are kept in TIMELINE_CACHE_DIR; the
+    least recently saved ones are deleted first. Returns the size of the
+    copy.
+    """
+    cache_dir = settings.TIMELINE_CACHE_DIR
+    path = os.path.join(cache_dir, get_cache_name(name))
+    os.makedirs(cache_dir, exist_ok=True)
+    with tempfile.NamedTemporaryFile(
+        dir=cache_dir, suffix='.tmp', delete=False,
+    ) as temp:
+        shutil.copyfileobj(f, temp)
+        size = temp.tell()
+    # readers never see a partial file
+    os.replace(temp.name, path)
+
+    cached = sorted(
+        (entry.stat().st_mtime, entry.path)
+        for entry in os.scandir(cache_dir)
+        if entry.name.endswith('.npy')
+    )
+    evicted = cached[:max(len(cached) - settings.TIMELINE_CACHE_FILES, 0)]
+    for _, old_path in evicted:
+        if old_path != path:
+            _remove(old_path)
+
+    return size
+
+
+def get_cache_name(name):
+    """Get the name of the local copy of a file in TIMELINE_CACHE_DIR."""
+    return name.replace('/', '_')
+
+
+def _remove(path):
+    """Delete the given local file, if it exists."""
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def get_index_name(name):
+    """Get the name of the file with the metadata of a DenseTimeline."""
+    return name.rsplit('.', 1)[0] + '.json'
@@ -0,0 +1,107 @@
+"""
+Finding which Formations and Flows changed between two versions of a Show.
+
+Each Formation and Flow gets a key: a hash of its contents and the keys of
+everything it depends on, so a Formation's key changes whenever it or
+anything upstream of it changes. Comparing the keys of two versions gives
+the Formations and Flows whose derived data (e.g. positions) is dirty,
+without needing the previous version of the Show.
+"""
+
+import hashlib
+
+from utils import codec
+
+# the fields of the Show that every Formation depends on
+SHOW_DEFAULTS = ['fieldType', 'beatsPerStep', 'stepType', 'orientation']
+
+
+class DependencyGraph(object):
+    """
+    The keys of every Formation and Flow in a Show, by ID.
+
+    A Formation depends on the previous Formation if the previous Formation
+    has `nextDots` (i.e. it leads into this Formation), or if any dot is not
+    in this Formation (since that dot stays where it was). A Flow depends on
+    its Formation, without its Flows.
+    """
+
+    def __init__(self, formation_keys, flow_keys):
+        """Initialize the graph from the keys of the Formations and Flows."""
+        self.formation_keys = formation_keys
+        self.flow_keys = flow_keys
+
+    @classmethod
+    def from_show(cls, data):
+        """Get the DependencyGraph of the given serialized Show."""
+        dot_ids = {dot['id'] for dot in data.get('dots', [])}
+        defaults = {name: data.get(name) for name in SHOW_DEFAULTS}
+
+        formation_keys = {}
+        flow_keys = {}
+        previous = None
+        for formation in data.get('formations', []):
+            content = dict(formation, flows=None)
+            content_key = _get_key([defaults, content])
+
+            keys = []
+            for flow in formation['flows']:
+                flow_keys[flow['id']] = _get_key([content_key, flow])
+                keys.append(flow_keys[flow['id']])
+
+            upstream = None
+            if previous is not None:
+                formation_dots = {dot['dot'] for dot in formation['dots']}
+                if previous['nextDots'] or not dot_ids <= formation_dots:
+                    upstream = formation_keys[previous['id']]
+
+            formation_keys[formation['id']] = _get_key(
+                [content_key, keys, upstream],
+            )
+            previous = formation
+
+        return cls(formation_keys, flow_keys)
+
+    @classmethod
+    def from_json(cls, data):
+        """Load a DependencyGraph saved with to_json."""
+        return cls(data['formations'], data['flows'])
+
+    def to_json(self):
+        """Get the DependencyGraph as a JSON object."""
+        return {
+            'formations': self.formation_keys,
+            'flows': self.flow_keys,
+        }
+
+    def get_dirty(self, previous):
+        """
+        Get the Formations and Flows that changed since the given graph.
+
+        Returns a dictionary with the IDs of the new or changed Formations
+        and Flows in `formations` and `flows`, in the order of this graph.
+        If `previous` is None, everything is dirty.
+        """
+        if previous is None:
+            previous = DependencyGraph({}, {})
+
+        return {
+            'formations': _get_changed(
+                self.formation_keys, previous.formation_keys,
+            ),
+            'flows': _get_changed(self.flow_keys, previous.flow_keys),
+        }
+
+
+def _get_key(value):
+    """Get the hash of the given JSON value."""
+    content = codec.dumpb(value, sort_keys=True)
+    return hashlib.sha1(content).hexdigest()
+
+
+def _get_changed(keys, previous_keys):
+    """Get the IDs whose keys are not the same as in `previous_keys`."""
+    return [
+        key_id for key_id, key in keys.items()
+        if previous_keys.get(key_id) != key
+    ]
@@ -0,0 +1,122 @@
+"""
+The specs of a serialized Show, as defined in src/calchart.
+
+Every field is required, since the Javascript classes serialize every
+field, except for the fields of the Show itself, since create_show saves
+the Show with only the fields in the form.
+"""
+
+from .columns import Category, List, Mapping, Number, Record, String, Value
+
+# an Enum (e.g. FieldType) or a [number, number] tuple, either of which may
+# be null to use the default
+ENUM = Category()
+
+COORDINATE = Record({
+    'x': Number(),
+    'y': Number(),
+    '__type__': Category(),
+})
+
+DOT = Record({
+    'id': String(),
+    'label': String(),
+    '__type__': Category(),
+})
+
+MOVEMENT = Record({
+    'id': String(),
+    'startX': Number(),
+    'startY': Number(),
+    'endX': Number(),
+    'endY': Number(),
+    'duration': Number(),
+    'orientation': Number(),
+    'beatsPerStep': Number(),
+    # only in StopMovement
+    'isMarkTime': Category(),
+    '__type__': Category(),
+}, optional=['isMarkTime'])
+
+CONTINUITY = Record({
+    'id': String(),
+    'fieldType': ENUM,
+    'beatsPerStep': ENUM,
+    'stepType': ENUM,
+    'orientation': ENUM,
+    # only in StopContinuity
+    'isMarkTime': Category(),
+    'duration': Number(),
+    '__type__': Category(),
+}, optional=['isMarkTime', 'duration'])
+
+FLOW = Record({
+    'id': String(),
+    # maps the ID of each FormationDot to its movements
+    'dots': Mapping(Record({
+        'nextPoint': COORDINATE,
+        'dotType': ENUM,
+        'movements': List(MOVEMENT),
+    })),
+    # maps each DotType to its continuities
+    'dotTypeInfo': Mapping(Record({
+        'continuities': List(CONTINUITY),
+        'hasNextPoint': Category(),
+    })),
+    '__type__': Category(),
+})
+
+FORMATION_DOT = Record({
+    'id': String(),
+    'position': COORDINATE,
+    'dotGroup': Category(),
+    # the ID of the Dot
+    'dot': Category(),
+    '__type__': Category(),
+})
+
+FORMATION = Record({
+    'id': String(),
+    'name': Value(),
+    'dots': List(FORMATION_DOT),
+    'flows': List(FLOW),
+    'nextDots': Mapping(FORMATION_DOT, nullable=True),
+    'fieldType': ENUM,
+    'beatsPerStep': ENUM,
+    'stepType': ENUM,
+    'orientation': ENUM,
+    '__type__': Category(),
+})
+
+SONG = Record({
+    'id': String(),
+    'name': Value(),
+    # the ID of the Flow
+    'firstFlow': Category(),
+    'fieldType': ENUM,
+    'beatsPerStep': ENUM,
+    'stepType': ENUM,
+    'orientation': ENUM,
+    '__type__': Category(),
+})
+
+SHOW = Record({
+    'version': Number(),
+    'name': Value(),
+    'slug': Value(),
+    'isBand': Category(),
+    'published': Category(),
+    'numDots': Number(),
+    'dotGroups': Value(),
+    'labelFormat': ENUM,
+    'beats': List(Number()),
+    'audioUrl': Value(),
+    'dots': List(DOT),
+    'formations': List(FORMATION),
+    'songs': List(SONG),
+    'fieldType': ENUM,
+    'beatsPerStep': ENUM,
+    'stepType': ENUM,
+    'orientation': ENUM,
+    '__type__': Category(),
+}, optional=True)
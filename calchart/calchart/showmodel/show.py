@@ -0,0 +1,220 @@
+"""The compact representation of a Show."""
+
+import numpy as np
+
+from utils import codec
+
+from .schema import SHOW
+
+
+class ShowModel(object):
+    """
+    A serialized Show, loaded into compact columns.
+
+    Instead of a tree of dicts, every value of each field is packed into a
+    NumPy array (see columns.py), e.g. the x-coordinate of every FormationDot
+    in the Show is in one float64 array. to_json converts it back into the
+    serialized Show.
+    """
+
+    __slots__ = ('_show', '_dot_indices')
+
+    def __init__(self, show):
+        """Initialize the model from a RecordColumn containing one Show."""
+        self._show = show
+        self._dot_indices = None
+
+    @classmethod
+    def from_json(cls, data):
+        """
+        Load the given serialized Show.
+
+        `data` is the JSON object, or the JSON string or bytes. Raises a
+        ValueError if the data does not match the schema.
+        """
+        if isinstance(data, (str, bytes)):
+            data = codec.loads(data)
+        return cls(SHOW.pack([data]))
+
+    def to_json(self):
+        """Get the serialized Show as a JSON object."""
+        return self._show.get(0)
+
+    @property
+    def dot_ids(self):
+        """Get the IDs of every Dot in the Show."""
+        dots = self._show['dots']
+        start, end = dots.offsets[:2]
+        return dots.values['id'].get_slice(start, end)
+
+    @property
+    def orientation(self):
+        """Get the serialized default Orientation of the Show."""
+        return self._show['orientation'].get(0)
+
+    @property
+    def formations(self):
+        """Get every Formation in the Show."""
+        return [
+            Formation(self._show['formations'].values, i)
+            for i in self._show['formations'].get_range(0)
+        ]
+
+    def get_dot_indices(self, formation):
+        """
+        Get the Dot of each FormationDot in the given Formation.
+
+        Returns an array of indices into `dot_ids`, with -1 for FormationDots
+        without a Dot.
+        """
+        if self._dot_indices is None:
+            self._dot_indices = {
+                dot_id: i for i, dot_id in enumerate(self.dot_ids)
+            }
+        indices = self._dot_indices
+
+        return np.array(
+            [-1 if dot is None else indices[dot] for dot in formation.dots],
+            dtype=np.int64,
+        )
+
+    def get_formation(self, formation_id):
+        """Get the Formation with the given ID, or None if it doesn't exist."""
+        for formation in self.formations:
+            if formation.id == formation_id:
+                return formation
+        return None
+
+
+class Formation(object):
+    """
+    A view of a Formation in a ShowModel.
+
+    The arrays of FormationDots are views of the ShowModel's arrays, so they
+    should not be modified.
+    """
+
+    __slots__ = ('_formations', '_index')
+
+    def __init__(self, formations, index):
+        """Initialize the view of the given Formation in the column."""
+        self._formations = formations
+        self._index = index
+
+    @property
+    def id(self):  # noqa: A003
+        """Get the ID of the Formation."""
+        return self._formations['id'].get(self._index)
+
+    @property
+    def name(self):
+        """Get the name of the Formation."""
+        return self._formations['name'].get(self._index)
+
+    @property
+    def orientation(self):
+        """Get the serialized Orientation of the Formation, if set."""
+        return self._formations['orientation'].get(self._index)
+
+    @property
+    def _dots(self):
+        """Get the column and the slice of this Formation's FormationDots."""
+        dots = self._formations['dots']
+        start, end = dots.offsets[self._index:self._index + 2]
+        return dots.values, slice(start, end)
+
+    @property
+    def dot_ids(self):
+        """Get the IDs of the FormationDots."""
+        dots, indices = self._dots
+        return dots['id'].get_slice(indices.start, indices.stop)
+
+    @property
+    def x(self):
+        """Get the x-coordinate of each FormationDot."""
+        dots, indices = self._dots
+        return dots['position']['x'].values[indices]
+
+    @property
+    def y(self):
+        """Get the y-coordinate of each FormationDot."""
+        dots, indices = self._dots
+        return dots['position']['y'].values[indices]
+
+    @property
+    def dots(self):
+        """Get the ID of the Dot of each FormationDot (None if not set)."""
+        dots, indices = self._dots
+        column = dots['dot']
+        categories = column.categories
+        return [categories[code] for code in column.codes[indices].tolist()]
+
+    @property
+    def flows(self):
+        """Get every Flow in the Formation."""
+        flows = self._formations['flows']
+        return [Flow(flows.values, i) for i in flows.get_range(self._index)]
+
+
+class Flow(object):
+    """
+    A view of a Flow in a ShowModel.
+
+    The arrays of Movements are views of the ShowModel's arrays, so they
+    should not be modified.
+    """
+
+    __slots__ = ('_flows', '_index')
+
+    # the numeric fields of each Movement
+    MOVEMENT_FIELDS = [
+        'startX',
+        'startY',
+        'endX',
+        'endY',
+        'duration',
+        'orientation',
+        'beatsPerStep',
+    ]
+
+    def __init__(self, flows, index):
+        """Initialize the view of the given Flow in the column."""
+        self._flows = flows
+        self._index = index
+
+    @property
+    def id(self):  # noqa: A003
+        """Get the ID of the Flow."""
+        return self._flows['id'].get(self._index)
+
+    @property
+    def dot_ids(self):
+        """Get the IDs of the FormationDots with movements in this Flow."""
+        dots = self._flows['dots']
+        start, end = dots.offsets[self._index:self._index + 2]
+        return dots.keys.get_slice(start, end)
+
+    @property
+    def movement_offsets(self):
+        """
+        Get the offsets of the movements of each FormationDot.
+
+        The movements of the i-th FormationDot in `dot_ids` are at indices
+        `offsets[i]` to `offsets[i + 1]` in the arrays in `movements`.
+        """
+        dots = self._flows['dots']
+        start, end = dots.offsets[self._index:self._index + 2]
+        offsets = dots.values['movements'].offsets[start:end + 1]
+        return offsets - offsets[0]
+
+    @property
+    def movements(self):
+        """Get a mapping of the numeric fields of the Movements to arrays."""
+        dots = self._flows['dots']
+        start, end = dots.offsets[self._index:self._index + 2]
+        movements = dots.values['movements']
+        indices = slice(movements.offsets[start], movements.offsets[end])
+        return {
+            name: movements.values[name].values[indices]
+            for name in self.MOVEMENT_FIELDS
+        }
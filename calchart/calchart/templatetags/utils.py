@@ -1,9 +1,9 @@
 """Custom template tags that provide utility functionality."""
 
-import json
-
 from django import template
 
+from utils import codec
+
 register = template.Library()
 
 
@@ -13,6 +13,6 @@ def asjson(json_str):
     if json_str is None:
         json_str = 'null'
     elif not isinstance(json_str, (bytes, str)):
-        json_str = json.dumps(json_str)
+        json_str = codec.dumps(json_str)
 
     return json_str
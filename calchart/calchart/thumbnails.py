@@ -0,0 +1,109 @@
+"""
+Rendering small SVG previews of the Formations in a Show.
+
+A thumbnail depends only on the positions of the FormationDots and the
+FieldType, so thumbnails are saved in storage by the hash of those, and
+shared by every Show (and every version of a Show) with the same Formation.
+"""
+
+import hashlib
+
+from utils import codec
+
+# the size of each FieldType, in steps; see src/calchart/FieldType.js
+FIELD_DIMENSIONS = {
+    'college': (160, 84),
+}
+
+# the distance from the west sideline of the back and front hashes of each
+# FieldType; see src/grapher/CollegeField.vue
+FIELD_HASHES = {
+    'college': (32, 52),
+}
+
+# the number of steps between each yardline
+YARDLINE_STEPS = 8
+
+DOT_RADIUS = 0.75
+
+
+def get_field_type(data, formation):
+    """Get the value of the FieldType of the given serialized Formation."""
+    field_type = formation.get('fieldType') or data.get('fieldType')
+    if isinstance(field_type, dict):
+        field_type = field_type['value']
+    return field_type if field_type in FIELD_DIMENSIONS else 'college'
+
+
+def get_thumbnail_key(formation, field_type):
+    """Get the hash of everything drawn in a Formation's thumbnail."""
+    positions = [
+        [dot['position']['x'], dot['position']['y']]
+        for dot in formation['dots']
+    ]
+    content = codec.dumpb([field_type, positions])
+    return hashlib.sha1(content).hexdigest()
+
+
+def get_thumbnail_keys(data):
+    """Get the key of the thumbnail of each Formation in a serialized Show."""
+    return [
+        get_thumbnail_key(formation, get_field_type(data, formation))
+        for formation in data.get('formations', [])
+    ]
+
+
+def get_thumbnail_name(key):
+    """Get the name of the thumbnail with the given key in storage."""
+    return f'thumbnails/{key}.svg'
+
+
+def get_thumbnail_urls(keys, storage):
+    """Get the URLs of the thumbnails with the given keys in storage."""
+    return [storage.url(get_thumbnail_name(key)) for key in keys]
+
+
+def render_thumbnail(formation, field_type):
+    """
+    Render the thumbnail of the given serialized Formation as an SVG.
+
+    The field is drawn like the editor draws it, with the west sideline at
+    the top and the north endzone on the right.
+    """
+    width, height = FIELD_DIMENSIONS[field_type]
+    back_hash, front_hash = FIELD_HASHES[field_type]
+
+    lines = [
+        f'<line x1="{x}" y1="0" x2="{x}" y2="{height}"/>'
+        for x in range(YARDLINE_STEPS, width, YARDLINE_STEPS)
+    ]
+    lines.extend(
+        f'<line x1="{x - 1}" y1="{y}" x2="{x + 1}" y2="{y}"/>'
+        for x in range(YARDLINE_STEPS, width, YARDLINE_STEPS)
+        for y in [back_hash, front_hash]
+    )
+    dots = [
+        '<circle cx="{}" cy="{}" r="{}"/>'.format(
+            _format_number(dot['position']['x']),
+            _format_number(dot['position']['y']),
+            DOT_RADIUS,
+        )
+        for dot in formation['dots']
+    ]
+
+    return ''.join([
+        '<svg xmlns="http://www.w3.org/2000/svg" ',
+        f'viewBox="-2 -2 {width + 4} {height + 4}">',
+        f'<rect width="{width}" height="{height}" fill="#fff" ',
+        'stroke="#000" stroke-width="0.5"/>',
+        '<g stroke="#999" stroke-width="0.25">',
+        *lines,
+        '</g><g fill="#000">',
+        *dots,
+        '</g></svg>',
+    ])
+
+
+def _format_number(value):
+    """Format the given coordinate, with at most 2 decimal places."""
+    return f'{value:.2f}'.rstrip('0').rstrip('.')
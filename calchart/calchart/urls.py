@@ -4,7 +4,9 @@ from calchart.views import (
     CalchartView,
     DevView,
     LoginView,
+    ViewpsheetsView,
     export,
+    get_metrics,
 )
 
 from django.conf import settings
@@ -26,6 +28,11 @@ urlpatterns = [
 
     # endpoints for server-side processing
     url(r'^download/(?P<slug>\w+)\.json$', export),
+    url(
+        r'^download/(?P<slug>[\w-]+)/viewpsheets\.(?P<file_type>pdf|zip)$',
+        ViewpsheetsView.as_view(),
+    ),
+    url(r'^metrics\.json$', get_metrics),
 ]
 
 # for development
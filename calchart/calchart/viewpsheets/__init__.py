@@ -0,0 +1,15 @@
+"""
+Generating the viewpsheets of a Show on the server, as PDFs.
+
+A viewpsheet contains the movements of a single dot in every Formation; see
+sheets.py for the layout.
+"""
+
+from .pdf import PDFWriter, Page, write_pdf  # noqa: F401
+from .pipeline import (  # noqa: F401
+    get_dot_ids,
+    iter_pdf,
+    iter_viewpsheets,
+    iter_zip,
+)
+from .sheets import get_settings, get_sheet_data  # noqa: F401
@@ -0,0 +1,273 @@
+"""
+A minimal writer for PDFs of simple vector drawings.
+
+Only lines, circles, rectangles and Helvetica text are supported, which is
+all that a viewpsheet needs. Pages can be written as soon as they are drawn,
+in any order, so a PDF can be streamed while later pages are still being
+drawn.
+"""
+
+import math
+import zlib
+
+# US Letter, in points
+PAGE_WIDTH = 612
+PAGE_HEIGHT = 792
+
+# the number of points in each unit of a Page's coordinates
+UNIT = PAGE_WIDTH / 800
+
+# the control point distance of a Bezier curve approximating a quarter circle
+KAPPA = 4 * (math.sqrt(2) - 1) / 3
+
+# the objects that are always written; page objects start after these
+CATALOG_ID = 1
+PAGES_ID = 2
+FONT_ID = 3
+
+
+class Page(object):
+    """
+    The drawing commands of a page in a PDF.
+
+    Coordinates are in units of 1/800 of the width of the page, with the
+    origin at the top-left corner and the y-axis pointing down, like the SVG
+    viewpsheets.
+    """
+
+    def __init__(self):
+        """Initialize an empty Page."""
+        self._commands = [
+            _format('q {} 0 0 {} 0 {} cm', UNIT, -UNIT, PAGE_HEIGHT),
+        ]
+
+    def line(self, x1, y1, x2, y2, *, width=1, gray=0):
+        """Draw a line between the given points."""
+        self.polyline([(x1, y1), (x2, y2)], width=width, gray=gray)
+
+    def polyline(self, points, *, width=1, gray=0):
+        """Draw lines connecting the given points, in order."""
+        if len(points) < 2:
+            return
+        self._set_stroke(width, gray)
+        (x, y), *points = points
+        self._commands.append(_format('{} {} m', x, y))
+        self._commands.extend(_format('{} {} l', x, y) for x, y in points)
+        self._commands.append('S')
+
+    def dots(self, points, radius, *, gray=0):
+        """Draw filled circles with the given radius at the given points."""
+        if len(points) == 0:
+            return
+        # a line without length and with round caps is drawn as a circle
+        self._commands.append(_format('{} w 1 J {} G', 2 * radius, gray))
+        self._commands.extend(
+            f'{x:.3f} {y:.3f} m {x:.3f} {y:.3f} l' for x, y in points
+        )
+        self._commands.append('S 0 J')
+
+    def draw(self, page):
+        """Draw everything drawn on the given Page onto this Page."""
+        self._commands.extend(page._commands[1:])
+
+    def rect(self, x, y, width, height, *, line_width=1, gray=0):
+        """Draw the outline of a rectangle."""
+        self._set_stroke(line_width, gray)
+        self._commands.append(_format('{} {} {} {} re S', x, y, width, height))
+
+    def circle(self, x, y, radius, *, fill=True, width=1, gray=0):
+        """Draw a circle, filled or outlined."""
+        k = radius * KAPPA
+        self._set_stroke(width, gray)
+        self._commands.extend([
+            _format('{} {} m', x + radius, y),
+            _format(
+                '{} {} {} {} {} {} c',
+                x + radius, y + k, x + k, y + radius, x, y + radius,
+            ),
+            _format(
+                '{} {} {} {} {} {} c',
+                x - k, y + radius, x - radius, y + k, x - radius, y,
+            ),
+            _format(
+                '{} {} {} {} {} {} c',
+                x - radius, y - k, x - k, y - radius, x, y - radius,
+            ),
+            _format(
+                '{} {} {} {} {} {} c',
+                x + k, y - radius, x + radius, y - k, x + radius, y,
+            ),
+            'f' if fill else 'S',
+        ])
+
+    def text(self, x, y, text, *, size=10, align='left'):
+        """
+        Write a line of text with its baseline starting at the given point.
+
+        `align` may be 'left', 'center' or 'right', to align the text to the
+        left, center or right of the point.
+        """
+        content = text.encode('cp1252', errors='replace')
+        if align != 'left':
+            width = get_text_width(text, size)
+            x -= width if align == 'right' else width / 2
+
+        escaped = (
+            content
+            .replace(b'\\', b'\\\\')
+            .replace(b'(', b'\\(')
+            .replace(b')', b'\\)')
+        )
+        self._commands.append(
+            _format('BT /F1 {} Tf 1 0 0 -1 {} {} Tm (', size, x, y) +
+            escaped.decode('latin-1') +
+            ') Tj ET',
+        )
+
+    def to_stream(self):
+        """Get the compressed content stream of the Page."""
+        content = '\n'.join(self._commands + ['Q'])
+        return zlib.compress(content.encode('latin-1'))
+
+    def _set_stroke(self, width, gray):
+        """Set the line width and the gray level of lines and fills."""
+        self._commands.append(_format('{} w {} G {} g', width, gray, gray))
+
+
+class PDFWriter(object):
+    """
+    Writes a PDF, one chunk at a time.
+
+    Usage:
+    writer = PDFWriter()
+    yield writer.start()
+    yield writer.add_page(page.to_stream(), 0)
+    yield writer.finish()
+    """
+
+    def __init__(self):
+        """Initialize the writer."""
+        self._size = 0
+        self._object_offsets = {}
+        self._next_id = FONT_ID + 1
+        # (index, object ID) of each page, to sort in `finish`
+        self._pages = []
+
+    def start(self):
+        """Get the start of the PDF."""
+        return self._write(
+            b'%PDF-1.4\n%\xe2\xe3\xcf\xd3\n',
+            self._object(
+                FONT_ID,
+                b'<< /Type /Font /Subtype /Type1 /BaseFont /Helvetica '
+                b'/Encoding /WinAnsiEncoding >>',
+            ),
+        )
+
+    def add_page(self, stream, index):
+        """
+        Get the objects of a page with the given compressed content stream.
+
+        Pages are sorted by `index` when the PDF is finished, so they can be
+        added in any order.
+        """
+        content_id = self._next_id
+        page_id = self._next_id + 1
+        self._next_id += 2
+        self._pages.append((index, page_id))
+
+        return self._write(
+            self._object(
+                content_id,
+                _format(
+                    '<< /Length {} /Filter /FlateDecode >>\nstream\n',
+                    len(stream),
+                ).encode() + stream + b'\nendstream',
+            ),
+            self._object(
+                page_id,
+                _format(
+                    '<< /Type /Page /Parent {} 0 R /MediaBox [0 0 {} {}] '
+                    '/Resources << /Font << /F1 {} 0 R >> >> '
+                    '/Contents {} 0 R >>',
+                    PAGES_ID, PAGE_WIDTH, PAGE_HEIGHT, FONT_ID, content_id,
+                ).encode(),
+            ),
+        )
+
+    def finish(self):
+        """Get the end of the PDF, after every page has been added."""
+        kids = ' '.join(
+            f'{page_id} 0 R' for _, page_id in sorted(self._pages)
+        )
+        chunk = self._write(
+            self._object(
+                PAGES_ID,
+                _format(
+                    '<< /Type /Pages /Kids [{}] /Count {} >>',
+                    kids, len(self._pages),
+                ).encode(),
+            ),
+            self._object(
+                CATALOG_ID,
+                _format('<< /Type /Catalog /Pages {} 0 R >>', PAGES_ID)
+                .encode(),
+            ),
+        )
+
+        num_objects = self._next_id
+        xref = [
+            _format('xref\n0 {}\n', num_objects),
+            '0000000000 65535 f \n',
+        ]
+        xref.extend(
+            f'{self._object_offsets[object_id]:010d} 00000 n \n'
+            for object_id in range(1, num_objects)
+        )
+        xref.append(_format(
+            'trailer\n<< /Size {} /Root {} 0 R >>\nstartxref\n{}\n%%EOF\n',
+            num_objects, CATALOG_ID, self._size,
+        ))
+        return chunk + ''.join(xref).encode()
+
+    def _object(self, object_id, content):
+        """Get an object, to be passed to `_write`."""
+        return object_id, _format('{} 0 obj\n', object_id).encode() + (
+            content + b'\nendobj\n'
+        )
+
+    def _write(self, *parts):
+        """Join the given bytes and objects, recording where objects start."""
+        chunk = b''
+        for part in parts:
+            if isinstance(part, tuple):
+                object_id, part = part
+                self._object_offsets[object_id] = self._size + len(chunk)
+            chunk += part
+        self._size += len(chunk)
+        return chunk
+
+
+def write_pdf(streams):
+    """Get a PDF with the given compressed content streams as its pages."""
+    writer = PDFWriter()
+    chunks = [writer.start()]
+    chunks.extend(
+        writer.add_page(stream, i) for i, stream in enumerate(streams)
+    )
+    chunks.append(writer.finish())
+    return b''.join(chunks)
+
+
+def get_text_width(text, size):
+    """Estimate the width of the given text in Helvetica."""
+    # the average width of a Helvetica character is about half its size
+    return len(text) * size * 0.5
+
+
+def _format(template, *values):
+    """Format the given numbers for a PDF, with 3 decimal places."""
+    return template.format(*(
+        f'{value:.3f}' if isinstance(value, float) else value
+        for value in values
+    ))
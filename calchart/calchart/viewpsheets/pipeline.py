@@ -0,0 +1,159 @@
+"""
+Drawing the viewpsheets of many dots at once, and streaming the result.
+
+The viewpsheets are drawn in a pool of VIEWPSHEET_WORKERS threads (or
+processes, if VIEWPSHEET_EXECUTOR is 'process'), shared by every request in
+this process, and each dot's pages are written to the response as soon as
+they are drawn.
+"""
+
+import threading
+import zipfile
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+
+from django.conf import settings
+
+from .pdf import PDFWriter, write_pdf
+from .sheets import render_dots
+
+# the number of dots to draw in each task
+DOTS_PER_TASK = 8
+
+# the pools that draw viewpsheets, by executor and number of workers
+_executors = {}
+_executors_lock = threading.Lock()
+
+
+def get_dot_ids(data, *, group=None, dot_ids=None):
+    """
+    Get the IDs of the dots to draw viewpsheets for.
+
+    Returns every dot in the serialized Show, only the dots in the given dot
+    group in any Formation, or only the given dots. Raises a KeyError if the
+    group or any dot does not exist.
+    """
+    all_dot_ids = [dot['id'] for dot in data.get('dots', [])]
+
+    if group is not None:
+        if group not in data.get('dotGroups', {}):
+            raise KeyError(f'Dot group does not exist: {group}')
+        in_group = {
+            formation_dot['dot']
+            for formation in data.get('formations', [])
+            for formation_dot in formation['dots']
+            if formation_dot.get('dotGroup') == group
+        }
+        return [dot_id for dot_id in all_dot_ids if dot_id in in_group]
+    elif dot_ids is not None:
+        missing = set(dot_ids) - set(all_dot_ids)
+        if missing:
+            raise KeyError(f'Dots do not exist: {", ".join(sorted(missing))}')
+        return dot_ids
+    else:
+        return all_dot_ids
+
+
+def iter_viewpsheets(common, dots, viewpsheet_settings):
+    """
+    Draw the viewpsheets of the given dots in the pool.
+
+    Takes the result of get_sheet_data and yields the index of each dot and
+    the compressed content streams of its pages, in the order that they
+    finish.
+    """
+    workers = settings.VIEWPSHEET_WORKERS
+    executor = _get_executor(settings.VIEWPSHEET_EXECUTOR, workers)
+
+    pending = set()
+    try:
+        for start in range(0, len(dots), DOTS_PER_TASK):
+            task = (
+                common, dots[start:start + DOTS_PER_TASK], viewpsheet_settings,
+            )
+            pending.add(executor.submit(render_dots, task))
+
+            # only send a few tasks ahead of the tasks being written
+            if len(pending) >= 2 * workers:
+                done, pending = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    yield from future.result()
+
+        for future in as_completed(pending):
+            yield from future.result()
+    finally:
+        # don't leave the tasks of an abandoned response in the shared pool
+        for future in pending:
+            future.cancel()
+
+
+def _get_executor(executor, workers):
+    """Get the shared pool with the given executor and number of workers."""
+    key = (executor, workers)
+    with _executors_lock:
+        if key not in _executors:
+            if executor == 'process':
+                executor_class = ProcessPoolExecutor
+            else:
+                executor_class = ThreadPoolExecutor
+            _executors[key] = executor_class(max_workers=workers)
+        return _executors[key]
+
+
+def iter_pdf(viewpsheets):
+    """
+    Stream the given viewpsheets as a single PDF.
+
+    Takes the result of iter_viewpsheets. The pages are sorted by dot, even
+    though they are written in the order that they finish.
+    """
+    writer = PDFWriter()
+    yield writer.start()
+    for index, streams in viewpsheets:
+        for page, stream in enumerate(streams):
+            yield writer.add_page(stream, (index, page))
+    yield writer.finish()
+
+
+def iter_zip(viewpsheets, names):
+    """
+    Stream the given viewpsheets as a ZIP file with a PDF for each dot.
+
+    Takes the result of iter_viewpsheets, and the file name of each dot's
+    PDF, by index.
+    """
+    buffer = _StreamBuffer()
+    with zipfile.ZipFile(buffer, 'w') as f:
+        for index, streams in viewpsheets:
+            # the content streams are already compressed
+            f.writestr(names[index], write_pdf(streams))
+            yield buffer.read_all()
+    yield buffer.read_all()
+
+
+class _StreamBuffer(object):
+    """A file-like object that collects what is written until it is read."""
+
+    def __init__(self):
+        """Initialize an empty buffer."""
+        self._chunks = []
+
+    def write(self, data):
+        """Add the given bytes to the buffer."""
+        self._chunks.append(bytes(data))
+        return len(data)
+
+    def flush(self):
+        """Do nothing, since the buffer is read with read_all."""
+        pass
+
+    def read_all(self):
+        """Get and remove everything written since the last read."""
+        chunk = b''.join(self._chunks)
+        self._chunks = []
+        return chunk
@@ -0,0 +1,429 @@
+"""
+Drawing the viewpsheets of each dot in a Show.
+
+The pages of a viewpsheet are laid out like the old Javascript viewpsheets
+(see old/src/utils/ViewpsheetUtils.js): first, birds eye graphs of every
+Formation, then one quadrant per Formation with its movements, the path of
+the dot, and the dots nearby.
+"""
+
+import math
+
+import numpy as np
+
+from .pdf import Page
+
+# see ViewpsheetController in the old Javascript
+DEFAULT_SETTINGS = {
+    # 'east' to draw east up, or 'west' to draw west up
+    'pathOrientation': 'west',
+    'nearbyOrientation': 'west',
+    'birdsEyeOrientation': 'west',
+    # if True, Formations go left to right; else top to bottom
+    'layoutLeftRight': True,
+}
+
+# dots within this many steps are drawn in the nearby dots graph
+NEARBY_DISTANCE = 4
+
+# see old/src/utils/ViewpsheetUtils.js
+PAGE_WIDTH = 800
+PAGE_HEIGHT = PAGE_WIDTH * 11 / 8.5
+PAGE_MARGIN = PAGE_WIDTH / 34
+WIDGET_MARGIN = 5
+QUADRANT_WIDTH = PAGE_WIDTH / 2 - PAGE_MARGIN * 2
+QUADRANT_HEIGHT = PAGE_HEIGHT / 2 - PAGE_MARGIN * 2
+TITLE_LABEL_SIZE = 24
+SHEET_LABEL_SIZE = 24
+TEXT_SIZE = 10
+LEFT_RIGHT_QUADRANTS = [
+    (PAGE_MARGIN, PAGE_MARGIN),
+    (PAGE_WIDTH / 2 + PAGE_MARGIN, PAGE_MARGIN),
+    (PAGE_MARGIN, PAGE_HEIGHT / 2 + PAGE_MARGIN),
+    (PAGE_WIDTH / 2 + PAGE_MARGIN, PAGE_HEIGHT / 2 + PAGE_MARGIN),
+]
+TOP_BOTTOM_QUADRANTS = [LEFT_RIGHT_QUADRANTS[i] for i in [0, 2, 1, 3]]
+BIRDS_EYE_PER_COLUMN = 6
+
+# the label of each direction, by Calchart degrees; see Direction.js
+DIRECTIONS = ['E', 'SE', 'S', 'SW', 'W', 'NW', 'N', 'NE']
+
+
+def get_settings(settings):
+    """Get the given viewpsheet settings, with the defaults filled in."""
+    return dict(DEFAULT_SETTINGS, **{
+        key: value
+        for key, value in settings.items()
+        if key in DEFAULT_SETTINGS
+    })
+
+
+def get_sheet_data(data, timeline, dot_ids):
+    """
+    Get the data needed to draw the viewpsheets of the given dots.
+
+    `data` is the serialized Show and `timeline` is its DenseTimeline.
+    Returns a tuple of the data shared by every viewpsheet, and a list of
+    the data of each dot. Each is small enough to send to another process.
+    """
+    formations = data.get('formations', [])
+    formation_beats = timeline.formation_beats
+    labels = {dot['id']: dot['label'] for dot in data.get('dots', [])}
+    dot_labels = [labels.get(dot_id) for dot_id in timeline.dot_ids]
+    indices = {dot_id: i for i, dot_id in enumerate(timeline.dot_ids)}
+
+    positions = timeline.positions[..., :2]
+    rows = [
+        min(math.ceil(beat), len(positions) - 1) for beat in formation_beats
+    ]
+    birds_eye = np.asarray(positions[rows[:-1]], dtype=np.float64)
+
+    common = {
+        'show': data.get('name', ''),
+        'sheets': [
+            {
+                'name': formation['name'],
+                'beats': formation_beats[i + 1] - formation_beats[i],
+            }
+            for i, formation in enumerate(formations)
+        ],
+        'birdsEye': birds_eye,
+        'bounds': _get_bounds(birds_eye.reshape(-1, 2), padding=4),
+    }
+
+    # the dots near each of the given dots at the start of each Formation,
+    # by Formation, then by dot
+    dots = np.array([indices[dot_id] for dot_id in dot_ids], dtype=np.int64)
+    nearby = []
+    for start in birds_eye:
+        with np.errstate(invalid='ignore'):
+            distances = np.hypot(
+                start[dots, np.newaxis, 0] - start[np.newaxis, :, 0],
+                start[dots, np.newaxis, 1] - start[np.newaxis, :, 1],
+            )
+        dot_indices, others = np.nonzero(distances <= NEARBY_DISTANCE)
+        splits = np.searchsorted(dot_indices, np.arange(1, len(dots)))
+        nearby.append([
+            list(zip(others.tolist(), start[others].tolist()))
+            for others in np.split(others, splits)
+        ])
+
+    # the movements of each dot in each Formation
+    movements = [{} for _ in formations]
+    for i, formation in enumerate(formations):
+        if len(formation['flows']) == 0:
+            continue
+        flow_dots = formation['flows'][0]['dots']
+        for formation_dot in formation['dots']:
+            flow_dot = flow_dots.get(formation_dot['id'])
+            if formation_dot['dot'] is not None and flow_dot is not None:
+                movements[i][formation_dot['dot']] = flow_dot['movements']
+
+    result = []
+    for j, d in enumerate(dots.tolist()):
+        sheets = []
+        dot_positions = positions[:, d].tolist()
+        for i in range(len(formations)):
+            path = [
+                position
+                for position in dot_positions[rows[i]:rows[i + 1] + 1]
+                if not math.isnan(position[0])
+            ]
+            nearby_dots = [
+                (dot_labels[other], x, y)
+                for other, (x, y) in nearby[i][j]
+                if other != d
+            ]
+            sheets.append({
+                'movements': [
+                    describe_movement(movement)
+                    for movement in movements[i].get(timeline.dot_ids[d], [])
+                ],
+                'path': _remove_repeats(path),
+                'nearby': nearby_dots,
+            })
+        result.append({
+            'index': d,
+            'label': dot_labels[d],
+            'sheets': sheets,
+        })
+
+    return common, result
+
+
+def describe_movement(movement):
+    """Describe the given serialized movement, e.g. 'Move 4 E'."""
+    duration = movement['duration']
+    dx = movement['endX'] - movement['startX']
+    dy = movement['endY'] - movement['startY']
+    if dx == 0 and dy == 0:
+        verb = 'Mark time' if movement.get('isMarkTime', True) else 'Close'
+        return f'{verb} {duration:g}'
+
+    steps = duration / movement['beatsPerStep']
+    # Calchart degrees go clockwise from east, where +x is north and +y is
+    # east; see docs/Coordinate_System.md
+    angle = math.degrees(math.atan2(-dx, dy)) % 360
+    direction = DIRECTIONS[round(angle / 45) % 8]
+    return f'Move {steps:g} {direction}'
+
+
+def render_dots(task):
+    """
+    Draw the viewpsheets of the given dots.
+
+    `task` is a tuple of the data shared by every viewpsheet and a list of
+    the data of each dot (see get_sheet_data), and the viewpsheet settings.
+    Returns a list of each dot's index and the compressed content streams
+    of its pages.
+    """
+    common, dots, settings = task
+    # the parts of the pages that are the same for every dot
+    cache = {}
+    return [
+        (dot['index'], [page.to_stream() for page in draw_viewpsheet(
+            common, dot, settings, cache,
+        )])
+        for dot in dots
+    ]
+
+
+def draw_viewpsheet(common, dot, settings, cache=None):
+    """
+    Get the Pages of the viewpsheet of the given dot.
+
+    If a `cache` dictionary is given, the parts of the pages that don't
+    depend on the dot are saved in it, to reuse for the next dot.
+    """
+    if cache is None:
+        cache = {}
+    pages = []
+    title = f'{common["show"]}: {dot["label"]}'
+    num_sheets = len(common['sheets'])
+
+    # the birds eye graphs, in two columns on each page
+    per_page = 2 * BIRDS_EYE_PER_COLUMN
+    graph_width = QUADRANT_WIDTH + 2 * PAGE_MARGIN
+    graph_height = (
+        (PAGE_HEIGHT - 2 * PAGE_MARGIN - TITLE_LABEL_SIZE) /
+        BIRDS_EYE_PER_COLUMN
+    )
+    for first in range(0, num_sheets, per_page):
+        page = Page()
+        page.text(
+            PAGE_WIDTH / 2, PAGE_MARGIN + TITLE_LABEL_SIZE, title,
+            size=TITLE_LABEL_SIZE, align='center',
+        )
+        for i in range(first, min(first + per_page, num_sheets)):
+            column, row = divmod(i - first, BIRDS_EYE_PER_COLUMN)
+            x = PAGE_MARGIN + column * graph_width
+            y = PAGE_MARGIN + TITLE_LABEL_SIZE + row * graph_height
+            page.text(x, y + graph_height / 2, str(i + 1), size=TEXT_SIZE)
+            _draw_birds_eye(
+                page,
+                (
+                    x + SHEET_LABEL_SIZE,
+                    y + WIDGET_MARGIN,
+                    graph_width - SHEET_LABEL_SIZE - 2 * PAGE_MARGIN,
+                    graph_height - 2 * WIDGET_MARGIN,
+                ),
+                common,
+                i,
+                dot['index'],
+                settings['birdsEyeOrientation'] == 'east',
+                cache,
+            )
+        pages.append(page)
+
+    # the quadrant of each Formation, four on each page
+    if settings['layoutLeftRight']:
+        quadrants = LEFT_RIGHT_QUADRANTS
+    else:
+        quadrants = TOP_BOTTOM_QUADRANTS
+    for first in range(0, num_sheets, 4):
+        page = Page()
+        page.text(PAGE_MARGIN, PAGE_MARGIN - WIDGET_MARGIN, title)
+        for i in range(first, min(first + 4, num_sheets)):
+            x, y = quadrants[i - first]
+            _draw_quadrant(
+                page, x, y, common['sheets'][i], dot['sheets'][i], settings,
+            )
+        pages.append(page)
+
+    return pages
+
+
+def _draw_quadrant(page, x, y, sheet, dot_sheet, settings):
+    """Draw the quadrant of a Formation at the given point."""
+    page.text(
+        x, y + SHEET_LABEL_SIZE, sheet['name'], size=SHEET_LABEL_SIZE,
+    )
+    page.text(
+        x + QUADRANT_WIDTH, y + SHEET_LABEL_SIZE,
+        f'{sheet["beats"]:g} beats', size=TEXT_SIZE, align='right',
+    )
+
+    # the movements, then the path and nearby dots graphs
+    height = QUADRANT_HEIGHT - SHEET_LABEL_SIZE
+    top = y + SHEET_LABEL_SIZE + WIDGET_MARGIN
+    line_height = TEXT_SIZE + 2
+    max_lines = int(height / 5 // line_height)
+    for i, description in enumerate(dot_sheet['movements'][:max_lines]):
+        page.text(x, top + (i + 1) * line_height, description)
+
+    top += height / 5
+    graph_height = height * 2 / 5 - 2 * WIDGET_MARGIN
+    _draw_path(
+        page, (x, top, QUADRANT_WIDTH, graph_height), dot_sheet['path'],
+        settings['pathOrientation'] == 'east',
+    )
+
+    top += height * 2 / 5
+    _draw_nearby(
+        page, (x, top, QUADRANT_WIDTH, graph_height), dot_sheet,
+        settings['nearbyOrientation'] == 'east',
+    )
+
+
+def _draw_birds_eye(page, box, common, sheet, dot, is_east, cache):
+    """Draw every dot in a Formation, highlighting the given dot."""
+    key = ('birdsEye', sheet, is_east)
+    if key not in cache:
+        background = Page()
+        graph = _Graph(background, box, common['bounds'], is_east)
+        graph.draw_border()
+        graph.dots(common['birdsEye'][sheet], graph.scale / 2, gray=0.6)
+        cache[key] = (background, graph)
+
+    background, graph = cache[key]
+    page.draw(background)
+    graph.page = page
+    graph.dots(common['birdsEye'][sheet][[dot]], graph.scale)
+
+
+def _draw_path(page, box, path, is_east):
+    """Draw the path of a dot in a Formation."""
+    if len(path) == 0:
+        return
+    # at least 16 steps wide, with 2 steps of padding
+    min_x, min_y, max_x, max_y = _get_bounds(np.array(path), padding=2)
+    if max_x - min_x < 16:
+        center = (min_x + max_x) / 2
+        min_x, max_x = center - 8, center + 8
+
+    graph = _Graph(page, box, (min_x, min_y, max_x, max_y), is_east)
+    graph.draw_grid()
+    graph.polyline(path, width=2)
+    graph.circle(*path[0], graph.scale / 2, fill=False)
+    graph.circle(*path[-1], graph.scale / 2)
+
+
+def _draw_nearby(page, box, dot_sheet, is_east):
+    """Draw the dots near a dot at the start of a Formation."""
+    if len(dot_sheet['path']) == 0:
+        return
+    x, y = dot_sheet['path'][0]
+    distance = 2 * NEARBY_DISTANCE
+    bounds = (x - distance, y - distance, x + distance, y + distance)
+
+    graph = _Graph(page, box, bounds, is_east)
+    graph.draw_grid()
+    radius = graph.scale / 2
+    for label, other_x, other_y in dot_sheet['nearby']:
+        graph.circle(other_x, other_y, radius, gray=0.4)
+        graph.text(other_x, other_y, label, offset=radius)
+    graph.circle(x, y, radius)
+
+
+class _Graph(object):
+    """
+    Draws a part of the field in a box on a Page.
+
+    The field is drawn with west up (the y-axis pointing down the page), or
+    rotated 180 degrees if east is up.
+    """
+
+    def __init__(self, page, box, bounds, is_east):
+        """Initialize the graph of the given bounds, in steps."""
+        self.page = page
+        self.box = box
+        self.bounds = bounds
+        self.is_east = is_east
+
+        x, y, width, height = box
+        min_x, min_y, max_x, max_y = bounds
+        # the number of units in each step
+        self.scale = min(
+            width / max(max_x - min_x, 1), height / max(max_y - min_y, 1),
+        )
+        self._center = ((min_x + max_x) / 2, (min_y + max_y) / 2)
+        self._box_center = (x + width / 2, y + height / 2)
+
+    def to_page(self, x, y):
+        """Convert the given field coordinates into page coordinates."""
+        sign = -1 if self.is_east else 1
+        return (
+            self._box_center[0] + sign * (x - self._center[0]) * self.scale,
+            self._box_center[1] + sign * (y - self._center[1]) * self.scale,
+        )
+
+    def draw_border(self):
+        """Draw the border of the graph."""
+        self.page.rect(*self.box, line_width=0.5)
+
+    def draw_grid(self):
+        """Draw the border of the graph and a line every 4 steps."""
+        self.draw_border()
+        min_x, min_y, max_x, max_y = self.bounds
+        for x in range(math.ceil(min_x / 4) * 4, math.floor(max_x) + 1, 4):
+            self.page.line(
+                *self.to_page(x, min_y), *self.to_page(x, max_y),
+                width=0.5, gray=0.8,
+            )
+        for y in range(math.ceil(min_y / 4) * 4, math.floor(max_y) + 1, 4):
+            self.page.line(
+                *self.to_page(min_x, y), *self.to_page(max_x, y),
+                width=0.5, gray=0.8,
+            )
+
+    def polyline(self, points, **kwargs):
+        """Draw lines connecting the given field coordinates."""
+        self.page.polyline([self.to_page(x, y) for x, y in points], **kwargs)
+
+    def dots(self, points, radius, **kwargs):
+        """Draw filled circles at the given array of field coordinates."""
+        points = points[~np.isnan(points[:, 0])]
+        x, y = self.to_page(points[:, 0], points[:, 1])
+        self.page.dots(list(zip(x.tolist(), y.tolist())), radius, **kwargs)
+
+    def circle(self, x, y, radius, **kwargs):
+        """Draw a circle at the given field coordinates."""
+        self.page.circle(*self.to_page(x, y), radius, **kwargs)
+
+    def text(self, x, y, text, *, offset=0):
+        """Write a label above and to the left of the given coordinates."""
+        page_x, page_y = self.to_page(x, y)
+        self.page.text(
+            page_x - offset, page_y - offset, text, size=TEXT_SIZE * 0.8,
+            align='right',
+        )
+
+
+def _get_bounds(points, padding):
+    """Get the (min x, min y, max x, max y) of the given points."""
+    points = points[~np.isnan(points[:, 0])]
+    if len(points) == 0:
+        return (0, 0, 1, 1)
+    min_x, min_y = points.min(axis=0).tolist()
+    max_x, max_y = points.max(axis=0).tolist()
+    return (
+        min_x - padding, min_y - padding, max_x + padding, max_y + padding,
+    )
+
+
+def _remove_repeats(points):
+    """Remove the points that are the same as the previous point."""
+    return [
+        point for i, point in enumerate(points)
+        if i == 0 or point != points[i - 1]
+    ]
@@ -1,34 +1,187 @@
 """Views for the base app."""
 
-import json
+from calendar import timegm
 
 from calchart import actions
+from calchart.dispatch import run_action, run_batch
 from calchart.mixins import LoginRequiredMixin
 from calchart.models import Show, User
+from calchart.viewpsheets import (
+    get_dot_ids,
+    get_settings,
+    get_sheet_data,
+    iter_pdf,
+    iter_viewpsheets,
+    iter_zip,
+)
 
 from django.conf import settings
 from django.contrib.auth import login
-from django.http.response import Http404, HttpResponse, JsonResponse
+from django.http.response import (
+    Http404,
+    HttpResponse,
+    StreamingHttpResponse,
+)
 from django.middleware.csrf import get_token
-from django.shortcuts import redirect
+from django.shortcuts import get_object_or_404, redirect
+from django.utils.cache import get_conditional_response
 from django.utils.decorators import method_decorator
+from django.utils.http import http_date, quote_etag
 from django.views.decorators.csrf import csrf_exempt
 from django.views.generic import RedirectView, TemplateView, View
 
+from utils import codec, metrics
 from utils.api import get_login_url
+from utils.http import (
+    JsonResponse,
+    RangeNotSatisfiable,
+    choose_encoding,
+    iter_encoded,
+    iter_file,
+    parse_range,
+)
+from utils.storage import get_blob_compression
 
 """ ENDPOINTS """
 
 
 def export(request, slug):
-    """Return a JSON file to be downloaded automatically."""
-    show = Show.objects.get(slug=slug)
-    response = HttpResponse(show.data_file.read())
-    response['Content-Disposition'] = f'attachment; filename={slug}.json'
+    """
+    Return a JSON file to be downloaded automatically.
+
+    The file is streamed from storage. Supports conditional requests
+    (ETag and Last-Modified), single byte ranges, and compressing the file
+    with any of EXPORT_ENCODINGS accepted by the client. A data file saved
+    with gzip is sent without decompressing it, if the client accepts gzip.
+    """
+    show = get_object_or_404(Show, slug=slug)
+
+    encoding = choose_encoding(request, settings.EXPORT_ENCODINGS)
+    if (
+        'gzip' in settings.EXPORT_ENCODINGS and
+        get_blob_compression(show.data_file.name) == 'gzip' and
+        choose_encoding(request, ['gzip']) == 'gzip'
+    ):
+        encoding = 'gzip'
+    etag = show.get_data_etag()
+    if encoding is not None:
+        etag = f'{etag}-{encoding}'
+    etag = quote_etag(etag)
+    last_modified = timegm(show.date_modified.utctimetuple())
+
+    response = get_conditional_response(
+        request, etag=etag, last_modified=last_modified,
+    )
+    if response is None:
+        response = _stream_show(request, show, etag, encoding)
+
+    response['ETag'] = etag
+    response['Last-Modified'] = http_date(last_modified)
+    response['Vary'] = 'Accept-Encoding'
+
+    return response
+
+
+def _stream_show(request, show, etag, encoding):
+    """Create the response streaming the given show for export."""
+    f = show.open_data_gzip() if encoding == 'gzip' else None
+
+    if f is not None:
+        response = StreamingHttpResponse(iter_file(f))
+        response['Content-Length'] = f.size
+        response['Content-Encoding'] = encoding
+    elif encoding is not None:
+        f = show.open_data_json()
+        response = StreamingHttpResponse(iter_encoded(iter_file(f), encoding))
+        response['Content-Encoding'] = encoding
+    else:
+        f = show.open_data_json()
+        byte_range = None
+        if request.META.get('HTTP_IF_RANGE', etag) == etag:
+            header = request.META.get('HTTP_RANGE')
+            try:
+                byte_range = parse_range(header, f.size)
+            except RangeNotSatisfiable:
+                f.close()
+                response = HttpResponse(status=416)
+                response['Content-Range'] = f'bytes */{f.size}'
+                return response
+
+        if byte_range is None:
+            response = StreamingHttpResponse(iter_file(f))
+            response['Content-Length'] = f.size
+        else:
+            start, end = byte_range
+            response = StreamingHttpResponse(iter_file(f, start, end))
+            response.status_code = 206
+            response['Content-Length'] = end - start + 1
+            response['Content-Range'] = f'bytes {start}-{end}/{f.size}'
+
+        response['Accept-Ranges'] = 'bytes'
 
+    response['Content-Type'] = 'application/json'
+    response['Content-Disposition'] = f'attachment; filename={show.slug}.json'
     return response
 
 
+class ViewpsheetsView(LoginRequiredMixin, View):
+    """
+    Return the viewpsheets of the dots in a show, to be downloaded.
+
+    `file_type` is 'pdf' for a single PDF, or 'zip' for a ZIP file with a
+    PDF for each dot. The viewpsheets are drawn with the user's
+    viewpsheet_settings, for every dot, or only the dots in the `group` dot
+    group or in the comma-separated `dots` in the GET parameters. Each dot is
+    streamed as soon as it is drawn.
+    """
+
+    def get(self, request, slug, file_type):
+        """Handle a GET request."""
+        show = actions._retrieve_show(slug, request.user)
+        data = show.get_data()
+
+        dot_ids = request.GET.get('dots')
+        try:
+            dot_ids = get_dot_ids(
+                data,
+                group=request.GET.get('group'),
+                dot_ids=None if dot_ids is None else dot_ids.split(','),
+            )
+        except KeyError as e:
+            raise Http404(e.args[0])
+
+        user_settings = codec.loads(request.user.viewpsheet_settings)
+        common, dots = get_sheet_data(data, show.get_timeline(), dot_ids)
+        results = iter_viewpsheets(common, dots, get_settings(user_settings))
+
+        if file_type == 'pdf':
+            response = StreamingHttpResponse(iter_pdf(results))
+            response['Content-Type'] = 'application/pdf'
+        else:
+            names = {dot['index']: f'{dot["label"]}.pdf' for dot in dots}
+            response = StreamingHttpResponse(iter_zip(results, names))
+            response['Content-Type'] = 'application/zip'
+
+        filename = f'{show.slug}-viewpsheets.{file_type}'
+        response['Content-Disposition'] = f'attachment; filename={filename}'
+        return response
+
+
+def get_metrics(request):
+    """
+    Return the metrics recorded by this process, for superusers.
+
+    See utils/metrics.py and calchart/dispatch.py.
+    """
+    if not request.user.is_superuser:
+        raise Http404
+
+    return JsonResponse({
+        'counters': metrics.get_counters(),
+        'histograms': metrics.get_histograms(),
+    })
+
+
 """ VIEWS """
 
 
@@ -68,6 +221,7 @@ class LoginView(RedirectView):
         ttl_days = int(self.request.GET['ttl_days'])
 
         user, _ = User.objects.get_or_create(username=username)
+        user.clear_committee_cache()
         user.api_token = api_token
         user.set_expiry(ttl_days)
         user.save()
@@ -88,49 +242,49 @@ class CalchartView(LoginRequiredMixin, TemplateView):
     def get(self, request, *args, **kwargs):
         """Handle a GET request, either for the page or for tab data."""
         if 'tab' in request.GET:
-            shows = self.get_tab(request.GET['tab'])
-            return JsonResponse({
-                'shows': [
-                    {
-                        'slug': show.slug,
-                        'name': show.name,
-                        'published': show.published,
-                    }
-                    for show in shows
-                ],
-            })
+            response = actions.get_tab(
+                data=request.GET.dict(),
+                user=request.user,
+                request=request,
+            )
+            return JsonResponse(response)
         else:
             return super().get(request, *args, **kwargs)
 
     def post(self, request, *args, **kwargs):
-        """Handle POST actions from sendAction."""
+        """
+        Handle POST actions from sendAction, or batches from sendActions.
+
+        If the body of the request is JSON, the action and its data are
+        sent in the query string instead, so that the action can read the
+        body as a stream (see actions.save_show).
+        """
+        if request.content_type == 'application/json':
+            return run_action(
+                request.GET.get('action', ''),
+                codec.dumps(request.GET.dict()),
+                user=request.user,
+                request=request,
+            )
+
+        if 'batch' in request.POST:
+            return run_batch(
+                request.POST['batch'],
+                user=request.user,
+                request=request,
+            )
+
         try:
             action = request.POST['action']
         except KeyError:
             return super().post(request, *args, **kwargs)
 
-        if hasattr(actions, action):
-            try:
-                data = json.loads(request.POST['data'])
-                response = getattr(actions, action)(
-                    data=data,
-                    user=request.user,
-                    request=request,
-                )
-            except Exception as e:
-                status = 404 if isinstance(e, Http404) else 500
-                return JsonResponse({
-                    'message': str(e),
-                }, status=status)
-        else:
-            return JsonResponse({
-                'message': f'Action does not exist: {action}',
-            }, status=500)
-
-        if response is None:
-            return JsonResponse({})
-        else:
-            return JsonResponse(response)
+        return run_action(
+            action,
+            request.POST.get('data', ''),
+            user=request.user,
+            request=request,
+        )
 
     def get_context_data(self, **kwargs):
         """Get the context data for the template."""
@@ -1,6 +1,7 @@
 """Django settings for Calchart."""
 
 import os
+import tempfile
 
 BASE_DIR = os.path.dirname(os.path.dirname(__file__))
 assert os.path.exists(os.path.join(BASE_DIR, 'manage.py'))
@@ -66,3 +67,88 @@ LOGOUT_REDIRECT_URL = 'login'
 LOGOUT_URL = 'logout'
 
 MEMBERS_ONLY_DOMAIN = None
+
+# committees checked if the Members Only batch endpoint is not available
+MEMBERS_ONLY_COMMITTEES = ['STUNT']
+
+# number of seconds to cache committee memberships across requests
+MEMBERS_ONLY_CACHE_TTL = 300
+
+# connection pooling for the Members Only API; see utils.api.get_session
+MEMBERS_ONLY_POOL_SIZE = 10
+MEMBERS_ONLY_RETRIES = 2
+MEMBERS_ONLY_BACKOFF = 0.1
+
+# number of seconds to wait for the Members Only API, overridable per endpoint
+MEMBERS_ONLY_TIMEOUT = 1
+MEMBERS_ONLY_TIMEOUTS = {}
+
+# number of patches from save_show to keep before compacting a Show's data
+SHOW_PATCH_LIMIT = 20
+
+# where to save Show data: 'file' to save a JSON file in MediaStorage, or
+# 'database' to save it in the Show.data column (JSONB on PostgreSQL)
+SHOW_DATA_STORAGE = 'file'
+
+# how to compress Show data files: None, 'gzip', or 'zstd' (only if the
+# zstandard package is installed; otherwise gzip). Files saved with any
+# compression can be read; see the compress_shows command
+SHOW_DATA_COMPRESSION = 'gzip'
+
+# the revision history of each Show (see ShowRevision) saves the entire data
+# every SHOW_REVISION_KEYFRAME_INTERVAL revisions, and the changes from the
+# previous revision otherwise; restoring a revision takes at most that many
+# steps. Revisions are kept while they are among the last SHOW_REVISION_LIMIT
+# revisions and are at most SHOW_REVISION_MAX_AGE_DAYS days old
+SHOW_REVISION_KEYFRAME_INTERVAL = 20
+SHOW_REVISION_LIMIT = 200
+SHOW_REVISION_MAX_AGE_DAYS = 90
+
+# content encodings to compress exported shows with, in order of preference;
+# 'br' is only used if the brotli package is installed
+EXPORT_ENCODINGS = ['br', 'gzip']
+
+# the pool used to update Shows in utils.db.UpdateShowVersion; either
+# 'thread' or 'process'
+SHOW_MIGRATION_EXECUTOR = 'thread'
+SHOW_MIGRATION_WORKERS = 4
+
+# the number of threads to scan groups of beats on in check_collisions
+COLLISION_CHECK_WORKERS = 4
+
+# the pool used to draw viewpsheets in calchart.viewpsheets, shared by every
+# request in a process; either 'thread' or 'process'
+VIEWPSHEET_EXECUTOR = 'thread'
+VIEWPSHEET_WORKERS = 4
+
+# the number of Shows that can wait for their thumbnails to be rendered in
+# the background; see Show.request_thumbnails
+THUMBNAIL_MAX_REQUESTS = 100
+
+# where DenseTimelines are downloaded to, so that they can be memory-mapped,
+# if the media storage is not on the local file system (e.g. S3), and the
+# number of them to keep there
+TIMELINE_CACHE_DIR = os.path.join(tempfile.gettempdir(), 'calchart-timelines')
+TIMELINE_CACHE_FILES = 100
+
+# the number of beats that the positions can be requested for at once in
+# actions.get_positions
+POSITIONS_MAX_BEATS = 1000
+
+# the number of seconds the run_jobs worker waits between checking for Jobs
+JOB_POLL_INTERVAL = 1
+
+# a running Job saves a heartbeat every JOB_HEARTBEAT_INTERVAL seconds; a Job
+# without a heartbeat for JOB_TIMEOUT seconds (e.g. its worker was killed) is
+# queued again, and fails after being claimed JOB_MAX_ATTEMPTS times
+JOB_HEARTBEAT_INTERVAL = 30
+JOB_TIMEOUT = 300
+JOB_MAX_ATTEMPTS = 3
+
+# the number of threads running concurrent actions in a batch; see
+# calchart/dispatch.py
+ACTION_BATCH_WORKERS = 4
+
+# the libraries to encode and decode JSON with, in order of preference; the
+# first one that is installed is used. See utils/codec.py
+JSON_BACKENDS = ['orjson', 'ujson', 'json']
@@ -49,3 +49,22 @@ EMAIL_USE_TLS = True
 DEFAULT_FROM_EMAIL = 'Calchart <calband-compcomm@lists.berkeley.edu>'
 
 MEMBERS_ONLY_DOMAIN = 'https://members.calband.org/'
+
+# log the metrics of each action to stdout, so they show up in the Heroku
+# logs; see calchart/dispatch.py
+LOGGING = {
+    'version': 1,
+    'disable_existing_loggers': False,
+    'handlers': {
+        'console': {
+            'class': 'logging.StreamHandler',
+        },
+    },
+    'loggers': {
+        'calchart.actions': {
+            'handlers': ['console'],
+            'level': 'INFO',
+            'propagate': False,
+        },
+    },
+}
@@ -1,9 +1,146 @@
 """Tests for POST actions."""
 
+import io
 import json
+import threading
+from contextlib import contextmanager
+from datetime import timedelta
+from unittest import mock
 
-from calchart.models import Show
-from utils.testing import ActionsTestCase, get_user
+from calchart import dispatch
+from calchart.jobs import claim_job, run_job, run_next_job
+from calchart.models import Job, Show
+from calchart.views import CalchartView, export
+
+from django.contrib.auth import get_user_model
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.management import call_command
+from django.test import RequestFactory as DjangoRequestFactory
+from django.test import override_settings
+from django.utils import timezone
+
+from utils import codec
+from utils.storage import read_blob
+from utils.testing import (
+    ActionsTestCase,
+    RequestFactory,
+    get_user,
+    make_show_data,
+)
+
+
+class GetTabTestCase(ActionsTestCase):
+    """Test the get_tab action."""
+
+    def setUp(self):
+        """Create shows to list."""
+        user = get_user()
+        for name in ['Foo', 'Bar', 'Baz']:
+            Show.objects.create(name=name, owner=user)
+        Show.objects.create(name='Band', owner=user, is_band=True)
+        Show.objects.create(
+            name='Old', owner=user, is_band=True, season=2017,
+        )
+
+    def test_get_tab(self):
+        """Test listing the shows in each tab."""
+        result = self.do_action('get_tab', {'tab': 'owned'})
+        names = [show['name'] for show in result['shows']]
+        self.assertEqual(names, ['Foo', 'Bar', 'Baz'])
+        self.assertIsNone(result['next'])
+
+        result = self.do_action('get_tab', {'tab': 'band'})
+        self.assertEqual(result['shows'], [
+            {
+                'slug': 'band',
+                'name': 'Band',
+                'published': False,
+                'thumbnails': None,
+            },
+        ])
+
+    def test_get_tab_paginated(self):
+        """Test getting a tab one page at a time."""
+        data = {'tab': 'owned', 'limit': 2}
+        result = self.do_action('get_tab', data)
+        names = [show['name'] for show in result['shows']]
+        self.assertEqual(names, ['Foo', 'Bar'])
+
+        data['after'] = result['next']
+        result = self.do_action('get_tab', data)
+        names = [show['name'] for show in result['shows']]
+        self.assertEqual(names, ['Baz'])
+        self.assertIsNone(result['next'])
+
+        for limit in [0, -1]:
+            response = self.do_action(
+                'get_tab', {'tab': 'owned', 'limit': limit}, raw=True,
+            )
+            self.assertEqual(response.status_code, 400)
+
+    def test_get_tab_thumbnails(self):
+        """Test that thumbnails are rendered after the first request."""
+        Show.objects.all().delete()
+        data = make_show_data(num_dots=4, num_formations=2)
+        show = Show.objects.create(name=data['name'], owner=get_user())
+        show.save_data(data)
+
+        with self.run_thumbnail_requests() as submit:
+            result = self.do_action('get_tab', {'tab': 'owned'})
+            self.assertIsNone(result['shows'][0]['thumbnails'])
+            self.assertEqual(submit.call_count, 1)
+
+            result = self.do_action('get_tab', {'tab': 'owned'})
+            self.assertEqual(submit.call_count, 1)
+
+        urls = result['shows'][0]['thumbnails']
+        self.assertEqual(len(urls), 2)
+        self.assertNotEqual(urls[0], urls[1])
+
+        storage = show.data_file.storage
+        name = urls[0].replace(storage.base_url, '', 1)
+        with storage.open(name) as f:
+            svg = f.read().decode()
+        self.assertTrue(svg.startswith('<svg'))
+        self.assertEqual(svg.count('<circle'), 4)
+
+        # thumbnails of unchanged formations are not rendered again
+        data['formations'][1]['dots'][0]['position']['x'] = 0
+        show.save_data(data)
+        with mock.patch('calchart.models.render_thumbnail') as render:
+            render.return_value = '<svg/>'
+            show.render_thumbnails()
+        self.assertEqual(render.call_count, 1)
+
+    def test_get_tab_thumbnails_limit(self):
+        """Test that only so many shows can wait for thumbnails."""
+        with self.settings(THUMBNAIL_MAX_REQUESTS=2):
+            with self.run_thumbnail_requests(run=False) as submit:
+                self.do_action('get_tab', {'tab': 'owned'})
+        self.assertEqual(submit.call_count, 2)
+
+    @contextmanager
+    def run_thumbnail_requests(self, *, run=True):
+        """Send requests for thumbnails immediately, to run in this thread."""
+        def submit(func):
+            if run:
+                func()
+            else:
+                submitted.append(func)
+
+        submitted = []
+        with mock.patch(
+            'calchart.models.transaction.on_commit',
+            side_effect=lambda func: func(),
+        ), mock.patch(
+            'calchart.models.submit_in_background', side_effect=submit,
+        ) as mocked:
+            yield mocked
+
+        # finish the requests that were not run
+        for func in submitted:
+            with mock.patch.object(Show, 'render_thumbnails'):
+                func()
 
 
 class CreateShowTestCase(ActionsTestCase):
@@ -61,9 +198,535 @@ class CreateShowTestCase(ActionsTestCase):
 
 
 class PublishShowTestCase(ActionsTestCase):
-    """Test the publish_show action."""
+    """Test the publish_show and publish_shows actions."""
+
+    def setUp(self):
+        """Create a show to publish."""
+        data = CreateShowTestCase.SHOW_DATA.copy()
+        self.slug = self.do_action('create_show', data)['slug']
+
+    def test_publish_show(self):
+        """Test publishing a show without rewriting the data file."""
+        name = Show.objects.get(slug=self.slug).data_file.name
+        self.do_action('publish_show', {'slug': self.slug, 'publish': True})
+
+        show = Show.objects.get(slug=self.slug)
+        self.assertTrue(show.published)
+        self.assertEqual(show.data_file.name, name)
+
+        data = self.do_action('get_show', {'slug': self.slug})['show']
+        self.assertTrue(data['published'])
+
+        response = export(RequestFactory.GET(), self.slug)
+        content = b''.join(response.streaming_content)
+        self.assertTrue(json.loads(content)['published'])
+
+    def test_publish_show_saved_data(self):
+        """Test that `published` in the saved data is not exported."""
+        data = Show.objects.get(slug=self.slug).get_data()
+        self.do_action('save_show', dict(data, published=True))
+
+        response = export(RequestFactory.GET(), self.slug)
+        content = b''.join(response.streaming_content)
+        self.assertEqual(content.count(b'"published"'), 1)
+        self.assertFalse(json.loads(content)['published'])
+
+    def test_unpublish_show(self):
+        """Test unpublishing a show."""
+        self.do_action('publish_show', {'slug': self.slug, 'publish': True})
+        self.do_action('publish_show', {'slug': self.slug, 'publish': False})
+
+        data = self.do_action('get_show', {'slug': self.slug})['show']
+        self.assertFalse(data['published'])
+
+    def test_publish_shows(self):
+        """Test publishing multiple shows at once."""
+        data = dict(CreateShowTestCase.SHOW_DATA, name='Bar')
+        slug = self.do_action('create_show', data)['slug']
+
+        result = self.do_action('publish_shows', {
+            'slugs': [self.slug, slug],
+            'publish': True,
+        })
+        self.assertEqual(result, {'updated': 2})
+        self.assertEqual(Show.objects.filter(published=True).count(), 2)
+
+
+class GetPositionsTestCase(ActionsTestCase):
+    """Test the get_positions action."""
+
+    def test_get_positions(self):
+        """Test getting the positions of every dot at some beats."""
+        data = make_show_data(num_dots=2, num_formations=2)
+        show = Show.objects.create(name=data['name'], owner=get_user())
+        show.save_data(data)
+
+        result = self.do_action('get_positions', {
+            'slug': show.slug,
+            'beats': [0, 9, 100],
+        })
+        self.assertEqual(result['dots'], [dot['id'] for dot in data['dots']])
+        self.assertEqual(result['numBeats'], 10)
+        self.assertEqual(result['positions'], [
+            [[4, 8, 0], [6, 8, 0]],
+            [[5, 8, 0], [7, 8, 0]],
+            [[6, 8, 0], [8, 8, 0]],
+        ])
+
+        result = self.do_action('get_positions', {
+            'slug': show.slug,
+            'beat': 0,
+        })
+        self.assertEqual(result['positions'], [[[4, 8, 0], [6, 8, 0]]])
+
+        with self.settings(POSITIONS_MAX_BEATS=2):
+            response = self.do_action('get_positions', {
+                'slug': show.slug,
+                'beats': [0, 1, 2],
+            }, raw=True)
+        self.assertEqual(response.status_code, 400)
+
+        for beats in [0, [0, 'a'], [None], [-1], [True]]:
+            response = self.do_action('get_positions', {
+                'slug': show.slug,
+                'beats': beats,
+            }, raw=True)
+            self.assertEqual(response.status_code, 400)
+
+        response = self.do_action('get_positions', {
+            'slug': show.slug,
+        }, raw=True)
+        self.assertEqual(response.status_code, 400)
+
+
+class BatchTestCase(ActionsTestCase):
+    """Test sending several actions in one request."""
+
+    def test_batch(self):
+        """Test that each action in a batch gets its own result."""
+        data = CreateShowTestCase.SHOW_DATA.copy()
+        results = self.do_batch([
+            ('create_show', data),
+            ('get_show', {'slug': 'foo'}),
+            ('get_data', {}),
+            ('get_show', {'slug': 'missing'}),
+        ])
+
+        self.assertEqual(
+            [result['status'] for result in results], [200, 200, 500, 404],
+        )
+        self.assertEqual(
+            results[0]['response'], {'slug': 'foo', 'revision': 1},
+        )
+        self.assertEqual(
+            results[1]['response'],
+            {'show': Show.objects.get(slug='foo').get_data(), 'revision': 1},
+        )
+        self.assertEqual(
+            results[2]['response']['message'],
+            'Action does not exist: get_data',
+        )
+
+    def test_invalid_batch(self):
+        """Test that a malformed batch is rejected."""
+        request = RequestFactory.POST({'batch': '[{"data": {}}]'})
+        response = CalchartView.as_view()(request)
+        self.assertEqual(response.status_code, 400)
+
+    def test_concurrent_actions(self):
+        """Test that consecutive concurrent actions run at the same time."""
+        barrier = threading.Barrier(2, timeout=5)
+        order = []
+
+        def wait(data, **kwargs):
+            barrier.wait()
+            order.append(data['i'])
+            return data
+
+        def write(data, **kwargs):
+            order.append(data['i'])
+
+        batch_actions = {'wait': wait, 'write': write}
+        with mock.patch.dict(dispatch.ACTIONS, batch_actions), \
+                mock.patch.object(dispatch, 'CONCURRENT_ACTIONS', {'wait'}), \
+                mock.patch.object(dispatch, 'connection') as connection:
+            connection.in_atomic_block = False
+            results = self.do_batch([
+                ('write', {'i': 0}),
+                ('wait', {'i': 1}),
+                ('wait', {'i': 2}),
+                ('write', {'i': 3}),
+            ])
+
+        self.assertEqual(
+            [result['status'] for result in results], [200] * 4,
+        )
+        self.assertEqual(results[1]['response'], {'i': 1})
+        self.assertEqual(order[0], 0)
+        self.assertEqual(order[3], 3)
+
+
+class CheckCollisionsTestCase(ActionsTestCase):
+    """Test the check_collisions action."""
+
+    def test_check_collisions(self):
+        """Test finding the dots that are too close to each other."""
+        data = make_show_data(num_dots=2, num_formations=2)
+        # dot 1 starts half a step from dot 0, then moves 3.5 steps
+        flow = data['formations'][0]['flows'][0]
+        movements = flow['dots'][data['formations'][0]['dots'][1]['id']]
+        movements = movements['movements']
+        movements[0]['startX'] = movements[0]['endX'] = 4.5
+        movements[1]['startX'] = 4.5
+        show = Show.objects.create(name=data['name'], owner=get_user())
+        show.save_data(data)
+        # like jsonb on PostgreSQL, which sorts the keys of objects
+        graph = codec.loads(show.dependency_graph)
+        graph['formations'] = dict(reversed(list(
+            graph['formations'].items(),
+        )))
+        Show.objects.filter(pk=show.pk).update(
+            dependency_graph=codec.dumps(graph),
+        )
+
+        result = self.do_action('check_collisions', {'slug': show.slug})
+        self.assertEqual(result['collisions'], [{
+            'dots': [dot['id'] for dot in data['dots']],
+            'start': 0,
+            'end': 8,
+            'formation': data['formations'][0]['id'],
+            'distance': 0.5,
+        }])
+
+        result = self.do_action('check_collisions', {
+            'slug': show.slug,
+            'distance': 0.5,
+        })
+        self.assertEqual(result['collisions'], [])
+
+        for distance in [0, 1e-300, 'foo']:
+            response = self.do_action('check_collisions', {
+                'slug': show.slug,
+                'distance': distance,
+            }, raw=True)
+            self.assertEqual(response.status_code, 400)
+
+
+class JobTestCase(ActionsTestCase):
+    """Test running actions as Jobs, and the get_job action."""
+
+    def setUp(self):
+        """Create a show to check."""
+        data = make_show_data(num_dots=4, num_formations=2)
+        self.show = Show.objects.create(name=data['name'], owner=get_user())
+        self.show.save_data(data)
+
+    def test_background_action(self):
+        """Test queueing an action and getting its result."""
+        data = {'slug': self.show.slug, 'distance': 4}
+        job_id = self.do_action(
+            'check_collisions', dict(data, background=True),
+        )['job']
+
+        result = self.do_action('get_job', {'id': job_id})
+        self.assertEqual(result['status'], Job.QUEUED)
+        self.assertIsNone(result['result'])
+
+        job = run_next_job()
+        self.assertEqual(job.pk, job_id)
+        self.assertIsNone(run_next_job())
+
+        result = self.do_action('get_job', {'id': job_id})
+        self.assertEqual(result['status'], Job.DONE)
+        self.assertEqual(result['progress'], 1)
+        self.assertEqual(
+            result['result'], self.do_action('check_collisions', data),
+        )
+
+    def test_failed_job(self):
+        """Test that an action raising an error fails the Job."""
+        job_id = self.do_action('check_collisions', {
+            'slug': self.show.slug,
+            'distance': 0,
+            'background': True,
+        })['job']
+        with self.assertLogs('calchart.jobs', 'ERROR'):
+            run_next_job()
+
+        result = self.do_action('get_job', {'id': job_id})
+        self.assertEqual(result['status'], Job.FAILED)
+        self.assertEqual(result['error'], 'The distance must be positive')
+
+    @override_settings(JOB_TIMEOUT=60, JOB_MAX_ATTEMPTS=2)
+    def test_stale_job(self):
+        """Test that Jobs without a recent heartbeat are run again."""
+        job_id = self.do_action('check_collisions', {
+            'slug': self.show.slug,
+            'background': True,
+        })['job']
+        job = claim_job()
+        self.assertIsNone(claim_job())
+
+        # the worker stopped
+        old = timezone.now() - timedelta(seconds=61)
+        Job.objects.filter(pk=job_id).update(date_heartbeat=old)
+        with self.assertLogs('calchart.jobs', 'WARNING'):
+            retried = run_next_job()
+        self.assertEqual(retried.pk, job_id)
+        self.assertEqual(retried.attempts, 2)
+
+        # the first worker's result is not saved
+        Job.objects.filter(pk=job_id).update(status=Job.QUEUED)
+        run_job(job)
+        self.assertEqual(Job.objects.get(pk=job_id).status, Job.QUEUED)
+
+        job = claim_job()
+        Job.objects.filter(pk=job_id).update(date_heartbeat=old)
+        with self.assertLogs('calchart.jobs', 'ERROR'):
+            self.assertIsNone(claim_job())
+        job = Job.objects.get(pk=job_id)
+        self.assertEqual(job.status, Job.FAILED)
+        self.assertEqual(job.error, 'The Job timed out')
+
+    def test_get_job_owner(self):
+        """Test that only the owner of a Job can get it."""
+        other = get_user_model().objects.create_user(username='bar')
+        job = Job.objects.create(
+            action='check_collisions', data='{}', owner=other,
+        )
+        response = self.do_action('get_job', {'id': job.pk}, raw=True)
+        self.assertEqual(response.status_code, 404)
+
+    def test_run_jobs(self):
+        """Test running the queued Jobs with the run_jobs command."""
+        for _ in range(2):
+            self.do_action('check_collisions', {
+                'slug': self.show.slug,
+                'background': True,
+            })
+
+        call_command('run_jobs', once=True, stdout=io.StringIO())
+        statuses = Job.objects.values_list('status', flat=True)
+        self.assertEqual(list(statuses), [Job.DONE, Job.DONE])
+
+
+class SaveShowTestCase(ActionsTestCase):
+    """Test the save_show action."""
+
+    def setUp(self):
+        """Create a show to save."""
+        data = CreateShowTestCase.SHOW_DATA.copy()
+        self.slug = self.do_action('create_show', data)['slug']
+
+    def save_upload(self, request):
+        """Save the show uploaded in the given request."""
+        request.user = get_user()
+        response = CalchartView.as_view()(request)
+        return response.status_code, json.loads(response.content)
+
+    def test_save_show_file(self):
+        """Test saving the show sent as a file."""
+        data = dict(make_show_data(), slug=self.slug, name='Foo')
+        content = json.dumps(data).encode()
+        status, result = self.save_upload(DjangoRequestFactory().post('/', {
+            'action': 'save_show',
+            'data': json.dumps({'slug': self.slug}),
+            'show': SimpleUploadedFile('show.json', content),
+        }))
+        self.assertEqual(status, 200)
+        self.assertEqual(len(result['dirty']['formations']), 3)
+
+        show = Show.objects.get(slug=self.slug)
+        self.assertEqual(show.get_data(), dict(data, published=False))
+        self.assertEqual(read_blob(show.data_file.name), content)
+
+    def test_save_show_json_body(self):
+        """Test saving the show sent as the body of the request."""
+        data = dict(make_show_data(), slug=self.slug, name='Bar')
+        status, _ = self.save_upload(DjangoRequestFactory().post(
+            f'/?action=save_show&slug={self.slug}',
+            json.dumps(data),
+            content_type='application/json',
+        ))
+        self.assertEqual(status, 200)
+
+        show = Show.objects.get(slug=self.slug)
+        self.assertEqual(show.name, 'Bar')
+        self.assertEqual(show.get_data(), dict(data, published=False))
+
+    def test_get_show_raw(self):
+        """Test that get_show sends the saved JSON without encoding it."""
+        data = dict(make_show_data(), slug=self.slug, name='Foo')
+        content = json.dumps(data, indent=4).encode()
+        self.save_upload(DjangoRequestFactory().post(
+            f'/?action=save_show&slug={self.slug}',
+            content,
+            content_type='application/json',
+        ))
+
+        response = self.do_action('get_show', {'slug': self.slug}, raw=True)
+        self.assertEqual(
+            response.content,
+            b'{"show":%s,"published":false},"revision":2}' % content[:-1],
+        )
+
+    def test_save_show_conflict(self):
+        """Test that saving an outdated revision is rejected with a 409."""
+        revision = self.do_action('get_show', {'slug': self.slug})['revision']
+
+        def save(name):
+            data = dict(make_show_data(), slug=self.slug, name=name)
+            return self.save_upload(DjangoRequestFactory().post(
+                f'/?action=save_show&slug={self.slug}&revision={revision}',
+                json.dumps(data),
+                content_type='application/json',
+            ))
+
+        status, result = save('Foo')
+        self.assertEqual(status, 200)
+        self.assertEqual(result['revision'], revision + 1)
+
+        status, result = save('Bar')
+        self.assertEqual(status, 409)
+        self.assertEqual(result['revision'], revision + 1)
+        self.assertEqual(Show.objects.get(slug=self.slug).name, 'Foo')
+
+    def test_save_show_form_conflict(self):
+        """Test that saving form data for an outdated revision is rejected."""
+        revision = self.do_action('get_show', {'slug': self.slug})['revision']
+        data = dict(
+            CreateShowTestCase.SHOW_DATA, slug=self.slug, revision=revision,
+        )
+
+        result = self.do_action('save_show', dict(data, name='Foo'))
+        self.assertEqual(result['revision'], revision + 1)
+        self.assertNotIn(
+            'revision', Show.objects.get(slug=self.slug).get_data(),
+        )
+
+        response = self.do_action(
+            'save_show', dict(data, name='Bar'), raw=True,
+        )
+        self.assertEqual(response.status_code, 409)
+        self.assertEqual(Show.objects.get(slug=self.slug).name, 'Foo')
+
+    def test_save_show_invalid_json(self):
+        """Test that invalid JSON is rejected without saving anything."""
+        data = Show.objects.get(slug=self.slug).get_data()
+        for content in ['{"slug": ', '[]']:
+            status, _ = self.save_upload(DjangoRequestFactory().post(
+                f'/?action=save_show&slug={self.slug}',
+                content,
+                content_type='application/json',
+            ))
+            self.assertEqual(status, 500)
+
+        show = Show.objects.get(slug=self.slug)
+        self.assertEqual(show.get_data(), data)
+
+    def test_save_show_patch(self):
+        """Test saving a JSON Patch instead of the entire show."""
+        self.do_action('save_show', {
+            'slug': self.slug,
+            'patch': [
+                {'op': 'replace', 'path': '/numDots', 'value': 20},
+            ],
+        })
+
+        show = Show.objects.get(slug=self.slug)
+        self.assertEqual(show.get_data()['numDots'], 20)
+        self.assertEqual(show.patches.count(), 1)
+
+    def test_save_show_invalid_patch(self):
+        """Test that an invalid JSON Patch is not saved."""
+        response = self.do_action('save_show', {
+            'slug': self.slug,
+            'patch': [
+                {'op': 'remove', 'path': '/missing'},
+            ],
+        }, raw=True)
+        self.assertEqual(response.status_code, 500)
+
+        show = Show.objects.get(slug=self.slug)
+        self.assertEqual(show.patches.count(), 0)
+
+    def test_save_show_dirty(self):
+        """Test that only the changed formations and flows are dirty."""
+        data = dict(make_show_data(), slug=self.slug, name='Foo')
+        result = self.do_action('save_show', data)
+        self.assertEqual(len(result['dirty']['formations']), 3)
+
+        formation = data['formations'][1]
+        result = self.do_action('save_show', {
+            'slug': self.slug,
+            'patch': [
+                {
+                    'op': 'replace',
+                    'path': '/formations/1/name',
+                    'value': 'Star',
+                },
+            ],
+        })
+        self.assertEqual(result['dirty'], {
+            'formations': [formation['id']],
+            'flows': [formation['flows'][0]['id']],
+        })
+
+
+class RevisionsTestCase(ActionsTestCase):
+    """Test the actions for the revision history of a show."""
+
+    def setUp(self):
+        """Create a show with a few revisions."""
+        data = CreateShowTestCase.SHOW_DATA.copy()
+        self.slug = self.do_action('create_show', data)['slug']
+        for name in ['Bar', 'Baz']:
+            self.do_action('save_show', {
+                'slug': self.slug,
+                'patch': [{'op': 'replace', 'path': '/name', 'value': name}],
+            })
+
+    def test_get_revisions(self):
+        """Test listing the revisions of a show."""
+        revisions = self.do_action('get_revisions', {'slug': self.slug})
+        self.assertEqual(
+            [revision['revision'] for revision in revisions['revisions']],
+            [3, 2, 1],
+        )
+
+    def test_diff_revisions(self):
+        """Test getting the changes between revisions."""
+        result = self.do_action('diff_revisions', {
+            'slug': self.slug,
+            'from': 1,
+        })
+        self.assertEqual(result['patch'], [
+            {'op': 'replace', 'path': '/name', 'value': 'Baz'},
+        ])
+
+        result = self.do_action('diff_revisions', {
+            'slug': self.slug,
+            'from': 3,
+            'to': 2,
+        })
+        self.assertEqual(result['patch'], [
+            {'op': 'replace', 'path': '/name', 'value': 'Bar'},
+        ])
+
+        response = self.do_action('diff_revisions', {
+            'slug': self.slug,
+            'from': 4,
+        }, raw=True)
+        self.assertEqual(response.status_code, 404)
+
+    def test_restore_revision(self):
+        """Test restoring a revision."""
+        result = self.do_action('restore_revision', {
+            'slug': self.slug,
+            'revision': 1,
+        })
+        self.assertEqual(result['revision'], 4)
 
-    # TODO: test publish initialized show
-    # TODO: test unpublish initialized show
-    # TODO: test publish un-initialized show
-    # TODO: test unpublish un-initialized show
+        show = Show.objects.get(slug=self.slug)
+        self.assertEqual(show.get_data()['name'], 'Foo')
+        self.assertEqual(show.revisions.count(), 4)
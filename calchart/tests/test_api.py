@@ -0,0 +1,55 @@
+"""Tests for accessing the Members Only API."""
+
+from unittest import mock
+
+from calchart.models import User
+
+from django.test import TestCase, override_settings
+
+from utils import metrics
+from utils.api import call_endpoint, get_session
+from utils.testing import mock_endpoint
+
+
+@override_settings(
+    MEMBERS_ONLY_DOMAIN='https://members.example.com',
+    MEMBERS_ONLY_TIMEOUTS={'check-committee': 0.5},
+)
+class CallEndpointTestCase(TestCase):
+    """Test utils.api.call_endpoint."""
+
+    def setUp(self):
+        """Reset metrics between tests."""
+        metrics.reset()
+        self.user = User(username='foo', api_token='abc')
+
+    def test_session_reused(self):
+        """Test that every call shares the same pooled session."""
+        self.assertIs(get_session(), get_session())
+
+    def test_call_endpoint(self):
+        """Test that call_endpoint records the latency of each call."""
+        with mock_endpoint('check-committee', {'has_committee': True}):
+            response = call_endpoint(
+                'check-committee', self.user, committee='STUNT',
+            )
+            self.assertEqual(response, {'has_committee': True})
+
+        histogram = metrics.get_histograms()['members_only.check-committee']
+        self.assertEqual(histogram['count'], 1)
+
+    def test_call_endpoint_timeout(self):
+        """Test that per-endpoint timeouts are passed to the session."""
+        session = mock.MagicMock()
+        with mock.patch('utils.api.get_session', return_value=session):
+            call_endpoint('check-committee', self.user)
+            call_endpoint('get-committees', self.user)
+
+        session.get.assert_any_call(
+            'https://members.example.com/api/check-committee/',
+            params={'token': 'abc'}, timeout=0.5,
+        )
+        session.get.assert_any_call(
+            'https://members.example.com/api/get-committees/',
+            params={'token': 'abc'}, timeout=1,
+        )
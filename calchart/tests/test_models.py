@@ -1,13 +1,106 @@
 """Tests for models in the base app."""
 
-from calchart.models import Show, User
+import io
+from datetime import timedelta
+from unittest import mock
 
-from django.test import TestCase
+from calchart.models import RevisionConflict, Show, ShowRevision, User
 
+from django.core.cache import cache
+from django.core.management import call_command
+from django.test import TestCase, override_settings
+from django.utils import timezone
 
+from utils import codec, metrics
+from utils.storage import get_hash, is_compressed, read_blob
+from utils.testing import MembersOnlyServer, make_show_data, mock_endpoint
+
+
+@override_settings(MEMBERS_ONLY_DOMAIN='https://members.example.com')
 class UserTestCase(TestCase):
     """Test the User model."""
 
+    def setUp(self):
+        """Reset the committee cache between tests."""
+        cache.clear()
+        metrics.reset()
+        self.user = User.objects.create(username='foo', api_token='abc')
+
+    def get_cache_stats(self):
+        """Get the hit/miss counters for the committee cache."""
+        return metrics.get_counters('committee_cache.')
+
+    def test_has_committee_cached_in_request(self):
+        """Test that has_committee only calls Members Only once."""
+        with mock_endpoint('check-committee', {'has_committee': True}):
+            self.assertTrue(self.user.has_committee('STUNT'))
+            self.assertTrue(self.user.has_committee('STUNT'))
+
+        self.assertEqual(self.get_cache_stats(), {
+            'committee_cache.hits': 1,
+            'committee_cache.misses': 1,
+        })
+
+    def test_has_committee_cached_across_requests(self):
+        """Test that committees are shared between User instances."""
+        with mock_endpoint('check-committee', {'has_committee': False}):
+            self.assertFalse(self.user.has_committee('STUNT'))
+
+        user = User.objects.get(pk=self.user.pk)
+        self.assertFalse(user.has_committee('STUNT'))
+        self.assertEqual(self.get_cache_stats()['committee_cache.hits'], 1)
+
+    @override_settings(MEMBERS_ONLY_CACHE_TTL=0)
+    def test_has_committee_no_ttl(self):
+        """Test that a TTL of 0 disables caching across requests."""
+        with mock_endpoint('check-committee', {'has_committee': True}):
+            self.user.has_committee('STUNT')
+            User.objects.get(pk=self.user.pk).has_committee('STUNT')
+
+        self.assertEqual(self.get_cache_stats(), {
+            'committee_cache.misses': 2,
+        })
+
+    def test_has_committee_token_rotated(self):
+        """Test that a new API token invalidates the cached committees."""
+        with mock_endpoint('check-committee', {'has_committee': False}):
+            self.assertFalse(self.user.has_committee('STUNT'))
+
+        self.user.clear_committee_cache()
+        self.user.api_token = 'def'
+        with mock_endpoint('check-committee', {'has_committee': True}):
+            self.assertTrue(self.user.has_committee('STUNT'))
+
+        self.assertEqual(self.get_cache_stats(), {
+            'committee_cache.misses': 2,
+        })
+
+    @override_settings(MEMBERS_ONLY_COMMITTEES=['STUNT', 'COMPCOMM'])
+    def test_get_committees_batch(self):
+        """Test that committees are fetched in a single round trip."""
+        with MembersOnlyServer({'abc': ['STUNT']}) as server:
+            self.assertEqual(self.user.get_committees(), {'STUNT'})
+            self.assertTrue(self.user.has_committee('STUNT'))
+            self.assertFalse(self.user.has_committee('COMPCOMM'))
+            self.assertFalse(self.user.has_committee('DRUMLINE'))
+
+        self.assertEqual(server.calls, {'get-committees': 1})
+
+    @override_settings(MEMBERS_ONLY_COMMITTEES=['STUNT', 'COMPCOMM'])
+    def test_get_committees_no_batch(self):
+        """Test falling back to checking each committee in parallel."""
+        members_only = MembersOnlyServer(
+            {'abc': ['STUNT']}, batch=False, latency=0.1,
+        )
+        with members_only as server:
+            self.assertTrue(self.user.has_committee('STUNT'))
+            self.assertFalse(self.user.has_committee('COMPCOMM'))
+
+        self.assertEqual(server.calls, {
+            'get-committees': 1,
+            'check-committee': 2,
+        })
+
     # TODO: test_is_valid_api_token_not_members_only
     # TODO: test_is_valid_api_token_expired
     # TODO: test_has_committee_not_members_only
@@ -16,12 +109,399 @@ class UserTestCase(TestCase):
 class ShowTestCase(TestCase):
     """Test the Show model."""
 
+    SHOW_DATA = {
+        'slug': 'test-show',
+        'name': 'Test Show',
+        'isBand': False,
+        'published': False,
+        'dots': [],
+    }
+
+    def setUp(self):
+        """Create a Show to test with."""
+        self.user = User.objects.create(username='test')
+        self.show = Show.objects.create(name='Test Show', owner=self.user)
+
     def test_create_show(self):
         """Test creating a Show."""
         user = User.objects.create(username='foo')
         show = Show.objects.create(name='Foo Bar', owner=user, is_band=True)
         self.assertEqual(show.slug, 'foo-bar')
 
+    def test_save_data(self):
+        """Test that the data file is named by its contents."""
+        self.show.save_data(self.SHOW_DATA)
+        name = self.show.data_file.name
+
+        self.assertEqual(name, f'shows/{self.show.data_hash}.show.gz')
+        self.assertEqual(self.show.get_data(), self.SHOW_DATA)
+
+    def test_save_data_compression(self):
+        """Test reading data files saved with any compression."""
+        storage = self.show.data_file.storage
+        for compression in [None, 'gzip']:
+            with self.subTest(compression=compression):
+                data = dict(self.SHOW_DATA, name=f'Foo {compression}')
+                with self.settings(SHOW_DATA_COMPRESSION=compression):
+                    self.show.save_data(data)
+
+                show = Show.objects.get(pk=self.show.pk)
+                with storage.open(show.data_file.name) as f:
+                    content = f.read()
+                self.assertEqual(is_compressed(content), bool(compression))
+                self.assertEqual(show.get_data(), data)
+                with show.open_data_json() as f:
+                    self.assertEqual(f.read(), show.get_data_json())
+
+    def test_compress_shows(self):
+        """Test converting data files with the compress_shows command."""
+        with self.settings(SHOW_DATA_COMPRESSION=None):
+            self.show.save_data(self.SHOW_DATA)
+        old_name = self.show.data_file.name
+        storage = self.show.data_file.storage
+
+        call_command('compress_shows', stdout=io.StringIO())
+        show = Show.objects.get(pk=self.show.pk)
+        self.assertEqual(show.data_file.name, f'{old_name}.gz')
+        self.assertEqual(show.data_hash, self.show.data_hash)
+        self.assertFalse(storage.exists(old_name))
+        self.assertEqual(show.get_data(), self.SHOW_DATA)
+
+        out = io.StringIO()
+        call_command('compress_shows', stdout=out)
+        self.assertIn('Converted 0 data files', out.getvalue())
+
+        call_command('compress_shows', compression='none', stdout=out)
+        show = Show.objects.get(pk=self.show.pk)
+        self.assertEqual(show.data_file.name, old_name)
+
+    def test_compress_shows_concurrent_save(self):
+        """Test saving a Show loaded before compress_shows renamed its file."""
+        with self.settings(SHOW_DATA_COMPRESSION=None):
+            self.show.save_data(self.SHOW_DATA)
+
+        call_command('compress_shows', stdout=io.StringIO())
+        self.show.save_data(self.SHOW_DATA)
+
+        show = Show.objects.get(pk=self.show.pk)
+        self.assertTrue(show.data_file.name.endswith('.gz'))
+        self.assertEqual(show.get_data(), self.SHOW_DATA)
+
+    def test_save_data_unchanged(self):
+        """Test that saving the same data does not write a new file."""
+        self.show.save_data(self.SHOW_DATA)
+        storage = self.show.data_file.storage
+
+        with mock.patch.object(storage, 'save') as save:
+            self.show.save_data(self.SHOW_DATA)
+            save.assert_not_called()
+
+    def test_save_data_changed(self):
+        """Test that changed data replaces the old data file."""
+        self.show.save_data(self.SHOW_DATA)
+        old_name = self.show.data_file.name
+        storage = self.show.data_file.storage
+        self.assertTrue(self.show.revisions.filter(data_file=old_name))
+
+        # the old data file is kept while a revision uses it
+        self.show.revisions.all().delete()
+
+        data = dict(self.SHOW_DATA, dots=[{'id': 'a'}])
+        self.show.save_data(data)
+        self.assertNotEqual(self.show.data_file.name, old_name)
+        self.assertFalse(storage.exists(old_name))
+        self.assertEqual(self.show.get_data(), data)
+
+    def test_save_data_conflict(self):
+        """Test that saving a Show saved since it was loaded is rejected."""
+        self.show.save_data(self.SHOW_DATA)
+        other = Show.objects.get(pk=self.show.pk)
+        other.save_data(dict(self.SHOW_DATA, name='Bar'))
+        self.assertEqual(other.revision, self.show.revision + 1)
+
+        storage = self.show.data_file.storage
+        with mock.patch.object(storage, 'delete', wraps=storage.delete) as d:
+            with self.assertRaises(RevisionConflict) as cm:
+                self.show.save_data(dict(self.SHOW_DATA, name='Baz'))
+        self.assertEqual(cm.exception.revision, other.revision)
+        self.assertEqual(d.call_count, 1)
+        self.assertEqual(Show.objects.get(pk=self.show.pk).name, 'Bar')
+
+        with self.assertRaises(RevisionConflict):
+            self.show.patch_data([
+                {'op': 'replace', 'path': '/name', 'value': 'Baz'},
+            ])
+        self.assertEqual(self.show.patches.count(), 0)
+
+    def test_get_data_replaced(self):
+        """Test reading a Show whose data file was replaced since loading."""
+        self.show.save_data(self.SHOW_DATA)
+        self.show.revisions.all().delete()
+        other = Show.objects.get(pk=self.show.pk)
+        data = dict(self.SHOW_DATA, name='Bar')
+        other.save_data(data)
+        self.assertFalse(
+            self.show.data_file.storage.exists(self.show.data_file.name),
+        )
+
+        self.assertEqual(self.show.get_data()['name'], 'Bar')
+        self.assertEqual(self.show.revision, other.revision)
+
+    def test_patch_data(self):
+        """Test that patches are saved without writing a new file."""
+        self.show.save_data(self.SHOW_DATA)
+        name = self.show.data_file.name
+
+        self.show.patch_data([
+            {'op': 'add', 'path': '/dots/-', 'value': {'id': 'a'}},
+            {'op': 'replace', 'path': '/name', 'value': 'Baz'},
+        ])
+
+        self.assertEqual(self.show.data_file.name, name)
+        self.assertEqual(self.show.name, 'Baz')
+        self.assertEqual(self.show.get_data()['dots'], [{'id': 'a'}])
+
+    def test_compact_data(self):
+        """Test compacting patches into a new data file."""
+        self.show.save_data(self.SHOW_DATA)
+        self.show.patch_data([
+            {'op': 'add', 'path': '/dots/-', 'value': {'id': 'a'}},
+        ])
+        self.show.patch_data([
+            {'op': 'add', 'path': '/dots/-', 'value': {'id': 'b'}},
+        ])
+        data = self.show.get_data()
+
+        self.show.compact_data()
+        self.assertEqual(self.show.patches.count(), 0)
+        self.assertEqual(self.show.get_data(), data)
+
+    def test_get_data_compacted(self):
+        """Test reading a Show that is compacted while it is read."""
+        self.show.save_data(self.SHOW_DATA)
+        self.show.patch_data([
+            {'op': 'add', 'path': '/dots/-', 'value': {'id': 'a'}},
+        ])
+        compacted = []
+
+        def read_and_compact(*args):
+            content = read_blob(*args)
+            if not compacted:
+                compacted.append(True)
+                Show.objects.get(pk=self.show.pk).compact_data()
+            return content
+
+        show = Show.objects.get(pk=self.show.pk)
+        with mock.patch(
+            'calchart.models.read_blob', side_effect=read_and_compact,
+        ):
+            data = show.get_data()
+        self.assertTrue(compacted)
+        self.assertEqual(data['dots'], [{'id': 'a'}])
+
+    def test_compact_data_published(self):
+        """Test that publishing a Show while compacting it is kept."""
+        self.show.save_data(self.SHOW_DATA)
+        self.show.patch_data([
+            {'op': 'add', 'path': '/dots/-', 'value': {'id': 'a'}},
+        ])
+
+        refresh_from_db = Show.refresh_from_db
+
+        def refresh_and_publish(show, *args, **kwargs):
+            refresh_from_db(show, *args, **kwargs)
+            Show.objects.filter(pk=show.pk).update(published=True)
+
+        with mock.patch.object(Show, 'refresh_from_db', refresh_and_publish):
+            self.show.compact_data()
+
+        show = Show.objects.get(pk=self.show.pk)
+        self.assertEqual(show.patches.count(), 0)
+        self.assertTrue(show.published)
+
+    def test_get_data_pointers(self):
+        """Test getting parts of the Show data."""
+        self.show.save_data(self.SHOW_DATA)
+        self.assertEqual(
+            self.show.get_data('/name', '/dots', '/missing/0'),
+            ['Test Show', [], None],
+        )
+
+    @override_settings(SHOW_DATA_STORAGE='database')
+    def test_save_data_database(self):
+        """Test saving the Show data in the database."""
+        self.show.save_data(self.SHOW_DATA)
+        self.assertFalse(self.show.data_file)
+
+        show = Show.objects.get(pk=self.show.pk)
+        self.assertIn('data', show.get_deferred_fields())
+        self.assertEqual(show.get_data(), self.SHOW_DATA)
+        self.assertEqual(show.get_data('/slug'), ['test-show'])
+
+        show.patch_data([
+            {'op': 'add', 'path': '/dots/-', 'value': {'id': 'a'}},
+        ])
+        self.assertEqual(show.patches.count(), 0)
+        self.assertEqual(show.get_data('/dots/0/id'), ['a'])
+
+    def test_save_data_database_fallback(self):
+        """Test reading a Show saved before storing data in the database."""
+        self.show.save_data(self.SHOW_DATA)
+        with self.settings(SHOW_DATA_STORAGE='database'):
+            self.assertEqual(self.show.get_data(), self.SHOW_DATA)
+
     # TODO: test_create_same_slug
-    # TODO: test_get_data
-    # TODO: test_save_data
+
+    def test_get_timeline(self):
+        """Test that the DenseTimeline is saved next to the data file."""
+        self.show.save_data(make_show_data(num_dots=3, num_formations=2))
+        storage = self.show.data_file.storage
+        name = f'shows/{self.show.data_hash}-0.timeline.npy'
+        self.assertFalse(storage.exists(name))
+
+        timeline = self.show.get_timeline()
+        self.assertTrue(storage.exists(name))
+        self.assertEqual(timeline.positions.shape, (11, 3, 3))
+
+        with mock.patch('calchart.models.DenseTimeline.build') as build:
+            timeline = self.show.get_timeline()
+            build.assert_not_called()
+        self.assertEqual(timeline.positions[10, 0].tolist(), [6, 8, 0])
+
+    def test_update_timeline(self):
+        """Test that a new DenseTimeline replaces the previous one."""
+        data = make_show_data(num_dots=3, num_formations=3)
+        self.show.save_data(data)
+        self.show.get_timeline()
+        storage = self.show.data_file.storage
+        previous_key = f'{self.show.data_hash}-0'
+
+        flow_dots = data['formations'][1]['flows'][0]['dots']
+        mark_time = next(iter(flow_dots.values()))['movements'][0]
+        mark_time['startX'] = mark_time['endX'] = 0
+        self.show.save_data(data)
+        timeline = self.show.update_timeline(previous_key)
+
+        self.assertEqual(timeline.positions[10, 0].tolist(), [0, 8, 0])
+        self.assertFalse(
+            storage.exists(f'shows/{previous_key}.timeline.npy'),
+        )
+
+    def test_request_timeline(self):
+        """Test that saves waiting for a DenseTimeline only build it once."""
+        submitted = []
+        with mock.patch(
+            'calchart.models.transaction.on_commit',
+            side_effect=lambda func: func(),
+        ), mock.patch(
+            'calchart.models.submit_in_background',
+            side_effect=submitted.append,
+        ), mock.patch('calchart.models.run_in_background'):
+            # on_commit is Django's, so don't start any other background tasks
+            data = make_show_data(num_dots=3, num_formations=2)
+            self.show.save_data(data)
+            self.show.save_data(dict(data, name='Foo'))
+        self.assertEqual(len(submitted), 1)
+
+        submitted[0]()
+        storage = self.show.data_file.storage
+        name = f'shows/{self.show.data_hash}-0.timeline.npy'
+        self.assertTrue(storage.exists(name))
+
+        with mock.patch('calchart.models.transaction.on_commit') as on_commit:
+            self.show.delete()
+        on_commit.call_args[0][0]()
+        self.assertFalse(storage.exists(name))
+
+
+@override_settings(SHOW_REVISION_KEYFRAME_INTERVAL=3, SHOW_REVISION_LIMIT=5)
+class ShowRevisionTestCase(TestCase):
+    """Test the revision history of Shows."""
+
+    def setUp(self):
+        """Create a Show to test with, evicting revisions immediately."""
+        user = User.objects.create(username='foo')
+        self.show = Show.objects.create(name='Foo', owner=user)
+
+        def run(func, *args):
+            if func.__name__ == '_evict_revisions':
+                func(*args)
+
+        patcher = mock.patch(
+            'calchart.models.run_in_background', side_effect=run,
+        )
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def save_revisions(self, names):
+        """Save the Show with each of the given names."""
+        for name in names:
+            self.show.save_data(dict(ShowTestCase.SHOW_DATA, name=name))
+
+    def test_record_revision(self):
+        """Test that keyframes are saved every few revisions."""
+        self.save_revisions(['A', 'B', 'C', 'D'])
+        self.show.patch_data([
+            {'op': 'replace', 'path': '/name', 'value': 'E'},
+        ])
+
+        revisions = self.show.revisions.order_by('revision')
+        self.assertEqual(
+            [revision.to_json()['keyframe'] for revision in revisions],
+            [True, False, False, True, False],
+        )
+        self.assertEqual(
+            codec.loads(revisions[4].patch),
+            [{'op': 'replace', 'path': '/name', 'value': 'E'}],
+        )
+        self.assertEqual(
+            [self.show.get_revision_data(i)['name'] for i in range(1, 6)],
+            ['A', 'B', 'C', 'D', 'E'],
+        )
+        # the keyframe shares the data file of the Show, which is saved
+        # without `published`
+        data = dict(ShowTestCase.SHOW_DATA, name='D')
+        del data['published']
+        content = codec.dumpb(data)
+        self.assertEqual(
+            revisions[3].data_file.name, f'shows/{get_hash(content)}.show.gz',
+        )
+
+    def test_evict_revisions(self):
+        """Test that revisions are deleted up to the oldest keyframe kept."""
+        storage = self.show.data_file.storage
+        self.save_revisions(['A', 'B', 'C', 'D', 'E', 'F'])
+        first_keyframe = self.show.revisions.get(revision=1).data_file.name
+        self.assertEqual(self.show.revisions.count(), 6)
+
+        self.save_revisions(['G', 'H', 'I'])
+        self.assertEqual(
+            list(self.show.revisions.values_list('revision', flat=True)),
+            [4, 5, 6, 7, 8, 9],
+        )
+        self.assertFalse(storage.exists(first_keyframe))
+        with self.assertRaises(ShowRevision.DoesNotExist):
+            self.show.get_revision_data(3)
+
+        self.show.revisions.update(
+            date_added=timezone.now() - timedelta(days=365),
+        )
+        self.show.evict_revisions()
+        self.assertEqual(
+            list(self.show.revisions.values_list('revision', flat=True)),
+            [7, 8, 9],
+        )
+        self.assertEqual(self.show.get_revision_data(9)['name'], 'I')
+
+    def test_restore_revision(self):
+        """Test restoring a revision as a new revision."""
+        self.save_revisions(['A'])
+        self.show.save_data(dict(ShowTestCase.SHOW_DATA, name='B', slug='b'))
+        self.save_revisions(['C'])
+        self.show.restore_revision(2)
+
+        show = Show.objects.get(pk=self.show.pk)
+        self.assertEqual(show.revision, 4)
+        self.assertEqual(show.name, 'B')
+        self.assertEqual(show.get_data()['slug'], 'test-show')
+        self.assertEqual(show.get_revision_data(4)['name'], 'B')
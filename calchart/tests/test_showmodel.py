@@ -0,0 +1,405 @@
+"""Tests for the array-backed Show model."""
+
+import json
+import os
+import tempfile
+import time
+import tracemalloc
+from unittest import mock
+
+from calchart.showmodel import (
+    DenseTimeline,
+    DependencyGraph,
+    ShowModel,
+    Timeline,
+    find_collisions,
+    group_collisions,
+)
+
+from django.core.files.storage import FileSystemStorage, Storage
+from django.test import SimpleTestCase
+
+import numpy as np
+
+from utils.testing import make_show_data
+
+
+class ShowModelTestCase(SimpleTestCase):
+    """Test calchart.showmodel.ShowModel."""
+
+    def test_round_trip(self):
+        """Test that a Show is converted back into the same JSON."""
+        data = make_show_data()
+        show = ShowModel.from_json(json.dumps(data))
+        self.assertEqual(show.to_json(), data)
+
+    def test_round_trip_irregular(self):
+        """Test converting Shows with optional, null and unknown fields."""
+        data = make_show_data(num_dots=3, num_formations=2)
+        data['date'] = '2017-01-01'
+        data['beats'] = [500, 250.5, 1e-3]
+        data['dots'][0]['label'] = 'é'
+        formation = data['formations'][0]
+        formation['nextDots'] = None
+        formation['dots'][1]['dotGroup'] = 'A'
+        flow_dots = formation['flows'][0]['dots']
+        movement = next(iter(flow_dots.values()))['movements'][0]
+        del movement['isMarkTime']
+
+        show = ShowModel.from_json(data)
+        self.assertEqual(show.to_json(), data)
+
+        # the data saved by create_show
+        data = {'name': 'Foo', 'slug': 'foo', 'isBand': False, 'numDots': 2}
+        self.assertEqual(ShowModel.from_json(data).to_json(), data)
+
+    def test_invalid(self):
+        """Test that data not matching the schema raises a ValueError."""
+        data = make_show_data()
+        data['formations'][0]['dots'][0]['position']['x'] = '1'
+        with self.assertRaises(ValueError):
+            ShowModel.from_json(data)
+
+        data = make_show_data()
+        del data['formations'][0]['dots'][0]['id']
+        with self.assertRaises(ValueError):
+            ShowModel.from_json(data)
+
+    def test_formations(self):
+        """Test reading the dots and movements of a Formation."""
+        data = make_show_data()
+        show = ShowModel.from_json(data)
+
+        formation = show.get_formation(data['formations'][1]['id'])
+        dots = data['formations'][1]['dots']
+        self.assertEqual(formation.dot_ids, [dot['id'] for dot in dots])
+        self.assertEqual(
+            list(formation.x), [dot['position']['x'] for dot in dots],
+        )
+        self.assertEqual(list(show.get_dot_indices(formation)), list(range(8)))
+
+        flow = formation.flows[0]
+        self.assertEqual(flow.dot_ids, [dot['id'] for dot in dots])
+        self.assertEqual(list(flow.movement_offsets), list(range(0, 17, 2)))
+        end_x = [
+            movement['endX']
+            for dot in data['formations'][1]['flows'][0]['dots'].values()
+            for movement in dot['movements']
+        ]
+        self.assertEqual(list(flow.movements['endX']), end_x)
+
+    def test_memory(self):
+        """Test that a loaded Show is much smaller than the JSON object."""
+        content = json.dumps(make_show_data(num_dots=100, num_formations=10))
+
+        tracemalloc.start()
+        try:
+            base, _ = tracemalloc.get_traced_memory()
+            data = json.loads(content)  # noqa: F841
+            data_size = tracemalloc.get_traced_memory()[0] - base
+            del data
+
+            base, _ = tracemalloc.get_traced_memory()
+            show = ShowModel.from_json(content)  # noqa: F841
+            show_size = tracemalloc.get_traced_memory()[0] - base
+        finally:
+            tracemalloc.stop()
+
+        self.assertLess(show_size * 10, data_size)
+
+
+class TimelineTestCase(SimpleTestCase):
+    """Test calchart.showmodel.Timeline."""
+
+    def test_get_positions(self):
+        """Test getting the positions of the dots during each Flow."""
+        data = make_show_data(num_dots=5, num_formations=3)
+        timeline = Timeline.from_show(ShowModel.from_json(data))
+        self.assertEqual(list(timeline.formation_beats), [0, 10, 20, 20])
+
+        positions = timeline.get_positions([0, 8, 9, 10, 15, 25])
+        # dot 0 mark times for 8 beats, then moves 2 steps east
+        self.assertEqual(
+            positions[:, 0].tolist(),
+            [
+                [4, 8, 0],
+                [4, 8, 0],
+                [5, 8, 0],
+                [6, 8, 0],
+                [6, 8, 0],
+                [8, 8, 0],
+            ],
+        )
+        # dot 4 is in the second row
+        self.assertEqual(positions[0, 4].tolist(), [4, 10, 0])
+
+    def test_get_positions_missing_dot(self):
+        """Test that dots not in a Formation have no position."""
+        data = make_show_data(num_dots=2, num_formations=2)
+        data['dots'].append({'id': 'x', 'label': 'X', '__type__': 'Dot'})
+        timeline = Timeline.from_show(ShowModel.from_json(data))
+
+        positions = timeline.get_positions([0, 5])
+        self.assertEqual(positions.shape, (2, 3, 3))
+        self.assertFalse(np.isnan(positions[:, :2]).any())
+        self.assertTrue(np.isnan(positions[:, 2]).all())
+
+        with self.assertRaises(ValueError):
+            timeline.get_positions([-1])
+
+    def test_get_positions_fast(self):
+        """Test getting 250 dots over thousands of beats."""
+        data = make_show_data(num_dots=250, num_formations=200)
+        timeline = Timeline.from_show(ShowModel.from_json(data))
+        beats = range(int(timeline.num_beats))
+
+        start = time.perf_counter()
+        positions = timeline.get_positions(beats)
+        seconds = time.perf_counter() - start
+
+        self.assertEqual(positions.shape, (1990, 250, 3))
+        self.assertLess(seconds, 1)
+
+
+class DenseTimelineTestCase(SimpleTestCase):
+    """Test calchart.showmodel.dense.DenseTimeline."""
+
+    def test_build(self):
+        """Test that the positions match the Timeline at every beat."""
+        data = make_show_data(num_dots=5, num_formations=3)
+        timeline = Timeline.from_show(ShowModel.from_json(data))
+        dense = DenseTimeline.build(data)
+
+        beats = list(range(21))
+        self.assertEqual(dense.positions.dtype, np.float32)
+        np.testing.assert_array_equal(
+            dense.get_positions(beats), timeline.get_positions(beats),
+        )
+        np.testing.assert_array_equal(
+            dense.get_positions([100]), dense.get_positions([20]),
+        )
+
+        with self.assertRaises(ValueError):
+            dense.get_positions([1.5])
+
+    def test_build_incremental(self):
+        """Test that only the beats of changed Formations are computed."""
+        data = make_show_data(num_dots=5, num_formations=4)
+        previous = DenseTimeline.build(data)
+
+        data['formations'][1]['dots'][0]['position']['x'] = 0
+        with mock.patch.object(
+            Timeline, 'get_positions', autospec=True,
+            side_effect=Timeline.get_positions,
+        ) as get_positions:
+            dense = DenseTimeline.build(data, previous)
+
+        # the second Formation and the end of the Show
+        beats = get_positions.call_args[0][1]
+        self.assertEqual(beats, list(range(10, 20)) + [30])
+        np.testing.assert_array_equal(
+            dense.positions, DenseTimeline.build(data).positions,
+        )
+
+    def test_save(self):
+        """Test that a saved DenseTimeline is memory-mapped when loaded."""
+        data = make_show_data(num_dots=5, num_formations=3)
+        dense = DenseTimeline.build(data)
+
+        with tempfile.TemporaryDirectory() as directory:
+            storage = FileSystemStorage(location=directory)
+            self.assertIsNone(DenseTimeline.load('a.npy', storage))
+
+            dense.save('a.npy', storage)
+            loaded = DenseTimeline.load('a.npy', storage)
+            self.assertIsInstance(loaded.positions, np.memmap)
+            np.testing.assert_array_equal(loaded.positions, dense.positions)
+            self.assertEqual(loaded.dot_ids, dense.dot_ids)
+            self.assertEqual(loaded.fingerprints, dense.fingerprints)
+            del loaded
+
+    def test_save_remote(self):
+        """Test that DenseTimelines in remote storage are cached locally."""
+        data = make_show_data(num_dots=5, num_formations=3)
+        dense = DenseTimeline.build(data)
+
+        with tempfile.TemporaryDirectory() as directory, \
+                tempfile.TemporaryDirectory() as cache_dir, \
+                self.settings(
+                    TIMELINE_CACHE_DIR=cache_dir, TIMELINE_CACHE_FILES=1,
+                ):
+            storage = RemoteStorage(location=directory)
+            dense.save('a.npy', storage)
+            dense.save('b.npy', storage)
+            # only the last one is kept
+            self.assertEqual(os.listdir(cache_dir), ['b.npy'])
+
+            with mock.patch.object(
+                storage, 'open', wraps=storage.open,
+            ) as open_file:
+                DenseTimeline.load('b.npy', storage)
+                loaded = DenseTimeline.load('a.npy', storage)
+                DenseTimeline.load('a.npy', storage)
+            # only the positions of `a` are downloaded, once
+            opened = [call[1][0] for call in open_file.mock_calls]
+            self.assertEqual(opened.count('a.npy'), 1)
+            self.assertNotIn('b.npy', opened)
+
+            self.assertIsInstance(loaded.positions, np.memmap)
+            np.testing.assert_array_equal(loaded.positions, dense.positions)
+            del loaded
+
+            DenseTimeline.delete('a.npy', storage)
+            self.assertEqual(os.listdir(cache_dir), [])
+
+
+class RemoteStorage(Storage):
+    """A storage that is not on the local file system, like S3."""
+
+    def __init__(self, location):
+        """Initialize the storage, saving files in the given directory."""
+        self.files = FileSystemStorage(location=location)
+
+    def _open(self, name, mode='rb'):
+        return self.files.open(name, mode)
+
+    def _save(self, name, content):
+        return self.files.save(name, content)
+
+    def exists(self, name):
+        """Check if the file exists."""
+        return self.files.exists(name)
+
+    def delete(self, name):
+        """Delete the file."""
+        self.files.delete(name)
+
+
+class DependencyGraphTestCase(SimpleTestCase):
+    """Test calchart.showmodel.DependencyGraph."""
+
+    def get_dirty(self, data, previous_data):
+        """Get the dirty Formations and Flows of the given Shows."""
+        graph = DependencyGraph.from_show(data)
+        previous = DependencyGraph.from_show(previous_data)
+        return graph.get_dirty(previous)
+
+    def test_get_dirty(self):
+        """Test that only the changed Formation and its Flow are dirty."""
+        previous_data = make_show_data(num_formations=3)
+        data = json.loads(json.dumps(previous_data))
+        formation = data['formations'][1]
+        formation['name'] = 'Star'
+
+        self.assertEqual(self.get_dirty(data, previous_data), {
+            'formations': [formation['id']],
+            'flows': [formation['flows'][0]['id']],
+        })
+
+        flow_dots = data['formations'][0]['flows'][0]['dots']
+        next(iter(flow_dots.values()))['movements'][1]['endX'] = 0
+        dirty = self.get_dirty(data, previous_data)
+        self.assertEqual(len(dirty['formations']), 2)
+        self.assertEqual(len(dirty['flows']), 2)
+
+        graph = DependencyGraph.from_json(
+            json.loads(json.dumps(DependencyGraph.from_show(data).to_json())),
+        )
+        self.assertEqual(len(graph.get_dirty(None)['formations']), 3)
+
+    def test_get_dirty_downstream(self):
+        """Test that Formations after a Formation with nextDots are dirty."""
+        previous_data = make_show_data(num_formations=3)
+        next_dot = previous_data['formations'][1]['dots'][0]
+        previous_data['formations'][0]['nextDots'] = {'a': next_dot}
+        data = json.loads(json.dumps(previous_data))
+        data['formations'][0]['name'] = 'Star'
+
+        dirty = self.get_dirty(data, previous_data)
+        self.assertEqual(
+            dirty['formations'],
+            [formation['id'] for formation in data['formations'][:2]],
+        )
+        # the Flows only depend on their own Formation
+        self.assertEqual(len(dirty['flows']), 1)
+
+    def test_get_dirty_missing_dot(self):
+        """Test that Formations missing a dot depend on the previous one."""
+        previous_data = make_show_data(num_formations=3)
+        del previous_data['formations'][2]['dots'][0]
+        data = json.loads(json.dumps(previous_data))
+        data['formations'][1]['name'] = 'Star'
+
+        dirty = self.get_dirty(data, previous_data)
+        self.assertEqual(
+            dirty['formations'],
+            [formation['id'] for formation in data['formations'][1:]],
+        )
+
+
+class CollisionsTestCase(SimpleTestCase):
+    """Test calchart.showmodel.collisions."""
+
+    def test_find_collisions(self):
+        """Test that the collisions match comparing every pair of dots."""
+        rand = np.random.RandomState(0)
+        positions = rand.uniform(0, 20, (30, 40, 3))
+        positions[0, 0] = np.nan
+
+        beats, dots, other_dots, distances = find_collisions(
+            positions, 1.5, workers=2,
+        )
+
+        x = positions[..., 0]
+        y = positions[..., 1]
+        expected = np.hypot(
+            x[:, :, np.newaxis] - x[:, np.newaxis],
+            y[:, :, np.newaxis] - y[:, np.newaxis],
+        )
+        with np.errstate(invalid='ignore'):
+            expected = np.nonzero(np.triu(expected < 1.5, 1))
+        self.assertGreater(len(beats), 0)
+        np.testing.assert_array_equal(beats, expected[0])
+        np.testing.assert_array_equal(dots, expected[1])
+        np.testing.assert_array_equal(other_dots, expected[2])
+        self.assertTrue(np.all(distances < 1.5))
+
+    def test_find_collisions_invalid_distance(self):
+        """Test that the distance must be a positive, finite number."""
+        positions = np.zeros((2, 3, 3))
+        for distance in [0, -1, float('nan'), float('inf')]:
+            with self.assertRaises(ValueError):
+                find_collisions(positions, distance)
+
+        # the cells of the grid would overflow
+        positions[:, 1, :2] = 100
+        for distance in [1e-300, 5e-324]:
+            with self.assertRaisesRegex(ValueError, 'too small'):
+                find_collisions(positions, distance)
+
+    def test_group_collisions(self):
+        """Test merging the collisions of a pair on consecutive beats."""
+        positions = np.zeros((5, 3, 3))
+        positions[:, 1, 0] = [0.5, 0.2, 5, 0.5, 5]
+        positions[:, 2, 0] = 5
+
+        collisions = group_collisions(*find_collisions(positions, 1))
+        self.assertEqual(collisions, [
+            (0, 1, 0, 1, 0.2),
+            (1, 2, 2, 2, 0),
+            (0, 1, 3, 3, 0.5),
+            (1, 2, 4, 4, 0),
+        ])
+
+    def test_find_collisions_fast(self):
+        """Test scanning 250 dots over thousands of beats."""
+        data = make_show_data(num_dots=250, num_formations=200)
+        positions = DenseTimeline.build(data).positions
+
+        start = time.perf_counter()
+        collisions = find_collisions(positions, 2.5, workers=4)
+        seconds = time.perf_counter() - start
+
+        # each dot is 2 steps from the dots next to it
+        self.assertEqual(len(collisions[0]), 433 * len(positions))
+        self.assertLess(seconds, 1)
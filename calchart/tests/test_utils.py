@@ -0,0 +1,368 @@
+"""Tests for the utility modules."""
+
+import gzip
+import json
+from unittest import mock
+
+from calchart.models import Show, User
+
+from django.core.files.storage import default_storage
+from django.test import SimpleTestCase, TestCase, override_settings
+
+from utils import codec, db, metrics
+from utils.db import UpdateShowVersion, get_plan_updates, migrate_shows
+from utils.jsonpatch import JsonPatchError, apply_patch, make_patch
+from utils.storage import open_gzip_head, read_blob, write_blob
+from utils.testing import make_show_data
+
+
+class JsonPatchTestCase(SimpleTestCase):
+    """Test utils.jsonpatch."""
+
+    DOC = {
+        'name': 'Foo',
+        'dots': [{'id': 'a'}, {'id': 'b'}],
+        'a/b': {'~c': 1},
+    }
+
+    def test_apply_patch(self):
+        """Test applying every kind of operation."""
+        doc = apply_patch(self.DOC, [
+            {'op': 'test', 'path': '/a~1b/~0c', 'value': 1},
+            {'op': 'replace', 'path': '/name', 'value': 'Bar'},
+            {'op': 'add', 'path': '/dots/1', 'value': {'id': 'c'}},
+            {'op': 'remove', 'path': '/dots/0'},
+            {'op': 'copy', 'from': '/dots/0', 'path': '/first'},
+            {'op': 'move', 'from': '/a~1b', 'path': '/ab'},
+        ])
+
+        self.assertEqual(doc, {
+            'name': 'Bar',
+            'dots': [{'id': 'c'}, {'id': 'b'}],
+            'first': {'id': 'c'},
+            'ab': {'~c': 1},
+        })
+        # the original document should not change
+        self.assertEqual(self.DOC['name'], 'Foo')
+
+    def test_apply_patch_invalid(self):
+        """Test that invalid patches raise a JsonPatchError."""
+        invalid_patches = [
+            [{'op': 'remove', 'path': '/missing'}],
+            [{'op': 'add', 'path': '/dots/5', 'value': None}],
+            [{'op': 'test', 'path': '/name', 'value': 'Bar'}],
+            [{'op': 'replace', 'path': '/name'}],
+            [{'op': 'foo', 'path': '/name'}],
+        ]
+        for patch in invalid_patches:
+            with self.assertRaises(JsonPatchError):
+                apply_patch(self.DOC, patch)
+
+    def test_make_patch(self):
+        """Test that a patch only changes the values that changed."""
+        target = {
+            'name': 'Foo',
+            'dots': [{'id': 'a'}, {'id': 'c'}, {'id': 'd'}, {'id': 'b'}],
+            'a/b': {'~c': 1.0},
+            'isBand': True,
+        }
+        patch = make_patch(self.DOC, target)
+        self.assertEqual(patch, [
+            {'op': 'add', 'path': '/dots/1', 'value': {'id': 'c'}},
+            {'op': 'add', 'path': '/dots/2', 'value': {'id': 'd'}},
+            {'op': 'replace', 'path': '/a~1b/~0c', 'value': 1.0},
+            {'op': 'add', 'path': '/isBand', 'value': True},
+        ])
+        self.assertEqual(
+            json.dumps(apply_patch(self.DOC, patch)), json.dumps(target),
+        )
+        self.assertEqual(make_patch(target, target), [])
+
+
+def add_date(data):
+    """Update a Show to version 2 for testing."""
+    data['date'] = '2017-01-01'
+
+
+def add_songs(data):
+    """Update a Show to version 3 for testing."""
+    data['songs'] = []
+
+
+class CodecTestCase(SimpleTestCase):
+    """Test utils.codec."""
+
+    VALUES = [
+        codec.SAMPLE,
+        make_show_data(),
+        {'name': '</script>\u2028\x00', 'sizes': [1e16, 5e-324, 2 ** 63]},
+    ]
+
+    def test_backends(self):
+        """Test that the backends encode and decode like the json module."""
+        standard = codec.BACKENDS['json']()
+        for name in codec.BACKENDS:
+            encoder = codec.get_encoder((name,))
+            decoder = codec.get_decoder((name,))
+            for i, value in enumerate(self.VALUES):
+                for sort_keys in [False, True]:
+                    with self.subTest(backend=name, value=i):
+                        content = standard.dumpb(value, sort_keys)
+                        self.assertEqual(
+                            encoder.dumpb(value, sort_keys), content,
+                        )
+                        self.assertEqual(
+                            standard.dumpb(decoder.loads(content), sort_keys),
+                            content,
+                        )
+
+            # only encoded, since JSON parsers don't support larger integers
+            self.assertEqual(
+                encoder.dumpb(codec.SAMPLE_EXTRA, False),
+                standard.dumpb(codec.SAMPLE_EXTRA, False),
+            )
+
+    def test_encode(self):
+        """Test encoding compact JSON, with non-ASCII characters as UTF-8."""
+        value = {'name': 'é', 'values': [1, 0.5, None]}
+        self.assertEqual(
+            codec.dumpb(value), '{"name":"é","values":[1,0.5,null]}'.encode(),
+        )
+        self.assertEqual(codec.dumps(value), codec.dumpb(value).decode())
+        self.assertEqual(codec.loads(codec.dumpb(value)), value)
+
+    def test_fallback(self):
+        """Test that backends encoding JSON differently are not used."""
+        class SpacedBackend(object):
+            def dumpb(self, value, sort_keys):
+                return json.dumps(value, sort_keys=sort_keys).encode()
+
+            def loads(self, content):
+                return json.loads(content)
+
+        with mock.patch.dict(codec.BACKENDS, spaced=SpacedBackend):
+            encoder = codec.get_encoder(('spaced', 'missing'))
+            decoder = codec.get_decoder(('spaced', 'missing'))
+        self.assertEqual(encoder.name, 'json')
+        self.assertIsInstance(decoder, SpacedBackend)
+
+
+class MetricsTestCase(SimpleTestCase):
+    """Test utils.metrics."""
+
+    def setUp(self):
+        """Reset metrics between tests."""
+        metrics.reset()
+
+    def test_collect(self):
+        """Test collecting the counters incremented in a block."""
+        metrics.increment('foo')
+        with metrics.collect() as outer:
+            metrics.increment('foo', 2)
+            with metrics.collect() as inner:
+                metrics.increment('bar')
+            metrics.increment('foo')
+
+        self.assertEqual(outer, {'foo': 3, 'bar': 1})
+        self.assertEqual(inner, {'bar': 1})
+        self.assertEqual(metrics.get_counters(), {'foo': 4, 'bar': 1})
+
+
+class StorageTestCase(SimpleTestCase):
+    """Test utils.storage."""
+
+    def test_gzip_tail(self):
+        """Test compressing the end of a file as its own gzip member."""
+        content = b'{"name":"Foo"}'
+        _, name = write_blob('test', content, '.json', compression='gzip')
+        self.addCleanup(default_storage.delete, name)
+        _, tail_name = write_blob(
+            'tail', content, '.json', compression='gzip', tail=1,
+        )
+        self.addCleanup(default_storage.delete, tail_name)
+
+        self.assertEqual(read_blob(tail_name), content)
+        self.assertIsNone(open_gzip_head(name, b'}'))
+        with open_gzip_head(tail_name, b'}') as f:
+            head = f.read()
+        self.assertEqual(gzip.decompress(head), content[:-1])
+
+    def test_write_blob_concurrent(self):
+        """Test that a blob saved at the same time is not duplicated."""
+        content = b'{"name":"Foo"}'
+        _, name = write_blob('test', content, '.json')
+        self.addCleanup(default_storage.delete, name)
+
+        # as if saved by another request after checking if it exists
+        exists = default_storage.exists
+        checked = []
+
+        def exists_later(name):
+            checked.append(name)
+            return len(checked) > 1 and exists(name)
+
+        with mock.patch.object(
+            default_storage, 'exists', side_effect=exists_later,
+        ):
+            _, second_name = write_blob('test', content, '.json')
+        self.assertEqual(second_name, name)
+        _, files = default_storage.listdir('test')
+        self.assertEqual(files, [name.split('/')[-1]])
+
+
+class MigrateShowsTestCase(TestCase):
+    """Test utils.db.migrate_shows."""
+
+    def setUp(self):
+        """Create Shows to update."""
+        user = User.objects.create(username='foo')
+        for name in ['Foo', 'Bar', 'Baz']:
+            show = Show.objects.create(name=name, owner=user)
+            show.save_data({
+                'version': 1,
+                'slug': show.slug,
+                'name': name,
+                'isBand': False,
+                'published': False,
+            })
+
+    def test_migrate_shows(self):
+        """Test updating every Show."""
+        stats = migrate_shows(Show, [(2, add_date)])
+        self.assertEqual(stats['updated'], 3)
+
+        for show in Show.objects.all():
+            self.assertEqual(show.version, 2)
+            data = show.get_data()
+            self.assertEqual(data['version'], 2)
+            self.assertEqual(data['date'], '2017-01-01')
+
+    def test_migrate_shows_hooks(self):
+        """Test that updated Shows are recorded like saved Shows."""
+        show = Show.objects.get(slug='foo')
+        with mock.patch(
+            'calchart.models.Show.request_timeline',
+        ) as request_timeline, mock.patch(
+            'calchart.models.run_in_background',
+        ):
+            migrate_shows(Show, [(2, add_date)])
+
+        request_timeline.assert_any_call(show.pk, f'{show.data_hash}-0')
+        updated = Show.objects.get(slug='foo')
+        self.assertEqual(updated.revision, show.revision + 1)
+        self.assertEqual(updated.date_modified, show.date_modified)
+        self.assertEqual(
+            updated.get_revision_data(updated.revision)['date'], '2017-01-01',
+        )
+
+    @override_settings(SHOW_MIGRATION_EXECUTOR='process')
+    def test_migrate_shows_processes(self):
+        """Test updating Shows on a process pool."""
+        stats = migrate_shows(Show, [(2, add_date)])
+        self.assertEqual(stats['updated'], 3)
+        self.assertEqual(Show.objects.get(slug='foo').get_data()['version'], 2)
+
+    def test_migrate_shows_patched(self):
+        """Test that pending patches are applied before updating."""
+        show = Show.objects.get(slug='foo')
+        show.patch_data([{'op': 'add', 'path': '/songs', 'value': []}])
+
+        migrate_shows(Show, [(2, add_date)])
+
+        show = Show.objects.get(slug='foo')
+        self.assertEqual(show.patches.count(), 0)
+        self.assertEqual(show.get_data()['songs'], [])
+
+    def test_migrate_shows_resume(self):
+        """Test that updated Shows are skipped without being downloaded."""
+        Show.objects.filter(slug='foo').update(version=None)
+        Show.objects.filter(slug='bar').update(version=2)
+
+        with mock.patch('utils.db.read_blob', wraps=read_blob) as read:
+            stats = migrate_shows(Show, [(2, add_date)])
+
+        # foo has no cached version, so it is downloaded and updated
+        self.assertEqual(stats['updated'], 2)
+        self.assertEqual(read.call_count, 2)
+        self.assertNotIn('date', Show.objects.get(slug='bar').get_data())
+
+        stats = migrate_shows(Show, [(2, add_date)])
+        self.assertEqual(stats['updated'] + stats['skipped'], 0)
+
+    def test_migrate_shows_changed(self):
+        """Test that Shows saved while being updated are left as is."""
+        save_migrated_show = db._save_migrated_show
+        written = []
+
+        def save_changed(Show, show, *args):
+            if show.slug == 'foo':
+                Show.objects.get(pk=show.pk).save_data(
+                    dict(show.get_data(), name='Changed'),
+                )
+            return save_migrated_show(Show, show, *args)
+
+        def write(*args, **kwargs):
+            written.append(write_blob(*args, **kwargs)[1])
+            return False, written[-1]
+
+        with mock.patch(
+            'utils.db._save_migrated_show', side_effect=save_changed,
+        ), mock.patch('utils.db.write_blob', side_effect=write):
+            stats = migrate_shows(Show, [(2, add_date)])
+
+        self.assertEqual(stats['updated'], 2)
+        self.assertEqual(stats['changed'], 1)
+
+        # the update of foo is discarded
+        show = Show.objects.get(slug='foo')
+        self.assertEqual(show.version, 1)
+        self.assertEqual(show.get_data()['name'], 'Changed')
+        self.assertNotIn('date', show.get_data())
+        in_use = set(Show.objects.values_list('data_file', flat=True))
+        for name in written:
+            self.assertEqual(default_storage.exists(name), name in in_use)
+
+        stats = migrate_shows(Show, [(2, add_date)])
+        self.assertEqual(stats['updated'], 1)
+        show = Show.objects.get(slug='foo')
+        self.assertEqual(show.get_data()['date'], '2017-01-01')
+        self.assertEqual(show.revision, 3)
+
+    def test_migrate_shows_chained(self):
+        """Test that multiple versions are applied with one read per Show."""
+        plan = [
+            (mock.Mock(operations=[UpdateShowVersion(3, add_songs)]), False),
+            (mock.Mock(operations=[UpdateShowVersion(2, add_date)]), False),
+            (mock.Mock(operations=[UpdateShowVersion(4, add_date)]), True),
+        ]
+        updates = get_plan_updates(plan)
+        self.assertEqual(updates, [(2, add_date), (3, add_songs)])
+
+        with mock.patch('utils.db.read_blob', wraps=read_blob) as read:
+            stats = migrate_shows(Show, updates)
+
+        self.assertEqual(stats['updated'], 3)
+        self.assertEqual(read.call_count, 3)
+
+        data = Show.objects.get(slug='foo').get_data()
+        self.assertEqual(data['version'], 3)
+        self.assertEqual(data['date'], '2017-01-01')
+        self.assertEqual(data['songs'], [])
+
+    def test_migrate_shows_dry_run(self):
+        """Test that a dry run reports each Show without saving it."""
+        data_files = set(Show.objects.values_list('data_file', flat=True))
+
+        with mock.patch('utils.db.write_blob') as write:
+            stats = migrate_shows(Show, [(2, add_date)], dry_run=True)
+
+        self.assertEqual(stats['updated'], 3)
+        self.assertFalse(write.called)
+        versions = [
+            (show['from_version'], show['version']) for show in stats['shows']
+        ]
+        self.assertEqual(versions, [(1, 2)] * 3)
+        self.assertEqual(
+            set(Show.objects.values_list('data_file', flat=True)), data_files,
+        )
+        self.assertNotIn('date', Show.objects.get(slug='foo').get_data())
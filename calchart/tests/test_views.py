@@ -0,0 +1,263 @@
+"""Tests for views and endpoints."""
+
+import gzip
+import io
+import json
+import re
+import uuid
+import zipfile
+from datetime import timedelta
+from unittest import mock
+
+from calchart.models import Show, User
+
+from django.test.client import Client
+from django.utils import timezone
+
+from utils import codec, metrics
+from utils.testing import (
+    ActionsTestCase,
+    get_user,
+    make_show_data,
+    mock_endpoint,
+)
+
+from . import test_actions
+
+
+class ExportTestCase(ActionsTestCase):
+    """Test the export endpoint."""
+
+    def setUp(self):
+        """Create a show to export."""
+        data = test_actions.CreateShowTestCase.SHOW_DATA.copy()
+        self.slug = self.do_action('create_show', data)['slug']
+        self.url = f'/download/{self.slug}.json'
+
+    def get_content(self, response):
+        """Get the content of the given streaming response."""
+        return b''.join(response.streaming_content)
+
+    def test_export(self):
+        """Test streaming the entire show."""
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+
+        content = self.get_content(response)
+        self.assertEqual(int(response['Content-Length']), len(content))
+        self.assertEqual(
+            json.loads(content),
+            Show.objects.get(slug=self.slug).get_data(),
+        )
+
+    def test_export_not_modified(self):
+        """Test that a matching ETag returns a 304 response."""
+        etag = self.client.get(self.url)['ETag']
+
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+        self.do_action('publish_show', {'slug': self.slug, 'publish': True})
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_export_range(self):
+        """Test requesting a byte range of the show."""
+        content = self.get_content(self.client.get(self.url))
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=5-14')
+        self.assertEqual(response.status_code, 206)
+        self.assertEqual(self.get_content(response), content[5:15])
+        self.assertEqual(
+            response['Content-Range'], f'bytes 5-14/{len(content)}',
+        )
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=-10')
+        self.assertEqual(self.get_content(response), content[-10:])
+
+        response = self.client.get(self.url, HTTP_RANGE='bytes=100000-')
+        self.assertEqual(response.status_code, 416)
+
+    def test_export_gzip(self):
+        """Test compressing the show with gzip."""
+        content = self.get_content(self.client.get(self.url))
+
+        with self.settings(EXPORT_ENCODINGS=['gzip']):
+            response = self.client.get(
+                self.url, HTTP_ACCEPT_ENCODING='deflate, gzip;q=0.5',
+            )
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(
+            gzip.decompress(self.get_content(response)), content,
+        )
+
+    def test_export_gzip_stored(self):
+        """Test sending a data file saved with gzip without decompressing."""
+        self.do_action('publish_show', {'slug': self.slug, 'publish': True})
+        show = Show.objects.get(slug=self.slug)
+        with show.data_file.storage.open(show.data_file.name) as f:
+            stored = f.read()
+
+        with mock.patch.object(Show, 'open_data_json') as open_data_json:
+            response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip')
+            content = self.get_content(response)
+            open_data_json.assert_not_called()
+
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertEqual(int(response['Content-Length']), len(content))
+        self.assertEqual(content[:100], stored[:100])
+        self.assertEqual(gzip.decompress(content), show.get_data_json())
+        self.assertTrue(json.loads(gzip.decompress(content))['published'])
+
+
+class MetricsTestCase(ActionsTestCase):
+    """Test the metrics recorded for each action, and the metrics endpoint."""
+
+    def setUp(self):
+        """Reset metrics between tests."""
+        metrics.reset()
+
+    def test_action_metrics(self):
+        """Test recording the metrics of each action."""
+        data = test_actions.CreateShowTestCase.SHOW_DATA.copy()
+        with self.assertLogs('calchart.actions', 'INFO') as logs:
+            slug = self.do_action('create_show', data)['slug']
+            response = self.do_action(
+                'get_show', {'slug': 'missing'}, raw=True,
+            )
+            self.assertEqual(response.status_code, 404)
+        self.do_action('get_show', {'slug': slug})
+
+        # a new show, so that its data is not already in storage
+        self.do_action('save_show', dict(
+            make_show_data(seed=uuid.uuid4().int), slug=slug,
+        ))
+
+        counters = metrics.get_counters('actions.')
+        self.assertEqual(counters['actions.create_show.calls'], 1)
+        self.assertEqual(counters['actions.create_show.errors'], 0)
+        self.assertEqual(
+            counters['actions.create_show.request_bytes'],
+            len(codec.dumps(data)),
+        )
+        self.assertGreater(counters['actions.create_show.response_bytes'], 0)
+        self.assertEqual(counters['actions.get_show.calls'], 2)
+        self.assertEqual(counters['actions.get_show.errors'], 1)
+        self.assertGreater(counters['actions.get_show.storage.bytes_read'], 0)
+        self.assertGreater(
+            counters['actions.save_show.storage.bytes_written'], 0,
+        )
+
+        histograms = metrics.get_histograms('actions.')
+        self.assertEqual(histograms['actions.get_show.seconds']['count'], 2)
+
+        log = json.loads(logs.records[1].getMessage())
+        self.assertEqual(log['action'], 'get_show')
+        self.assertEqual(log['status'], 404)
+        self.assertEqual(log['storage.bytes_read'], 0)
+
+    def test_unknown_action(self):
+        """Test that unknown actions are not recorded."""
+        response = self.do_action('get_data', {}, raw=True)
+        self.assertEqual(response.status_code, 500)
+        self.assertEqual(metrics.get_counters('actions.'), {})
+
+    def test_metrics_endpoint(self):
+        """Test getting the metrics, only as a superuser."""
+        data = test_actions.CreateShowTestCase.SHOW_DATA.copy()
+        self.do_action('create_show', data)
+
+        self.client.force_login(get_user())
+        response = self.client.get('/metrics.json')
+        self.assertEqual(response.status_code, 200)
+        content = json.loads(response.content)
+        self.assertEqual(content['counters']['actions.create_show.calls'], 1)
+        self.assertIn('actions.create_show.seconds', content['histograms'])
+
+        response = Client().get('/metrics.json')
+        self.assertEqual(response.status_code, 404)
+
+
+class ViewpsheetsTestCase(ActionsTestCase):
+    """Test the viewpsheets endpoint."""
+
+    def setUp(self):
+        """Create a show with a dot group."""
+        self.data = make_show_data(num_dots=8, num_formations=3)
+        self.data['dotGroups'] = {'A': 0}
+        for formation in self.data['formations']:
+            for formation_dot in formation['dots'][:2]:
+                formation_dot['dotGroup'] = 'A'
+
+        show = Show.objects.create(name=self.data['name'], owner=get_user())
+        show.save_data(self.data)
+        self.url = f'/download/{show.slug}/viewpsheets'
+        self.client.force_login(get_user())
+
+    def get_content(self, response):
+        """Get the content of the given streaming response."""
+        self.assertEqual(response.status_code, 200)
+        return b''.join(response.streaming_content)
+
+    def assertValidPDF(self, content, num_pages):
+        """Assert that the given PDF has valid offsets and pages."""
+        self.assertTrue(content.startswith(b'%PDF-1.4'))
+        self.assertTrue(content.endswith(b'%%EOF\n'))
+        self.assertIn(f'/Count {num_pages} '.encode(), content)
+
+        xref = int(re.search(rb'startxref\n(\d+)', content).group(1))
+        self.assertTrue(content[xref:].startswith(b'xref'))
+        offsets = re.findall(rb'(\d{10}) 00000 n', content[xref:])
+        for i, offset in enumerate(offsets):
+            start = int(offset)
+            self.assertTrue(
+                content[start:].startswith(f'{i + 1} 0 obj'.encode()),
+            )
+
+    def test_viewpsheets_pdf(self):
+        """Test drawing every dot into one PDF."""
+        response = self.client.get(f'{self.url}.pdf')
+        self.assertEqual(response['Content-Type'], 'application/pdf')
+        # a page of birds eye graphs and a page of Formations for each dot
+        self.assertValidPDF(self.get_content(response), 16)
+
+        response = self.client.get(f'{self.url}.pdf', {'group': 'A'})
+        self.assertValidPDF(self.get_content(response), 4)
+
+        dot_id = self.data['dots'][3]['id']
+        with self.settings(VIEWPSHEET_EXECUTOR='process'):
+            response = self.client.get(f'{self.url}.pdf', {'dots': dot_id})
+            self.assertValidPDF(self.get_content(response), 2)
+
+        response = self.client.get(f'{self.url}.pdf', {'group': 'B'})
+        self.assertEqual(response.status_code, 404)
+
+    def test_viewpsheets_zip(self):
+        """Test drawing a PDF for each dot into a ZIP file."""
+        response = self.client.get(f'{self.url}.zip', {'group': 'A'})
+        self.assertEqual(response['Content-Type'], 'application/zip')
+
+        content = io.BytesIO(self.get_content(response))
+        with zipfile.ZipFile(content) as f:
+            self.assertEqual(sorted(f.namelist()), ['A0.pdf', 'A1.pdf'])
+            self.assertValidPDF(f.read('A0.pdf'), 2)
+
+    def test_viewpsheets_permissions(self):
+        """Test that viewpsheets require a user who can view the show."""
+        response = Client().get(f'{self.url}.pdf')
+        self.assertEqual(response.status_code, 302)
+
+        Show.objects.update(is_band=True)
+        user = User.objects.create(
+            username='bar',
+            api_token='abc',
+            api_token_expiry=timezone.now() + timedelta(days=7),
+        )
+        self.client.force_login(user)
+        with self.settings(
+            MEMBERS_ONLY_DOMAIN='https://members.example.com',
+            MEMBERS_ONLY_CACHE_TTL=0,
+        ), mock_endpoint('check-committee', {'has_committee': False}):
+            response = self.client.get(f'{self.url}.pdf')
+        self.assertEqual(response.status_code, 403)
@@ -1,14 +1,27 @@
 """Utilities for accessing the Members Only API."""
 
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
 from urllib.parse import quote
 
 from django.conf import settings
+from django.core.cache import cache
 from django.core.urlresolvers import reverse
 
 import requests
+from requests.adapters import HTTPAdapter
+from requests.packages.urllib3.util.retry import Retry
+
+from utils import metrics
 
 APP_NAME = 'calchart'
 NO_API_MESSAGE = 'Cannot access API if MEMBERS_ONLY_DOMAIN is set to None.'
+NO_BATCH_CACHE_KEY = 'members-only:no-batch'
+
+_session = None
+_session_pid = None
+_session_lock = threading.Lock()
 
 
 def get_login_url(request, redirect_url=None):
@@ -32,17 +45,62 @@ def get_login_url(request, redirect_url=None):
     )
 
 
+def get_session():
+    """
+    Get the HTTP session used to call the Members Only API.
+
+    The session is shared by every thread in this process, keeping up to
+    MEMBERS_ONLY_POOL_SIZE connections alive. Only GET requests, which are
+    idempotent, are retried. A new session is created after forking (e.g.
+    when gunicorn preloads the app) so connections are never shared between
+    processes.
+    """
+    global _session, _session_pid
+
+    pid = os.getpid()
+    with _session_lock:
+        if _session is None or _session_pid != pid:
+            retries = Retry(
+                total=settings.MEMBERS_ONLY_RETRIES,
+                backoff_factor=settings.MEMBERS_ONLY_BACKOFF,
+                status_forcelist=(502, 503, 504),
+            )
+            adapter = HTTPAdapter(
+                pool_connections=1,
+                pool_maxsize=settings.MEMBERS_ONLY_POOL_SIZE,
+                max_retries=retries,
+            )
+            session = requests.Session()
+            session.mount('http://', adapter)
+            session.mount('https://', adapter)
+
+            _session = session
+            _session_pid = pid
+
+        return _session
+
+
+def get_timeout(endpoint):
+    """Get the timeout, in seconds, for the given endpoint."""
+    return settings.MEMBERS_ONLY_TIMEOUTS.get(
+        endpoint, settings.MEMBERS_ONLY_TIMEOUT,
+    )
+
+
 def call_endpoint(endpoint, user, method='GET', **params):
     """
     Call the given Members Only API endpoint on behalf of the given user.
 
     The endpoint is called with the given method and parameters, returning
-    the JSON data returned by the API.
+    the JSON data returned by the API. The latency of each call is recorded
+    in the `members_only.<endpoint>` histogram, and the number of calls in
+    the `members_only.calls` counter.
     """
+    session = get_session()
     if method == 'GET':
-        call = requests.get
+        call = session.get
     elif method == 'POST':
-        call = requests.post
+        call = session.post
     else:
         raise ValueError
 
@@ -51,11 +109,52 @@ def call_endpoint(endpoint, user, method='GET', **params):
     if settings.MEMBERS_ONLY_DOMAIN is None:
         raise ValueError(NO_API_MESSAGE)
 
-    r = call(
-        f'{settings.MEMBERS_ONLY_DOMAIN}/api/{endpoint}/',
-        params=params, timeout=1,
-    )
+    metrics.increment('members_only.calls')
+    with metrics.timer(f'members_only.{endpoint}'):
+        r = call(
+            f'{settings.MEMBERS_ONLY_DOMAIN}/api/{endpoint}/',
+            params=params, timeout=get_timeout(endpoint),
+        )
     # error if bad status code
     r.raise_for_status()
 
     return r.json()
+
+
+def fetch_committees(user, committees=()):
+    """
+    Get the committees the given user is part of.
+
+    Uses the get-committees batch endpoint to fetch every committee in one
+    round trip. If the endpoint is not available, the given committees are
+    checked in parallel with the check-committee endpoint instead.
+
+    Returns a tuple of a dictionary mapping committees to whether the user is
+    part of the committee, and whether the dictionary contains every
+    committee the user is part of.
+    """
+    if not cache.get(NO_BATCH_CACHE_KEY):
+        try:
+            response = call_endpoint('get-committees', user)
+        except requests.HTTPError as e:
+            if e.response is None or e.response.status_code != 404:
+                raise
+            ttl = settings.MEMBERS_ONLY_CACHE_TTL
+            cache.set(NO_BATCH_CACHE_KEY, True, ttl)
+        else:
+            fetched = {committee: False for committee in committees}
+            fetched.update({
+                committee: True for committee in response['committees']
+            })
+            return fetched, True
+
+    def check_committee(committee):
+        response = call_endpoint('check-committee', user, committee=committee)
+        return response['has_committee']
+
+    if len(committees) == 0:
+        return {}, False
+
+    with ThreadPoolExecutor(max_workers=len(committees)) as executor:
+        results = executor.map(check_committee, committees)
+        return dict(zip(committees, results)), False
@@ -0,0 +1,56 @@
+"""Utilities for running tasks in a background thread."""
+
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.db import connection, transaction
+
+logger = logging.getLogger(__name__)
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def run_in_background(func, *args, **kwargs):
+    """
+    Run the given function in a background thread in this process.
+
+    The function is only run after the current transaction commits, so it
+    sees anything saved in the request. Tasks are run one at a time, and
+    any errors are logged instead of raised.
+    """
+    transaction.on_commit(
+        lambda: submit_in_background(func, *args, **kwargs),
+    )
+
+
+def submit_in_background(func, *args, **kwargs):
+    """
+    Run the given function in the background thread, without waiting.
+
+    Like run_in_background, but the function is queued immediately, even in
+    a transaction, so it should only use data that is already committed.
+    """
+    _get_executor().submit(_run, func, *args, **kwargs)
+
+
+def _get_executor():
+    """Get the executor that runs background tasks."""
+    global _executor
+
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=1)
+        return _executor
+
+
+def _run(func, *args, **kwargs):
+    """Run the given background task."""
+    try:
+        func(*args, **kwargs)
+    except Exception:
+        logger.exception(f'Background task failed: {func.__name__}')
+    finally:
+        # each thread has its own database connection
+        connection.close()
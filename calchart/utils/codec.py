@@ -0,0 +1,202 @@
+"""
+Encoding and decoding JSON with the fastest JSON library installed.
+
+The backends are chosen from JSON_BACKENDS (orjson, then ujson, then the
+standard library's json module) the first time JSON is encoded or decoded.
+JSON is always encoded the same way: without whitespace, with non-ASCII
+characters written as UTF-8, and with Django's types (e.g. dates) encoded
+like DjangoJSONEncoder.
+
+Encoded JSON is hashed (e.g. in DependencyGraph keys), so a backend is only
+used to encode if it encodes SAMPLE exactly like the json module; the output
+never depends on which libraries are installed. Some libraries format
+floats differently (e.g. orjson writes 1e-7 instead of 1e-07), so they may
+only be used to decode.
+"""
+
+import datetime
+import functools
+import json
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+
+# a value using every feature of JSON, to check that a backend encodes JSON
+# like the json module
+SAMPLE = {
+    'name': 'Foo "Bar" \\ /\n\té中\U0001f3c8',
+    'ints': [0, -1, 2 ** 53, 10 ** 18],
+    'floats': [0.5, -1.25, 0.1, 1e-07, 123456.789, 1e+22],
+    'values': [True, False, None, [], {}],
+    'nested': {'z': {'y': [1, {'x': 'w'}]}, 'a': 0},
+}
+
+# values that must also be encoded like the json module: integers too large
+# for JSON parsers, and values that aren't JSON types, which are encoded like
+# DjangoJSONEncoder
+SAMPLE_EXTRA = [
+    2 ** 64,
+    datetime.datetime(2018, 1, 2, 3, 4, 5, 678901, datetime.timezone.utc),
+    datetime.date(2018, 1, 2),
+]
+
+
+class RawJSON(bytes):
+    """
+    Bytes that are already encoded JSON.
+
+    Actions can return RawJSON to send saved JSON to the client without
+    decoding and encoding it again; see dispatch.call_action.
+    """
+
+
+class _StandardBackend(object):
+    """Encodes and decodes JSON with the standard library's json module."""
+
+    name = 'json'
+
+    def dumpb(self, value, sort_keys):
+        """Encode the given value as JSON bytes."""
+        return json.dumps(
+            value,
+            separators=(',', ':'),
+            ensure_ascii=False,
+            sort_keys=sort_keys,
+            default=_default,
+        ).encode()
+
+    def loads(self, content):
+        """Decode the given JSON string or bytes."""
+        return json.loads(content)
+
+
+class _OrjsonBackend(object):
+    """Encodes and decodes JSON with orjson."""
+
+    name = 'orjson'
+
+    def __init__(self):
+        """Import orjson, raising an ImportError if it is not installed."""
+        import orjson
+        self._orjson = orjson
+        self._option = (
+            orjson.OPT_NON_STR_KEYS |
+            orjson.OPT_PASSTHROUGH_DATETIME
+        )
+
+    def dumpb(self, value, sort_keys):
+        """Encode the given value as JSON bytes."""
+        option = self._option
+        if sort_keys:
+            option |= self._orjson.OPT_SORT_KEYS
+        return self._orjson.dumps(value, default=_default, option=option)
+
+    def loads(self, content):
+        """Decode the given JSON string or bytes."""
+        return self._orjson.loads(content)
+
+
+class _UjsonBackend(object):
+    """Encodes and decodes JSON with ujson."""
+
+    name = 'ujson'
+
+    def __init__(self):
+        """Import ujson, raising an ImportError if it is not installed."""
+        import ujson
+        self._ujson = ujson
+
+    def dumpb(self, value, sort_keys):
+        """Encode the given value as JSON bytes."""
+        return self._ujson.dumps(
+            value,
+            ensure_ascii=False,
+            escape_forward_slashes=False,
+            sort_keys=sort_keys,
+            default=_default,
+        ).encode()
+
+    def loads(self, content):
+        """Decode the given JSON string or bytes."""
+        return self._ujson.loads(content)
+
+
+# every backend, by name
+BACKENDS = {
+    backend.name: backend
+    for backend in [_OrjsonBackend, _UjsonBackend, _StandardBackend]
+}
+
+
+def dumps(value, *, sort_keys=False):
+    """Encode the given value as a JSON string."""
+    return get_encoder().dumpb(value, sort_keys).decode()
+
+
+def dumpb(value, *, sort_keys=False):
+    """Encode the given value as JSON bytes (UTF-8)."""
+    return get_encoder().dumpb(value, sort_keys)
+
+
+def loads(content):
+    """Decode the given JSON string or bytes (UTF-8)."""
+    return get_decoder().loads(content)
+
+
+@functools.lru_cache(maxsize=None)
+def get_encoder(names=None):
+    """
+    Get the backend used to encode JSON.
+
+    Returns the first of the given backends (defaults to JSON_BACKENDS)
+    that is installed and encodes SAMPLE and SAMPLE_EXTRA exactly like the
+    json module.
+    """
+    standard = _StandardBackend()
+    expected = standard.dumpb(SAMPLE, True)
+    expected_extra = standard.dumpb(SAMPLE_EXTRA, False)
+    return _choose_backend(names, lambda backend: (
+        backend.dumpb(SAMPLE, True) == expected and
+        backend.dumpb(SAMPLE_EXTRA, False) == expected_extra
+    ))
+
+
+@functools.lru_cache(maxsize=None)
+def get_decoder(names=None):
+    """
+    Get the backend used to decode JSON.
+
+    Returns the first of the given backends (defaults to JSON_BACKENDS)
+    that is installed and decodes SAMPLE exactly like the json module.
+    """
+    standard = _StandardBackend()
+    content = standard.dumpb(SAMPLE, False)
+    return _choose_backend(names, lambda backend: (
+        standard.dumpb(backend.loads(content), False) == content and
+        standard.dumpb(backend.loads(content.decode()), False) == content
+    ))
+
+
+def _choose_backend(names, check):
+    """Get the first of the given backends that passes the given check."""
+    if names is None:
+        names = settings.JSON_BACKENDS
+
+    for name in names:
+        try:
+            backend = BACKENDS[name]()
+            if check(backend):
+                return backend
+        except Exception:
+            # not installed, or too old to support every option
+            continue
+
+    return _StandardBackend()
+
+
+_django_encoder = DjangoJSONEncoder()
+
+
+def _default(value):
+    """Encode a value that isn't a JSON type, like DjangoJSONEncoder."""
+    return _django_encoder.default(value)
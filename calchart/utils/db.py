@@ -1,13 +1,70 @@
 """Utilities for database operations."""
 
+import logging
+import time
+from concurrent.futures import (
+    FIRST_COMPLETED,
+    ProcessPoolExecutor,
+    ThreadPoolExecutor,
+    as_completed,
+    wait,
+)
+
+from django.apps import apps
+from django.conf import settings
+from django.core.exceptions import FieldDoesNotExist
+from django.db import models, transaction
 from django.db.migrations.operations.base import Operation
+from django.db.models import Q
+from django.db.models.signals import pre_migrate
+from django.dispatch import receiver
+
+from utils import codec
+from utils.jsonpatch import apply_patch
+from utils.storage import get_compression, get_hash, read_blob, write_blob
+
+logger = logging.getLogger(__name__)
+
+# the plan of the running `migrate` command; see record_migration_plan
+_migration_plan = []
+
+
+class JSONTextField(models.TextField):
+    """
+    A field containing serialized JSON.
+
+    The value is kept as a JSON string in Python. On PostgreSQL, the column
+    is a JSONB column, so that parts of it can be extracted by the database
+    (e.g. with the #> operator); on other databases, it is a text column.
+    """
+
+    def db_type(self, connection):
+        """Get the database column type."""
+        if connection.vendor == 'postgresql':
+            return 'jsonb'
+        else:
+            return super().db_type(connection)
+
+    def from_db_value(self, value, expression, connection, context):
+        """Convert the value from the database into a JSON string."""
+        if value is None or isinstance(value, str):
+            return value
+        else:
+            # psycopg2 parses JSONB values
+            return codec.dumps(value)
 
 
 class UpdateShowVersion(Operation):
     """
     Update Show viewer files from version X to version X + 1.
 
-    See docs/Versioning.md for more details.
+    If the migration plan contains multiple UpdateShowVersion operations,
+    the first one applies all of them, so each Show is loaded and saved
+    once; the later operations skip every Show, since Show.version is
+    already up to date.
+
+    See migrate_shows for how Shows are updated, and docs/Versioning.md for
+    more details.
     """
 
     def __init__(self, version, update):
@@ -23,17 +80,14 @@ class UpdateShowVersion(Operation):
         self, app_label, schema_editor, from_state, to_state,
     ):
         """Modify the database when applying the migration."""
-        Show = from_state.apps.get_model('base.Show')
-        for show in Show.objects.all():
-            if not show.data_file:
-                continue
-
-            data = show.get_data()
+        if schema_editor.atomic_migration:
+            logger.warning(
+                'Updating Shows in an atomic migration; if interrupted, '
+                'the migration will restart instead of resuming.',
+            )
 
-            if data['version'] < self.version:
-                self.update(data)
-                data['version'] = self.version
-                show.save_data(data)
+        Show = from_state.apps.get_model('calchart', 'Show')
+        migrate_shows(Show, self.get_updates())
 
     def database_backwards(
         self, app_label, schema_editor, from_state, to_state,
@@ -44,3 +98,300 @@ class UpdateShowVersion(Operation):
     def describe(self):
         """Describe the migration."""
         return f'Update to version {self.version}'
+
+    def get_updates(self):
+        """
+        Get the (version, update) tuples to apply with this operation.
+
+        Contains this operation's update, followed by the updates of every
+        UpdateShowVersion operation after it in the migration plan.
+        """
+        updates = get_plan_updates(_migration_plan)
+        for i, (version, update) in enumerate(updates):
+            if version == self.version and update is self.update:
+                return updates[i:]
+
+        return [(self.version, self.update)]
+
+
+@receiver(pre_migrate)
+def record_migration_plan(sender, plan=None, **kwargs):
+    """Record the migration plan, so UpdateShowVersion can look ahead."""
+    global _migration_plan
+
+    if plan is not None:
+        _migration_plan = plan
+
+
+def get_plan_updates(plan):
+    """
+    Get the (version, update) tuples applied by the given migration plan.
+
+    Only includes the UpdateShowVersion operations being applied forwards,
+    in order of version.
+    """
+    updates = []
+    for migration, backwards in plan:
+        if backwards:
+            continue
+
+        for operation in migration.operations:
+            if isinstance(operation, UpdateShowVersion):
+                updates.append((operation.version, operation.update))
+
+    return sorted(updates, key=lambda update: update[0])
+
+
+def migrate_shows(Show, updates, dry_run=False):
+    """
+    Update the data of every Show that is not at the latest version.
+
+    `updates` is a list of (version, update) tuples, as in UpdateShowVersion.
+    Shows are streamed from the database and updated on a pool of
+    SHOW_MIGRATION_WORKERS threads (or processes, if SHOW_MIGRATION_EXECUTOR
+    is 'process'). Each Show is saved as soon as it is updated, and Shows
+    whose Show.version is already up to date are skipped without being
+    downloaded, so an interrupted (non-atomic) migration resumes where it
+    left off.
+
+    Returns a dictionary with the number of Shows updated and skipped, the
+    number of Shows saved again while being updated (`changed`; these are
+    left for the next run), and the number of seconds taken. If `dry_run`
+    is True, nothing is saved, and the dictionary also contains a report of
+    each Show to be updated in `shows`.
+    """
+    version = updates[-1][0]
+    to_database = settings.SHOW_DATA_STORAGE == 'database'
+    fields = ['id', 'data_file', 'data_hash', 'version']
+    if _has_field(Show, 'revision'):
+        fields.append('revision')
+    if to_database:
+        fields.append('data')
+
+    shows = (
+        Show.objects
+        .filter(Q(version__lt=version) | Q(version=None))
+        .exclude(data_file='', data=None)
+        .only(*fields)
+        .order_by('id')
+    )
+
+    if settings.SHOW_MIGRATION_EXECUTOR == 'process':
+        executor_class = ProcessPoolExecutor
+    else:
+        executor_class = ThreadPoolExecutor
+    workers = settings.SHOW_MIGRATION_WORKERS
+
+    stats = {
+        'updated': 0,
+        'skipped': 0,
+        'changed': 0,
+        'seconds': 0,
+    }
+    if dry_run:
+        stats['shows'] = []
+    start = time.perf_counter()
+
+    def save(future):
+        show, last_patch = pending.pop(future)
+        result = future.result()
+
+        if dry_run:
+            if result['updated']:
+                stats['shows'].append(dict(result, id=show.id))
+        elif not _save_migrated_show(Show, show, last_patch, result):
+            stats['changed'] += 1
+            return
+        stats['updated' if result['updated'] else 'skipped'] += 1
+
+    with executor_class(max_workers=workers) as executor:
+        pending = {}
+        for show in shows.iterator():
+            patches = list(
+                show.patches.order_by('id').values_list('id', 'patch'),
+            )
+            future = executor.submit(
+                _migrate_data,
+                updates,
+                name=show.data_file.name,
+                data=show.data if to_database else None,
+                patches=[codec.loads(patch) for _, patch in patches],
+                to_database=to_database,
+                dry_run=dry_run,
+            )
+            pending[future] = (show, patches[-1][0] if patches else None)
+
+            # only download a few Shows ahead of the Shows being saved
+            if len(pending) >= 2 * workers:
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                for future in done:
+                    save(future)
+
+        for future in as_completed(list(pending)):
+            save(future)
+
+    stats['seconds'] = time.perf_counter() - start
+    logger.info(
+        'Updated {updated} Shows to version {version} ({skipped} skipped, '
+        '{changed} changed while updating) '
+        'in {seconds:.2f}s ({rate:.1f} Shows/s)'.format(
+            version=version,
+            rate=stats['updated'] / max(stats['seconds'], 1e-6),
+            **stats,
+        ),
+    )
+
+    return stats
+
+
+def _migrate_data(updates, *, name, data, patches, to_database, dry_run):
+    """
+    Update the data of a single Show, in a worker thread or process.
+
+    `data` is the JSON string from Show.data, or None to read the data file
+    with the given name, applying the given patches. The updated data is
+    saved to a new data file unless `to_database` or `dry_run` is True.
+    """
+    start = time.perf_counter()
+    if data is None:
+        data = read_blob(name)
+    data = codec.loads(data)
+    for patch in patches:
+        data = apply_patch(data, patch)
+
+    result = {
+        'updated': False,
+        'from_version': data['version'],
+        'version': data['version'],
+    }
+    for version, update in updates:
+        if data['version'] < version:
+            update(data)
+            data['version'] = version
+            result['updated'] = True
+
+    if result['updated']:
+        content = codec.dumpb(data)
+        result['version'] = data['version']
+        result['hash'] = get_hash(content)
+        result['size'] = len(content)
+        if not dry_run:
+            result['content'] = content
+        if not dry_run and to_database:
+            result['data'] = content.decode()
+        elif not dry_run:
+            _, result['name'] = write_blob(
+                'shows', content, '.show',
+                compression=get_compression(settings.SHOW_DATA_COMPRESSION),
+                tail=1,
+            )
+
+    result['seconds'] = time.perf_counter() - start
+    return result
+
+
+def _save_migrated_show(Show, show, last_patch, result):
+    """
+    Save the result of _migrate_data for the given Show.
+
+    The Show is only saved if it was not saved again while it was being
+    updated (i.e. it is still at the revision it was loaded at, or has the
+    same data hash if the Show model has no revision yet); otherwise, the
+    update is discarded, and the Show is updated on the next run. Returns
+    whether the Show was saved.
+
+    If the Show model is up to date with the database (see _is_current),
+    the saved Show is then updated like a Show saved with save_data; see
+    Show.update_migrated.
+    """
+    shows = Show.objects.filter(pk=show.pk)
+    if _has_field(Show, 'revision'):
+        shows = shows.filter(revision=show.revision)
+        changes = {'revision': models.F('revision') + 1}
+    else:
+        shows = shows.filter(data_hash=show.data_hash)
+        changes = {}
+
+    if not result['updated']:
+        shows.update(version=result['version'])
+        return True
+
+    if 'data' in result:
+        changes['data'] = result['data']
+    else:
+        changes['data_file'] = result['name']
+
+    storage = Show._meta.get_field('data_file').storage
+    old_name = show.data_file.name
+    with transaction.atomic():
+        updated = shows.update(
+            data_hash=result['hash'],
+            version=result['version'],
+            **changes,
+        )
+        if updated > 0 and last_patch is not None:
+            show.patches.filter(id__lte=last_patch).delete()
+        if updated > 0 and _is_current(Show):
+            content = result['content']
+            previous_key = f'{show.data_hash}-{last_patch or 0}'
+            CurrentShow = apps.get_model('calchart', 'Show')
+            CurrentShow.objects.get(pk=show.pk).update_migrated(
+                codec.loads(content), content, previous_key,
+            )
+
+    if updated == 0:
+        logger.info(f'Show {show.pk} changed while updating; skipped')
+        name = result.get('name')
+        if name and name != old_name and not data_file_in_use(Show, name):
+            storage.delete(name)
+        return False
+
+    if 'name' in result and old_name != result['name']:
+        if not data_file_in_use(Show, old_name):
+            storage.delete(old_name)
+    return True
+
+
+def _is_current(Show):
+    """
+    Check if the given (possibly historical) Show model matches the database.
+
+    The Show model and its ShowRevisions can only be used while migrating
+    if the migrations applied so far have every field of the current model.
+    """
+    CurrentShow = apps.get_model('calchart', 'Show')
+    try:
+        Show._meta.apps.get_model('calchart', 'ShowRevision')
+    except LookupError:
+        return False
+
+    def get_columns(model):
+        return {field.column for field in model._meta.concrete_fields}
+
+    return get_columns(Show) == get_columns(CurrentShow)
+
+
+def _has_field(Show, name):
+    """Check if the given (possibly historical) Show model has a field."""
+    try:
+        Show._meta.get_field(name)
+    except FieldDoesNotExist:
+        return False
+    return True
+
+
+def data_file_in_use(Show, name):
+    """
+    Check if any Show or ShowRevision uses the given data file.
+
+    ShowRevisions are only checked if the model exists in the migration
+    state of the given Show model.
+    """
+    if Show.objects.filter(data_file=name).exists():
+        return True
+
+    try:
+        ShowRevision = Show._meta.apps.get_model('calchart', 'ShowRevision')
+    except LookupError:
+        return False
+    return ShowRevision.objects.filter(data_file=name).exists()
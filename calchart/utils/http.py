@@ -0,0 +1,141 @@
+"""Utilities for streaming HTTP responses."""
+
+import re
+import zlib
+
+from django.http.response import HttpResponse
+
+from utils import codec
+
+try:
+    import brotli
+except ImportError:
+    brotli = None
+
+CHUNK_SIZE = 64 * 1024
+
+RANGE_RE = re.compile(r'^bytes=(\d*)-(\d*)$')
+
+
+class JsonResponse(HttpResponse):
+    """
+    Like Django's JsonResponse, but encoded with utils.codec.
+
+    The data may be a codec.RawJSON, which is sent as is.
+    """
+
+    def __init__(self, data, **kwargs):
+        """Initialize the response with the given JSON value."""
+        kwargs.setdefault('content_type', 'application/json')
+        if not isinstance(data, codec.RawJSON):
+            data = codec.dumpb(data)
+        super().__init__(content=data, **kwargs)
+
+
+class RangeNotSatisfiable(Exception):
+    """An error raised when a Range header does not overlap the content."""
+
+    pass
+
+
+def get_encodings():
+    """Get the content encodings that can be used, in order of preference."""
+    encodings = ['gzip']
+    if brotli is not None:
+        encodings.insert(0, 'br')
+    return encodings
+
+
+def choose_encoding(request, encodings):
+    """
+    Choose the content encoding to use for the given request.
+
+    Returns the first of the given encodings that is supported and accepted
+    by the client's Accept-Encoding header, or None to not encode the
+    content.
+    """
+    accepted = set()
+    for value in request.META.get('HTTP_ACCEPT_ENCODING', '').split(','):
+        coding, *params = [part.strip() for part in value.split(';')]
+        if 'q=0' not in params and coding:
+            accepted.add(coding.lower())
+
+    for encoding in encodings:
+        if encoding in get_encodings() and encoding in accepted:
+            return encoding
+
+    return None
+
+
+def parse_range(header, size):
+    """
+    Parse the given Range header for content of the given size.
+
+    Only a single byte range is supported. Returns a tuple of the first and
+    last byte positions (inclusive), or None if the whole content should be
+    sent. Raises RangeNotSatisfiable if the range is outside the content.
+    """
+    match = RANGE_RE.match(header or '')
+    if match is None:
+        return None
+
+    start, end = match.groups()
+    if start == '' and end == '':
+        return None
+    elif start == '':
+        # suffix range, e.g. the last 500 bytes
+        start = max(size - int(end), 0)
+        end = size - 1
+    else:
+        start = int(start)
+        end = size - 1 if end == '' else min(int(end), size - 1)
+
+    if start >= size or start > end:
+        raise RangeNotSatisfiable
+
+    return start, end
+
+
+def iter_file(f, start=0, end=None):
+    """
+    Iterate over chunks of the given binary file.
+
+    Yields the bytes from `start` to `end` (inclusive), defaulting to the end
+    of the file, then closes the file.
+    """
+    try:
+        f.seek(start)
+        remaining = None if end is None else end - start + 1
+        while remaining is None or remaining > 0:
+            if remaining is None:
+                chunk = f.read(CHUNK_SIZE)
+            else:
+                chunk = f.read(min(remaining, CHUNK_SIZE))
+            if not chunk:
+                break
+            if remaining is not None:
+                remaining -= len(chunk)
+            yield chunk
+    finally:
+        f.close()
+
+
+def iter_encoded(chunks, encoding):
+    """Encode the given chunks of bytes with the given content encoding."""
+    if encoding == 'br':
+        compressor = brotli.Compressor()
+        compress = compressor.process
+        flush = compressor.finish
+    elif encoding == 'gzip':
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        compress = compressor.compress
+        flush = compressor.flush
+    else:
+        raise ValueError(f'Invalid encoding: {encoding}')
+
+    for chunk in chunks:
+        data = compress(chunk)
+        if data:
+            yield data
+
+    yield flush()
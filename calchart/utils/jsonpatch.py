@@ -0,0 +1,240 @@
+"""
+Utilities for applying JSON Patches (RFC 6902) to JSON objects.
+
+A patch is a list of operations, e.g.
+
+[
+    {'op': 'replace', 'path': '/formations/0/name', 'value': 'Star'},
+    {'op': 'remove', 'path': '/songs/1'},
+]
+"""
+
+import copy
+
+
+class JsonPatchError(ValueError):
+    """An error raised when a patch cannot be applied."""
+
+    pass
+
+
+def apply_patch(doc, patch):
+    """
+    Apply the given patch to the given JSON object.
+
+    Returns the patched object; `doc` itself is not modified. Raises a
+    JsonPatchError if any operation fails, in which case none of the
+    operations are applied.
+    """
+    doc = copy.deepcopy(doc)
+    for operation in patch:
+        doc = _apply_operation(doc, operation)
+    return doc
+
+
+def make_patch(source, target):
+    """
+    Make a patch that changes the `source` JSON object into `target`.
+
+    Objects are compared key by key, and lists item by item after skipping
+    the items that are equal at the start and end of both lists, so only
+    the values that changed are in the patch.
+    """
+    patch = []
+    _diff(source, target, '', patch)
+    return patch
+
+
+def parse_pointer(pointer):
+    """Split the given JSON Pointer (RFC 6901) into its reference tokens."""
+    if pointer == '':
+        return []
+    if not pointer.startswith('/'):
+        raise JsonPatchError(f'Invalid pointer: {pointer}')
+
+    return [
+        token.replace('~1', '/').replace('~0', '~')
+        for token in pointer[1:].split('/')
+    ]
+
+
+def resolve_pointer(doc, pointer):
+    """Get the value in the given JSON object at the given pointer."""
+    for token in parse_pointer(pointer):
+        doc = _get_child(doc, token)
+    return doc
+
+
+def _diff(source, target, path, patch):
+    """Add the operations changing `source` into `target` to the patch."""
+    if _equal(source, target):
+        return
+
+    if isinstance(source, dict) and isinstance(target, dict):
+        for key in source:
+            if key not in target:
+                patch.append({'op': 'remove', 'path': _join(path, key)})
+        for key, value in target.items():
+            if key in source:
+                _diff(source[key], value, _join(path, key), patch)
+            else:
+                patch.append({
+                    'op': 'add',
+                    'path': _join(path, key),
+                    'value': value,
+                })
+    elif isinstance(source, list) and isinstance(target, list):
+        length = min(len(source), len(target))
+        start = 0
+        while start < length and _equal(source[start], target[start]):
+            start += 1
+        end = 0
+        while (
+            end < length - start and
+            _equal(source[-1 - end], target[-1 - end])
+        ):
+            end += 1
+
+        # change the items in both lists, then remove or add the rest
+        old = source[start:len(source) - end]
+        new = target[start:len(target) - end]
+        for i in range(min(len(old), len(new))):
+            _diff(old[i], new[i], _join(path, start + i), patch)
+        for i in reversed(range(len(new), len(old))):
+            patch.append({'op': 'remove', 'path': _join(path, start + i)})
+        for i in range(len(old), len(new)):
+            patch.append({
+                'op': 'add',
+                'path': _join(path, start + i),
+                'value': new[i],
+            })
+    else:
+        patch.append({'op': 'replace', 'path': path, 'value': target})
+
+
+def _equal(a, b):
+    """Check if the given JSON values are equal, e.g. 1 is not 1.0 or True."""
+    if a != b or type(a) is not type(b):
+        return False
+    elif isinstance(a, dict):
+        return all(_equal(value, b[key]) for key, value in a.items())
+    elif isinstance(a, list):
+        return all(_equal(x, y) for x, y in zip(a, b))
+    else:
+        return True
+
+
+def _join(path, token):
+    """Get the JSON Pointer to the given child of the given pointer."""
+    token = str(token).replace('~', '~0').replace('/', '~1')
+    return f'{path}/{token}'
+
+
+def _get_child(parent, token):
+    """Get the child of the given object or list."""
+    try:
+        if isinstance(parent, list):
+            return parent[_get_index(parent, token)]
+        elif isinstance(parent, dict):
+            return parent[token]
+    except KeyError:
+        pass
+
+    raise JsonPatchError(f'Path does not exist: {token}')
+
+
+def _get_index(parent, token, allow_end=False):
+    """Convert the given token into an index of the given list."""
+    if allow_end and token == '-':
+        return len(parent)
+
+    if not token.isdigit() or (token != '0' and token.startswith('0')):
+        raise JsonPatchError(f'Invalid index: {token}')
+
+    index = int(token)
+    if index > len(parent) or (index == len(parent) and not allow_end):
+        raise JsonPatchError(f'Index out of range: {token}')
+
+    return index
+
+
+def _split_path(path):
+    """Split the given path into the pointer to its parent and its key."""
+    tokens = parse_pointer(path)
+    if len(tokens) == 0:
+        return None, None
+    return tokens[:-1], tokens[-1]
+
+
+def _add(doc, path, value):
+    """Add the given value at the given path."""
+    parent_tokens, key = _split_path(path)
+    if parent_tokens is None:
+        return value
+
+    parent = doc
+    for token in parent_tokens:
+        parent = _get_child(parent, token)
+
+    if isinstance(parent, list):
+        parent.insert(_get_index(parent, key, allow_end=True), value)
+    elif isinstance(parent, dict):
+        parent[key] = value
+    else:
+        raise JsonPatchError(f'Cannot add to {path}')
+
+    return doc
+
+
+def _remove(doc, path):
+    """Remove the value at the given path, returning the removed value."""
+    parent_tokens, key = _split_path(path)
+    if parent_tokens is None:
+        raise JsonPatchError('Cannot remove the root of the document')
+
+    parent = doc
+    for token in parent_tokens:
+        parent = _get_child(parent, token)
+
+    value = _get_child(parent, key)
+    if isinstance(parent, list):
+        del parent[_get_index(parent, key)]
+    else:
+        del parent[key]
+
+    return doc, value
+
+
+def _apply_operation(doc, operation):
+    """Apply a single patch operation to the given JSON object."""
+    try:
+        op = operation['op']
+        return _do_operation(doc, op, operation['path'], operation)
+    except (KeyError, TypeError):
+        raise JsonPatchError(f'Invalid operation: {operation}')
+
+
+def _do_operation(doc, op, path, operation):
+    """Apply the operation with the given name to the given JSON object."""
+    if op == 'add':
+        return _add(doc, path, operation['value'])
+    elif op == 'remove':
+        return _remove(doc, path)[0]
+    elif op == 'replace':
+        doc, _ = _remove(doc, path) if path != '' else (doc, None)
+        return _add(doc, path, operation['value'])
+    elif op == 'move':
+        from_path = operation['from']
+        if path.startswith(from_path + '/'):
+            raise JsonPatchError(f'Cannot move {from_path} into itself')
+        doc, value = _remove(doc, from_path)
+        return _add(doc, path, value)
+    elif op == 'copy':
+        value = resolve_pointer(doc, operation['from'])
+        return _add(doc, path, copy.deepcopy(value))
+    elif op == 'test':
+        if resolve_pointer(doc, path) != operation['value']:
+            raise JsonPatchError(f'Test failed: {path}')
+        return doc
+    else:
+        raise JsonPatchError(f'Invalid operation: {op}')
@@ -0,0 +1,118 @@
+"""
+Utilities for recording in-process metrics.
+
+Metrics are kept per process (e.g. per gunicorn worker) and are reset when
+the process restarts. Counters incremented in a thread can also be collected
+separately with `collect`, e.g. to attribute them to a single request.
+"""
+
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+# upper bounds of the histogram buckets, in seconds
+DEFAULT_BUCKETS = (
+    0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, float('inf'),
+)
+
+_lock = threading.Lock()
+_counters = Counter()
+_histograms = {}
+# the counters being collected by `collect` in each thread
+_local = threading.local()
+
+
+def increment(name, value=1):
+    """Increment the counter with the given name."""
+    with _lock:
+        _counters[name] += value
+
+    for counters in getattr(_local, 'collecting', []):
+        counters[name] += value
+
+
+@contextmanager
+def collect():
+    """
+    Collect the counters incremented by this thread in the block.
+
+    Usage:
+    with metrics.collect() as counters:
+        read_blob(name)
+    print(counters['storage.bytes_read'])
+    """
+    counters = Counter()
+    collecting = getattr(_local, 'collecting', None)
+    if collecting is None:
+        collecting = _local.collecting = []
+
+    collecting.append(counters)
+    try:
+        yield counters
+    finally:
+        collecting.remove(counters)
+
+
+def get_counters(prefix=''):
+    """Get a snapshot of all the counters starting with the given prefix."""
+    with _lock:
+        return {
+            name: value
+            for name, value in _counters.items()
+            if name.startswith(prefix)
+        }
+
+
+def observe(name, value, buckets=DEFAULT_BUCKETS):
+    """Record the given value in the histogram with the given name."""
+    with _lock:
+        histogram = _histograms.get(name)
+        if histogram is None:
+            histogram = {
+                'buckets': list(buckets),
+                'counts': [0] * len(buckets),
+                'count': 0,
+                'sum': 0,
+            }
+            _histograms[name] = histogram
+
+        for i, bound in enumerate(histogram['buckets']):
+            if value <= bound:
+                histogram['counts'][i] += 1
+                break
+
+        histogram['count'] += 1
+        histogram['sum'] += value
+
+
+@contextmanager
+def timer(name):
+    """Record the number of seconds spent in the block in a histogram."""
+    start = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe(name, time.perf_counter() - start)
+
+
+def get_histograms(prefix=''):
+    """Get a snapshot of all the histograms starting with the given prefix."""
+    with _lock:
+        return {
+            name: {
+                'buckets': list(histogram['buckets']),
+                'counts': list(histogram['counts']),
+                'count': histogram['count'],
+                'sum': histogram['sum'],
+            }
+            for name, histogram in _histograms.items()
+            if name.startswith(prefix)
+        }
+
+
+def reset():
+    """Reset all metrics."""
+    with _lock:
+        _counters.clear()
+        _histograms.clear()
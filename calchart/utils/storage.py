@@ -0,0 +1,243 @@
+"""
+Utilities for storing content-addressed files.
+
+Files are named by the SHA-256 hash of their contents, so saving the same
+contents twice writes only one file, and files with the same contents are
+shared between every object that references them.
+
+Files may be compressed with gzip or zstd. The hash is always the hash of
+the uncompressed contents, and the compression is detected when a file is
+read, so files in every format can be read no matter how new files are
+compressed.
+"""
+
+import hashlib
+import io
+import zlib
+
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+
+from utils import metrics
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+# the extension added to the name of a file with each compression
+COMPRESSION_EXTS = {
+    None: '',
+    'gzip': '.gz',
+    'zstd': '.zst',
+}
+
+# the bytes at the start of a file with each compression
+GZIP_MAGIC = b'\x1f\x8b'
+ZSTD_MAGIC = b'\x28\xb5\x2f\xfd'
+
+
+def get_hash(content):
+    """Get the content hash of the given bytes."""
+    return hashlib.sha256(content).hexdigest()
+
+
+def get_blob_name(directory, content_hash, ext):
+    """Get the name of the file with the given content hash."""
+    return f'{directory}/{content_hash}{ext}'
+
+
+def get_compression(compression):
+    """
+    Get the compression to save files with, given the preferred compression.
+
+    `compression` is None, 'gzip' or 'zstd'; 'zstd' falls back to 'gzip' if
+    the zstandard package is not installed.
+    """
+    if compression not in COMPRESSION_EXTS:
+        raise ValueError(f'Invalid compression: {compression}')
+    if compression == 'zstd' and zstandard is None:
+        return 'gzip'
+    return compression
+
+
+def get_blob_compression(name):
+    """Get the compression of the file with the given name, by extension."""
+    for compression, ext in COMPRESSION_EXTS.items():
+        if compression is not None and name.endswith(ext):
+            return compression
+    return None
+
+
+def is_compressed(content):
+    """Check if the given bytes (or the start of them) are compressed."""
+    return content.startswith((GZIP_MAGIC, ZSTD_MAGIC))
+
+
+def compress(content, compression, tail=0):
+    """
+    Compress the given bytes with the given compression.
+
+    With gzip, the last `tail` bytes are compressed as a separate gzip
+    member, so that they can be replaced without decompressing the rest of
+    the file; see open_gzip_head.
+    """
+    if compression is None:
+        return content
+    elif compression == 'gzip':
+        if tail > 0:
+            return (
+                compress(content[:-tail], compression) +
+                compress(content[-tail:], compression)
+            )
+        # without a timestamp, so the same contents are always the same bytes
+        compressor = zlib.compressobj(6, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+        return compressor.compress(content) + compressor.flush()
+    elif compression == 'zstd':
+        return zstandard.ZstdCompressor().compress(content)
+    else:
+        raise ValueError(f'Invalid compression: {compression}')
+
+
+def decompress(content):
+    """Decompress the given bytes, which may not be compressed."""
+    if content.startswith(GZIP_MAGIC):
+        # the file may have several gzip members; see compress
+        chunks = []
+        while content:
+            decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+            chunks.append(decompressor.decompress(content))
+            content = decompressor.unused_data
+        return b''.join(chunks)
+    elif content.startswith(ZSTD_MAGIC):
+        if zstandard is None:
+            raise ValueError('The zstandard package is not installed')
+        return zstandard.ZstdDecompressor().decompress(
+            content, max_output_size=2 ** 31 - 1,
+        )
+    else:
+        return content
+
+
+def write_blob(
+    directory, content, ext='', storage=default_storage, compression=None,
+    tail=0,
+):
+    """
+    Save the given bytes in the given directory, if not already saved.
+
+    The file is compressed with the given compression (see get_compression
+    and compress), and the extension of the compression is added to its
+    name. Returns a tuple of the hash of the uncompressed content and the
+    name of the file. The number of bytes written is recorded in the
+    `storage.bytes_written` counter.
+
+    If the same content is saved at the same time, the storage may save the
+    second copy under another name; it is deleted, so only the name of the
+    content is ever returned.
+    """
+    content_hash = get_hash(content)
+    ext += COMPRESSION_EXTS[compression]
+    name = get_blob_name(directory, content_hash, ext)
+    if not storage.exists(name):
+        content = compress(content, compression, tail)
+        saved = storage.save(name, ContentFile(content))
+        metrics.increment('storage.bytes_written', len(content))
+        if saved != name:
+            storage.delete(saved)
+
+    return content_hash, name
+
+
+def read_blob(name, storage=default_storage):
+    """
+    Read the bytes of the file with the given name, decompressing them.
+
+    The number of bytes read from storage (i.e. before decompressing) is
+    recorded in the `storage.bytes_read` counter.
+    """
+    with storage.open(name) as f:
+        content = f.read()
+
+    metrics.increment('storage.bytes_read', len(content))
+    return decompress(content)
+
+
+def open_gzip_head(name, tail, storage=default_storage):
+    """
+    Open a gzip file without the gzip member with the given bytes at its end.
+
+    Returns a binary file with the compressed bytes of the rest of the file,
+    which was saved with write_blob and `tail=len(tail)`, or None if the file
+    does not end with that member (e.g. it was saved without `tail`).
+    """
+    member = compress(tail, 'gzip')
+    f = storage.open(name)
+    size = storage.size(name)
+    head = f.read(len(GZIP_MAGIC))
+    if size > len(member) and head == GZIP_MAGIC:
+        f.seek(size - len(member))
+        if f.read() == member:
+            f.seek(0)
+            return ChainedFile([(f, size - len(member))])
+
+    f.close()
+    return None
+
+
+class ChainedFile(io.RawIOBase):
+    """
+    A read-only, seekable binary file made of parts of other files.
+
+    Each part is a tuple of a seekable binary file and the number of bytes to
+    read from the start of that file. The total size is in `self.size`.
+    """
+
+    def __init__(self, parts):
+        """Initialize the file from the given parts."""
+        self._parts = parts
+        self._position = 0
+        self.size = sum(length for _, length in parts)
+
+    def readable(self):
+        """Return True, since the file can be read."""
+        return True
+
+    def seekable(self):
+        """Return True, since the file supports random access."""
+        return True
+
+    def tell(self):
+        """Get the current position in the file."""
+        return self._position
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """Move to the given position in the file."""
+        if whence == io.SEEK_CUR:
+            offset += self._position
+        elif whence == io.SEEK_END:
+            offset += self.size
+
+        self._position = max(offset, 0)
+        return self._position
+
+    def readinto(self, buffer):
+        """Read bytes from the current part into the given buffer."""
+        offset = self._position
+        for f, length in self._parts:
+            if offset < length:
+                f.seek(offset)
+                data = f.read(min(len(buffer), length - offset))
+                buffer[:len(data)] = data
+                self._position += len(data)
+                return len(data)
+
+            offset -= length
+
+        return 0
+
+    def close(self):
+        """Close every part of the file."""
+        for f, _ in self._parts:
+            f.close()
+        super().close()
@@ -1,12 +1,26 @@
 """Utilities for testing."""
 
-import json
+import random
+import socketserver
+import threading
+import time
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, HTTPServer
 from unittest import mock
+from urllib.parse import parse_qs, urlparse
 
 from calchart.models import User
 from calchart.views import CalchartView
 
-from django.test import RequestFactory as DjangoRequestFactory, TestCase
+from django.test import (
+    RequestFactory as DjangoRequestFactory,
+    TestCase,
+    override_settings,
+)
+
+import requests
+
+from utils import codec
 
 
 def get_user():
@@ -55,20 +69,36 @@ class ActionsTestCase(TestCase):
         """Run the given action and return the data sent back."""
         request = RequestFactory.POST({
             'action': action,
-            'data': json.dumps(data),
+            'data': codec.dumps(data),
         }, **kwargs)
         response = CalchartView.as_view()(request)
         if raw:
             return response
         else:
             self.assertEqual(response.status_code, 200)
-            return json.loads(response.content)
+            return codec.loads(response.content)
+
+    def do_batch(self, batch, *, raw=False):
+        """Run the given list of actions and data in one request."""
+        request = RequestFactory.POST({
+            'batch': codec.dumps([
+                {'action': action, 'data': data} for action, data in batch
+            ]),
+        })
+        response = CalchartView.as_view()(request)
+        if raw:
+            return response
+        else:
+            self.assertEqual(response.status_code, 200)
+            return codec.loads(response.content)['results']
 
 
 def mock_endpoint(endpoint, data):
     """
     Mock any calls to utils.api.call_endpoint, returning the given data.
 
+    Any other endpoint responds with a 404 error.
+
     Usage:
     with mock_endpoint('check_committee', { 'has_committee': True }):
         response = call_endpoint('check_comittee', user)
@@ -77,11 +107,247 @@ def mock_endpoint(endpoint, data):
     def mock_call(url, *args, **kwargs):
         response = mock.MagicMock()
         if url.split('/')[-2] == endpoint:
+            response.status_code = 200
             response.json.return_value = data
         else:
+            response.status_code = 404
             response.json.return_value = None
+            response.raise_for_status.side_effect = requests.HTTPError(
+                response=response,
+            )
         return response
 
-    mocked_requests = mock.MagicMock()
-    mocked_requests.get = mocked_requests.post = mock_call
-    return mock.patch('utils.api.requests', new=mocked_requests)
+    mocked_session = mock.MagicMock()
+    mocked_session.get = mocked_session.post = mock_call
+    return mock.patch('utils.api.get_session', return_value=mocked_session)
+
+
+class MembersOnlyServer(object):
+    """
+    A local stand-in for the Members Only API.
+
+    Serves the check-committee and (if `batch` is True) get-committees
+    endpoints for the given mapping of API tokens to committees, waiting
+    `latency` seconds before each response. Every request is counted in
+    `self.calls`, by endpoint.
+
+    Usage:
+    with MembersOnlyServer({'abc': ['STUNT']}, latency=0.05) as server:
+        user.has_committee('STUNT')
+        self.assertEqual(server.calls['get-committees'], 1)
+    """
+
+    def __init__(self, committees, *, latency=0, batch=True):
+        """Initialize the server without starting it."""
+        self.committees = committees
+        self.latency = latency
+        self.batch = batch
+        self.calls = Counter()
+
+        self._server = None
+        self._thread = None
+        self._settings = None
+
+    @property
+    def url(self):
+        """Get the URL to use as MEMBERS_ONLY_DOMAIN."""
+        host, port = self._server.server_address
+        return f'http://{host}:{port}'
+
+    def __enter__(self):
+        """Start the server and point MEMBERS_ONLY_DOMAIN at it."""
+        self._server = _ThreadingHTTPServer(
+            ('127.0.0.1', 0), self._make_handler(),
+        )
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+        self._thread.start()
+
+        self._settings = override_settings(MEMBERS_ONLY_DOMAIN=self.url)
+        self._settings.enable()
+        return self
+
+    def __exit__(self, *exc_info):
+        """Stop the server and restore MEMBERS_ONLY_DOMAIN."""
+        self._settings.disable()
+        self._server.shutdown()
+        self._server.server_close()
+        self._thread.join()
+
+    def get_response(self, endpoint, params):
+        """Get the status code and JSON data for the given request."""
+        token = params.get('token', [''])[0]
+        if token not in self.committees:
+            return 403, {'message': 'Invalid token'}
+
+        committees = self.committees[token]
+        if endpoint == 'check-committee':
+            committee = params.get('committee', [''])[0]
+            return 200, {'has_committee': committee in committees}
+        elif endpoint == 'get-committees' and self.batch:
+            return 200, {'committees': list(committees)}
+        else:
+            return 404, {'message': f'Invalid endpoint: {endpoint}'}
+
+    def _make_handler(self):
+        """Create a request handler class bound to this server."""
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            # allow the client to keep connections alive
+            protocol_version = 'HTTP/1.1'
+
+            def do_GET(self):
+                url = urlparse(self.path)
+                endpoint = url.path.strip('/').split('/')[-1]
+                server.calls[endpoint] += 1
+                time.sleep(server.latency)
+
+                status, data = server.get_response(
+                    endpoint, parse_qs(url.query),
+                )
+                content = codec.dumpb(data)
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(content)))
+                self.end_headers()
+                self.wfile.write(content)
+
+            do_POST = do_GET
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+
+class _ThreadingHTTPServer(socketserver.ThreadingMixIn, HTTPServer):
+    """An HTTPServer that handles each request in a new thread."""
+
+    daemon_threads = True
+
+
+def make_show_data(num_dots=8, num_formations=3, seed=0):
+    """
+    Make a serialized Show for testing, as the Javascript would serialize it.
+
+    Each Formation places the dots in a block, moved 2 steps east of the
+    previous Formation, and has a Flow that mark times for 8 beats then
+    moves the dots to the next Formation.
+    """
+    rand = random.Random(seed)
+
+    def unique_id():
+        return f'{rand.getrandbits(32):08x}'
+
+    def coordinate(x, y):
+        return {'x': x, 'y': y, '__type__': 'StepCoordinate'}
+
+    def formation_dot(dot, x, y):
+        return {
+            'id': unique_id(),
+            'position': coordinate(x, y),
+            'dotGroup': None,
+            'dot': dot['id'],
+            '__type__': 'FormationDot',
+        }
+
+    def movement(start, end, duration, is_mark_time):
+        return {
+            'id': unique_id(),
+            'startX': start[0],
+            'startY': start[1],
+            'endX': end[0],
+            'endY': end[1],
+            'duration': duration,
+            'orientation': 0,
+            'beatsPerStep': 1,
+            'isMarkTime': is_mark_time,
+            '__type__': 'StopMovement',
+        }
+
+    dots = [
+        {'id': unique_id(), 'label': f'A{i}', '__type__': 'Dot'}
+        for i in range(num_dots)
+    ]
+
+    def position(formation, dot):
+        row, column = divmod(dot, 4)
+        return (2 * formation + 4 + 2 * column, 8 + 2 * row)
+
+    positions = [
+        [position(i, j) for j in range(num_dots)]
+        for i in range(num_formations)
+    ]
+    formations = [
+        {
+            'id': unique_id(),
+            'name': f'Formation {i + 1}',
+            'dots': [
+                formation_dot(dot, x, y)
+                for dot, (x, y) in zip(dots, positions[i])
+            ],
+            'flows': [],
+            'nextDots': {},
+            'fieldType': None,
+            'beatsPerStep': None,
+            'stepType': None,
+            'orientation': None,
+            '__type__': 'Formation',
+        }
+        for i in range(num_formations)
+    ]
+
+    for i, formation in enumerate(formations[:-1]):
+        next_positions = positions[i + 1]
+        flow_dots = {}
+        for dot, next_position in zip(formation['dots'], next_positions):
+            position = (dot['position']['x'], dot['position']['y'])
+            flow_dots[dot['id']] = {
+                'nextPoint': coordinate(*next_position),
+                'dotType': {'value': 'plain', '__type__': 'DotType'},
+                'movements': [
+                    movement(position, position, 8, True),
+                    movement(position, next_position, 2, False),
+                ],
+            }
+        formation['flows'].append({
+            'id': unique_id(),
+            'dots': flow_dots,
+            'dotTypeInfo': {
+                'plain': {
+                    'continuities': [{
+                        'id': unique_id(),
+                        'fieldType': None,
+                        'beatsPerStep': None,
+                        'stepType': None,
+                        'orientation': None,
+                        'isMarkTime': True,
+                        'duration': 8,
+                        '__type__': 'StopContinuity',
+                    }],
+                    'hasNextPoint': True,
+                },
+            },
+            '__type__': 'Flow',
+        })
+
+    return {
+        'version': 1,
+        'name': 'Test Show',
+        'slug': 'test-show',
+        'isBand': False,
+        'numDots': num_dots,
+        'dotGroups': {},
+        'labelFormat': {'value': 'combo', '__type__': 'DotLabelFormat'},
+        'beats': [500] * 10 * num_formations,
+        'audioUrl': None,
+        'dots': dots,
+        'formations': formations,
+        'songs': [],
+        'fieldType': {'value': 'college', '__type__': 'FieldType'},
+        'beatsPerStep': [1, 1],
+        'stepType': {'value': 'high_step', '__type__': 'StepType'},
+        'orientation': {'value': 'east', '__type__': 'Orientation'},
+        '__type__': 'Show',
+    }
@@ -73,7 +73,8 @@ export default function initRouter(Vue) {
             sendAction('get_show', { slug }, {
                 success: data => {
                     let store = getStore();
-                    store.commit('setShow', Show.deserialize(data));
+                    store.commit('setRevision', data.revision);
+                    store.commit('setShow', Show.deserialize(data.show));
                     next();
                 },
                 error: xhr => {
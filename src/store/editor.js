@@ -163,15 +163,24 @@ export default {
 
             options = options || {};
             let oldSuccess = defaultTo(options.success, () => {});
-            options.success = () => {
+            options.success = ({ revision }) => {
+                context.commit('setRevision', revision, { root: true });
                 oldSuccess();
                 context.dispatch('messages/showMessage', 'Saved!', {
                     root: true,
                 });
             };
 
+            // sent as a file, so the server doesn't decode it as form data
             let data = context.rootState.show.serialize();
-            sendAction('save_show', data, options);
+            let show = new File([JSON.stringify(data)], 'show.json', {
+                type: 'application/json',
+            });
+            // rejected if the show was saved somewhere else since then
+            let revision = context.rootState.revision;
+            sendAction(
+                'save_show', { slug: data.slug, show, revision }, options
+            );
         },
         /**
          * Undo an action.
@@ -22,6 +22,9 @@ export default function initStore(Vue) {
         state: {
             // the Show loaded in the current page (or null if none loaded)
             show: null,
+            // the revision of the Show saved on the server, to check that
+            // the Show was not saved somewhere else when saving it
+            revision: null,
         },
         mutations: {
             /**
@@ -32,6 +35,14 @@ export default function initStore(Vue) {
             setShow(state, show) {
                 state.show = show;
             },
+            /**
+             * Set the revision of the show saved on the server.
+             *
+             * @param {?number} revision
+             */
+            setRevision(state, revision) {
+                state.revision = revision;
+            },
         },
         modules: {
             editor,
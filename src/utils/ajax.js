@@ -62,3 +62,38 @@ export default function sendAction(action, data, options) {
         error: handleError,
     }));
 }
+
+/**
+ * Send several POST actions to the server in a single request.
+ *
+ * Actions that only read data may be run at the same time on the server,
+ * but the results are always in the same order as the actions.
+ *
+ * @param {Array.<{action: string, data: Object}>} actions - Files are not
+ *   supported in a batch.
+ * @param {Object} [options] - AJAX options to override defaults. `success`
+ *   is called with a list of {status, response} for each action.
+ */
+export function sendActions(actions, options) {
+    let formData = new FormData();
+    formData.append('csrfmiddlewaretoken', getStore().state.env.csrfToken);
+    formData.append('batch', JSON.stringify(actions));
+
+    let success = options && options.success;
+    $.ajax(defaults({
+        success: data => {
+            if (success) {
+                success(data.results);
+            }
+        },
+    }, options, {
+        url: '',
+        method: 'POST',
+        data: formData,
+        dataType: 'json',
+        cache: false,
+        contentType: false,
+        processData: false,
+        error: handleError,
+    }));
+}